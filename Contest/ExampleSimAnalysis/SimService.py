@@ -0,0 +1,414 @@
+"""
+Service for continuous predicting similarity of pairs of source code files.
+- The DNN is loaded once from a given TensorFlow check point
+  and kept loaded while the service is running
+- The service is local HTTP server built with Python standard library
+- Requests are POST requests /similarity with json body:
+  {"pairs": [[<path to 1-st file>, <path to 2-nd file>], ...]}
+  Paths are relative to the directory with source code files
+  The response is json body:
+  {"confidence": [<probability of similarity>, ...],
+   "prediction": ["Similar" or "Dissimilar", ...]}
+- GET request /stats returns json with counters of the service:
+  numbers of requests and pairs, throughput, percentiles of latency
+  and cache hit ratios
+- Files are tokenized as in TestSetEval.py. Tokenizations are cached
+  with keys being hashes of contents of files, so changed files
+  are tokenized again
+- Pairs of concurrent requests are collected into micro-batches:
+  a batch is predicted when it has the given number of pairs
+  or when its first request waits for the given latency budget
+- With option --embeddings siamese DNN is split into its tower and head
+  using SiamesePairsEvaluator of token-based similarity experiments.
+  Tower embeddings of files are cached with keys being hashes of
+  contents of files, and only the head is applied to pairs
+
+Program arguments are described at the end of the file
+"""
+import sys
+import os
+import argparse
+import json
+import hashlib
+import threading
+import queue
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import tensorflow as tf
+
+from TestSetEval import tokenizeFile, predict
+from TokenCache import TokenCache
+
+repo_dir = os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__))))
+experiments_dir = \
+    f"{repo_dir}/model-experiments/token-based-similarity-classification/src"
+
+class ScoringRequest():
+    """
+    Request of scoring pairs waiting for its micro-batch
+    """
+    def __init__(self, samples, start):
+        """
+        Initialize request
+        Parameters:
+        - samples  -- list of pairs of <hash, token sequence> of files
+        - start    -- time of receiving request
+        """
+        self.samples = samples
+        self.start = start
+        self.done = threading.Event()
+        self.prob = None
+        self.error = None
+
+class SimilarityScorer():
+    """
+    Scorer of similarity of pairs of source code files
+    with cached tokenizations and embeddings, and micro-batching
+    of concurrent requests
+    """
+    def __init__(self, args):
+        """
+        Initialize scorer
+        Parameters:
+        - args  -- Parsed command line arguments
+        """
+        self.source = os.path.realpath(args.source_code)
+        self.tokenizer = args.tokenizer
+        self.batch = args.batch
+        self.max_wait = args.max_wait / 1000
+        self.dnn = tf.keras.models.load_model(args.dnn)
+        self.evaluator = None
+        if args.embeddings:
+            sys.path.extend([f"{experiments_dir}/PostProcessor",
+                             f"{experiments_dir}/Dataset"])
+            from SiamesePairsEval import SiamesePairsEvaluator
+            self.evaluator = SiamesePairsEvaluator(self.dnn)
+        self.tokens = TokenCache(args.cache)
+        self.emb = TokenCache(args.cache)
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.latencies = deque(maxlen = args.window)
+        self.counters = {"requests": 0, "pairs": 0, "batches": 0,
+                         "errors": 0,
+                         "token_hits": 0, "token_misses": 0,
+                         "emb_hits": 0, "emb_misses": 0}
+        self.started = time.time()
+        threading.Thread(target = self.batchLoop, daemon = True).start()
+
+    def count(self, **increments):
+        """
+        Increment counters
+        """
+        with self.lock:
+            for _name, _inc in increments.items():
+                self.counters[_name] += _inc
+
+    def fileTokens(self, filename):
+        """
+        Get token sequence of file, tokenizing it if it is not cached
+        Parameters:
+        - filename  -- path to file relative to source directory
+                       Paths outside source directory are rejected
+        Returns:
+        - hash of file contents
+        - token sequence as numpy array
+        """
+        _path = os.path.realpath(os.path.join(self.source, filename))
+        if os.path.commonpath([self.source, _path]) != self.source:
+            raise ValueError(f"File {filename} is outside " +
+                             "source code directory")
+        try:
+            with open(_path, "rb") as _f:
+                _key = hashlib.sha1(_f.read()).hexdigest()
+        except OSError:
+            raise ValueError(f"File {filename} is not found")
+        with self.lock:
+            _tokens = self.tokens.get(_key) \
+                if _key in self.tokens.tokens else None
+        if _tokens is not None:
+            self.count(token_hits = 1)
+            return _key, _tokens
+        try:
+            _tokens = tokenizeFile(_path, self.tokenizer)
+        except SystemExit as _err:
+            raise ValueError(str(_err))
+        with self.lock:
+            self.tokens.add({_key: _tokens})
+        self.count(token_misses = 1)
+        return _key, _tokens
+
+    def pairTokens(self, pairs):
+        """
+        Get token sequences of pairs of files of a request
+        Parameters:
+        - pairs  -- list of pairs of paths to files
+        Returns:
+        - list of pairs of <hash, token sequence> of files
+        Raises ValueError on wrong request
+        """
+        if not all(len(_p) == 2 for _p in pairs):
+            raise ValueError("Each pair should have two files")
+        return [(self.fileTokens(_fn1), self.fileTokens(_fn2))
+                for _fn1, _fn2 in pairs]
+
+    def score(self, samples, start):
+        """
+        Score pairs of files of a request
+        The call blocks until the micro-batch of the request is predicted
+        Parameters:
+        - samples  -- list of pairs of <hash, token sequence> of files
+                      made by pairTokens
+        - start    -- time of receiving request
+        Returns:
+        - numpy array of probabilities of similarity
+        """
+        _request = ScoringRequest(samples, start)
+        self.requests.put(_request)
+        _request.done.wait()
+        if _request.error is not None:
+            raise _request.error
+        with self.lock:
+            self.latencies.append(time.perf_counter() - _request.start)
+        self.count(requests = 1, pairs = len(samples))
+        return _request.prob
+
+    def nextBatch(self):
+        """
+        Collect requests of the next micro-batch
+        Returns:
+        - list of requests
+        """
+        _batch = [self.requests.get()]
+        _n_pairs = len(_batch[0].samples)
+        _deadline = _batch[0].start + self.max_wait
+        while _n_pairs < self.batch:
+            _timeout = _deadline - time.perf_counter()
+            if _timeout <= 0:
+                break
+            try:
+                _batch.append(self.requests.get(timeout = _timeout))
+            except queue.Empty:
+                break
+            _n_pairs += len(_batch[-1].samples)
+        return _batch
+
+    def batchLoop(self):
+        """
+        Predict micro-batches of requests
+        The loop runs in a single thread owning the DNN
+        """
+        while True:
+            _batch = self.nextBatch()
+            _samples = [_s for _r in _batch for _s in _r.samples]
+            try:
+                _prob = self.predictPairs(_samples) if _samples \
+                    else np.zeros((0, 1), dtype = np.float32)
+            except Exception as _err:
+                for _r in _batch:
+                    _r.error = _err
+                    _r.done.set()
+                continue
+            self.count(batches = 1)
+            _start = 0
+            for _r in _batch:
+                _r.prob = _prob[_start : _start + len(_r.samples)]
+                _start += len(_r.samples)
+                _r.done.set()
+
+    def embeddings(self, keys, tokens):
+        """
+        Get tower embeddings of files, computing missing ones
+        Parameters:
+        - keys    -- list of unique hashes of files
+        - tokens  -- dictionary of token sequences indexed by hashes
+        Returns:
+        - numpy array of embeddings of files
+        """
+        _emb = {_k: self.emb.get(_k) for _k in keys
+                if _k in self.emb.tokens}
+        _missing = [_k for _k in keys if _k not in _emb]
+        self.count(emb_hits = len(_emb), emb_misses = len(_missing))
+        _missing.sort(key = lambda _k: len(tokens[_k]))
+        _new = {}
+        for _b in range(0, len(_missing), self.batch):
+            _keys = _missing[_b : _b + self.batch]
+            _len = max(1, len(tokens[_keys[-1]]))
+            _ds = np.zeros(shape=(len(_keys), _len), dtype=np.int32)
+            for _i, _k in enumerate(_keys):
+                _ds[_i][0:len(tokens[_k])] = tokens[_k]
+            _tower = np.asarray(self.evaluator.tower.predict_on_batch(_ds))
+            _new.update(zip(_keys, _tower.reshape(len(_keys), -1)))
+        self.emb.add(_new)
+        _emb.update(_new)
+        return np.stack([_emb[_k] for _k in keys])
+
+    def predictPairs(self, samples):
+        """
+        Predict similarity of pairs
+        Parameters:
+        - samples  -- list of pairs of <hash, token sequence> of files
+        Returns:
+        - numpy array of probabilities of similarity
+        """
+        if self.evaluator is None:
+            return predict(self.dnn,
+                           [(_s1[1], _s2[1]) for _s1, _s2 in samples],
+                           self.batch, progress = 0)
+        _tokens = {_k: _t for _s in samples for _k, _t in _s}
+        _keys = list(_tokens)
+        _emb = self.embeddings(_keys, _tokens)
+        _index = {_k: _i for _i, _k in enumerate(_keys)}
+        _ind1 = [_index[_s1[0]] for _s1, _ in samples]
+        _ind2 = [_index[_s2[0]] for _, _s2 in samples]
+        _shape = (-1,) + tuple(self.evaluator.head.inputs[0].shape[1 :])
+        _prob = [np.asarray(self.evaluator.head.predict_on_batch(
+                     [_emb[_ind1[_b : _b + self.batch]].reshape(_shape),
+                      _emb[_ind2[_b : _b + self.batch]].reshape(_shape)]))
+                 for _b in range(0, len(samples), self.batch)]
+        return np.concatenate(_prob).reshape(len(samples), -1)[:, :1]
+
+    def stats(self):
+        """
+        Get counters of the service
+        Returns:
+        - dictionary of counters
+        """
+        with self.lock:
+            _stats = dict(self.counters)
+            _latencies = np.asarray(self.latencies) * 1000
+        _uptime = time.time() - self.started
+        _stats["uptime_sec"] = _uptime
+        _stats["pairs_per_sec"] = _stats["pairs"] / max(_uptime, 1e-9)
+        _stats["latency_p50_ms"] = float(np.percentile(_latencies, 50)) \
+            if _latencies.size else None
+        _stats["latency_p99_ms"] = float(np.percentile(_latencies, 99)) \
+            if _latencies.size else None
+        _stats["cached_tokenizations"] = len(self.tokens.tokens)
+        _stats["cached_embeddings"] = len(self.emb.tokens)
+        return _stats
+#---------------- End of class SimilarityScorer ----------------------------
+
+class SimilarityHandler(BaseHTTPRequestHandler):
+    """
+    Handler of HTTP requests of similarity service
+    """
+    #Scorer shared by all handlers
+    scorer = None
+
+    def reply(self, code, body):
+        """
+        Send json reply
+        Parameters:
+        - code  -- HTTP status code
+        - body  -- object to send as json
+        """
+        _data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_data)))
+        self.end_headers()
+        self.wfile.write(_data)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        self.reply(200, self.scorer.stats())
+
+    def do_POST(self):
+        if self.path != "/similarity":
+            self.reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        _start = time.perf_counter()
+        #Errors of request are client errors, and errors of
+        #prediction are server ones; each is counted once
+        try:
+            _length = int(self.headers.get("Content-Length", 0))
+            _pairs = json.loads(self.rfile.read(_length))["pairs"]
+            _samples = self.scorer.pairTokens(_pairs)
+        except (ValueError, KeyError, TypeError) as _err:
+            self.scorer.count(errors = 1)
+            self.reply(400, {"error": str(_err)})
+            return
+        try:
+            _prob = self.scorer.score(_samples, _start)
+        except Exception as _err:
+            self.scorer.count(errors = 1)
+            self.reply(500, {"error": str(_err)})
+            return
+        self.reply(200, {"confidence": _prob[:, 0].tolist(),
+                         "prediction": ["Similar" if _p >= 0.5
+                                        else "Dissimilar"
+                                        for _p in _prob[:, 0]]})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(SimilarityHandler, self).log_message(format, *args)
+#---------------- End of class SimilarityHandler ---------------------------
+
+def main(args):
+    """
+    Main function of similarity service
+
+    Parameters:
+    - args  -- Parsed command line arguments
+               as object returned by ArgumentParser
+    """
+    if not os.path.exists(args.source_code):
+        sys.exit(f"Directory {args.source_code} with source code is not found")
+    if not os.path.exists(args.tokenizer):
+        sys.exit(f"Tokenizer {args.tokenizer} is not found")
+    if not os.path.exists(args.dnn):
+        sys.exit(f"Check point with dnn model {args.dnn} is not found")
+    SimilarityHandler.scorer = SimilarityScorer(args)
+    _server = ThreadingHTTPServer((args.host, args.port), SimilarityHandler)
+    _server.verbose = args.verbose
+    print(f"Similarity service is listening on {args.host}:{args.port}")
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nService is stopped")
+        print(json.dumps(SimilarityHandler.scorer.stats(), indent = 2))
+    _server.server_close()
+##############################################################################
+# Program arguments are described below
+##############################################################################
+if __name__ == '__main__':
+    print("\nSERVICE PREDICTING SIMILARITY OF SOURCE CODE FILES")
+    #Handle command-line arguments
+    parser = argparse.ArgumentParser("SimService")
+    parser.add_argument("source_code", type=str,
+                        help="directory with source code files to analyze similarity")
+    parser.add_argument("--host", default = "127.0.0.1",
+                        type=str, help="host address to listen on")
+    parser.add_argument("--port", default = 8080,
+                        type=int, help="port to listen on")
+    parser.add_argument("--dnn", default = "./dnn_ckpt",
+                        type=str, help="checkpoint file with trained dnn")
+    parser.add_argument("--tokenizer", default = "tokenize",
+                        type=str, help="path to tokenizer of source code files")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="split siamese dnn and cache tower " +
+                        "embeddings of files")
+    parser.add_argument("--batch", default=400, type=int,
+                        help="maximum number of pairs in micro-batch")
+    parser.add_argument("--max_wait", default=10, type=float,
+                        help="latency budget of micro-batching in msec")
+    parser.add_argument("--cache", default=100000, type=int,
+                        help="maximum number of files with cached " +
+                        "tokenizations and embeddings")
+    parser.add_argument("--window", default=10000, type=int,
+                        help="number of recent requests used for " +
+                        "latency percentiles")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log HTTP requests")
+    args = parser.parse_args()
+
+    print("Program arguments used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    main(args)
@@ -5,6 +5,7 @@ Program for predicting similarity of testset samples.
   <sample number>,<relative path to 1-st file>,<relative path to 2-nd file>
 - The program converts source code into token sequences
   using the tokenizer from Project_CodeNet
+  Files are tokenized in parallel by a pool of processes
 - Tokens coding is defined with dictionary of tokens hard coded in the program.
 - It is required that tokens coding is the same as the one used for DNN training.
 - More examples of token dictionaries can be found in  Project_CodeNet Github
@@ -14,6 +15,12 @@ Program for predicting similarity of testset samples.
     * The label = 1 for similar source code files, otherwise label = 0
 - The program computes the average accuracy of detecting similarity and dissimilarity of test set samples, if labels are defined
 - The program also writes down file csv file with predicted probabilities that samples represent similar source code files
+- For prediction pairs are sorted by length and batched, 
+  so each batch is padded only to its longest sequence
+- For very large test sets the program can work in streaming mode:
+  it processes the test set by chunks of pairs, caching tokenizations
+  of recently used files, and tokenization, prediction and writing
+  of predictions are overlapped in separate threads
 
 The program uses the following components:
 - The tokenizer from Project_CodeNet 
@@ -25,8 +32,15 @@ import sys
 import os
 import argparse
 import csv
+import tempfile
+import subprocess
+import itertools
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import tensorflow as tf
+from TokenCache import TokenCache
 
 def makeTokenSet():
     """
@@ -76,31 +90,63 @@ def tokenizeFile(filename, tokenizer):
     Returns:
     - a list of integer token values representing the source code file
     """
-    #Name of temporary file for tokenized source code
-    TMP_TOKENIZATION = "./t_o_k_e_n_s.o_u_t"
+    #Unique temporary file for tokenized source code,
+    #so files can be tokenized by concurrent processes
+    _fd, _tmp_tokenization = tempfile.mkstemp(suffix = ".tokens.csv")
+    os.close(_fd)
     #Tokenization command ignoring macros
-    #tokenize_cmd = tokenizer + " -wcmcsv"
+    #tokenize_cmd = [tokenizer, "-wcmcsv"]
     #Tokenization command tokenising macros
-    tokenize_cmd = tokenizer + " -wmcsv"
-    if os.system(f"{tokenize_cmd}  -o {TMP_TOKENIZATION} {filename}"):
-        sys.exit(f"Tokenization error in file {filename}")
-    tokens = []
-    with open(TMP_TOKENIZATION, newline='',
-              encoding="ISO-8859-1") as csvfile:
-        token_reader = csv.reader(csvfile)
-        token_reader.__next__() #Skip csv header
-        for _, _, _tok_class, _tok_value in token_reader:
-            if _tok_class == "operator" or _tok_class == "keyword":
-                try:
-                    tokens.append(token_set[_tok_value] + 1)
-                except KeyError:
-                    #ignore tokens that are not in the tokens set
-                    pass
-    return tokens
+    tokenize_cmd = [tokenizer, "-wmcsv"]
+    try:
+        #Arguments are passed without shell, so file names are not
+        #interpreted by it
+        if subprocess.run(tokenize_cmd + ["-o", _tmp_tokenization,
+                                          filename]).returncode:
+            sys.exit(f"Tokenization error in file {filename}")
+        tokens = []
+        with open(_tmp_tokenization, newline='',
+                  encoding="ISO-8859-1") as csvfile:
+            token_reader = csv.reader(csvfile)
+            token_reader.__next__() #Skip csv header
+            for _, _, _tok_class, _tok_value in token_reader:
+                if _tok_class == "operator" or _tok_class == "keyword":
+                    try:
+                        tokens.append(token_set[_tok_value] + 1)
+                    except KeyError:
+                        #ignore tokens that are not in the tokens set
+                        pass
+    finally:
+        os.remove(_tmp_tokenization)
+    return np.asarray(tokens, dtype=np.int32)
 
-def makeDataset(source, test, tokenizer):
+def tokenizeFiles(source, filenames, tokenizer, n_jobs = None, 
+                  pool = None):
     """
-    Make tensorflow dataset 
+    Tokenize files by pool of processes
+    Parameters:
+    - source     -- path to directory with source code files
+    - filenames  -- list of unique names of files relative to source
+    - tokenizer  -- path to tokenizer executable
+    - n_jobs     -- number of processes, number of CPUs if None
+    - pool       -- existing pool of processes to use
+                    If it is None, a new pool is created
+    Returns:
+    - dictionary of token sequences as numpy arrays indexed by file names
+    """
+    if pool is None:
+        with ProcessPoolExecutor(max_workers = n_jobs) as _pool:
+            return tokenizeFiles(source, filenames, tokenizer, 
+                                 pool = _pool)
+    _paths = [source + '/' + _fn for _fn in filenames]
+    _tokens = pool.map(tokenizeFile, _paths,
+                       [tokenizer] * len(_paths),
+                       chunksize = max(1, len(_paths) // 256))
+    return dict(zip(filenames, _tokens))
+
+def makeDataset(source, test, tokenizer, n_jobs = None):
+    """
+    Make dataset 
     for predicting similarity of testset samples with Simaese DNN
     Parameters:
     - source    -- path to directory with source code files 
@@ -108,40 +154,93 @@ def makeDataset(source, test, tokenizer):
     - test      -- path to the testsetrfile specifying pairs 
                    of source code file to analyze similarity
     - tokenizer -- path to tokenizer executable
+    - n_jobs    -- number of tokenization processes
     Returns:
-    - dataset as list of two numpy arrays.
-      Each numpy array represets set of token sequences for one input of DNN
+    - list of samples in the order of the testset file
+      Each sample is a pair of token sequences as numpy arrays
     """   
-    tokenizations = {}
-    samples = []
-    max_code_len = 0
+    pairs = []
     with open(test, newline='') as csvfile:
         test_reader = csv.reader(csvfile)
         test_reader.__next__() #Skip csv header
         for _num, fn1, fn2 in test_reader:
-            try:
-                tok_seq1 = tokenizations[fn1]
-            except KeyError:
-                tok_seq1 = tokenizeFile(source + '/' + fn1, tokenizer)
-                tokenizations[fn1] = tok_seq1
-                max_code_len = max(max_code_len, len(tok_seq1))
-            try:
-                tok_seq2 = tokenizations[fn2]
-            except KeyError:
-                tok_seq2 = tokenizeFile(source + '/' + fn2, tokenizer)
-                tokenizations[fn2] = tok_seq2                
-                max_code_len = max(max_code_len, len(tok_seq2))
-            samples.append((tok_seq1, tok_seq2))
-    np_ds1 = np.zeros(shape=(len(samples), max_code_len), 
-                      dtype=np.int32)
-    np_ds2 = np.zeros(shape=(len(samples), max_code_len), 
-                      dtype=np.int32)
-    for _i, _s in enumerate(samples):
-        tok_seq1, tok_seq2 = _s
-        np_ds1[_i][0:len(tok_seq1)] = np.asarray(tok_seq1, dtype=np.int32)
-        np_ds2[_i][0:len(tok_seq2)] = np.asarray(tok_seq2, dtype=np.int32)
+            pairs.append((fn1, fn2))
+    tokenizations = tokenizeFiles(
+        source, list(dict.fromkeys(_fn for _p in pairs for _fn in _p)),
+        tokenizer, n_jobs = n_jobs)
+    print(f"{len(tokenizations)} files are tokenized")
+    samples = [(tokenizations[fn1], tokenizations[fn2]) 
+               for fn1, fn2 in pairs]
     print(f"Dataset of {len(samples)} samples is constructed")
-    return [np_ds1, np_ds2]
+    return samples
+
+def makeBatches(samples, batch, pad_step = 16):
+    """
+    Make batches of samples sorted by length
+    Each batch is padded to its longest sequence rounded up
+    to multiple of pad_step, which limits number of different 
+    input shapes of DNN
+    Parameters:
+    - samples   -- list of pairs of token sequences
+    - batch     -- batch size
+    - pad_step  -- granularity of padded lengths
+    Returns:
+    - list of batches as pairs <indices of samples, 
+      list of two numpy arrays of padded token sequences>
+    """
+    _lengths = np.asarray([max(len(_s[0]), len(_s[1])) for _s in samples])
+    _order = np.argsort(_lengths, kind = "stable")
+    batches = []
+    for _b in range(0, len(samples), batch):
+        _indices = _order[_b : _b + batch]
+        _len = -(-max(int(_lengths[_indices[-1]]), 1) // pad_step) * pad_step
+        _ds1 = np.zeros(shape=(len(_indices), _len), dtype=np.int32)
+        _ds2 = np.zeros(shape=(len(_indices), _len), dtype=np.int32)
+        for _i, _j in enumerate(_indices):
+            tok_seq1, tok_seq2 = samples[_j]
+            _ds1[_i][0:len(tok_seq1)] = tok_seq1
+            _ds2[_i][0:len(tok_seq2)] = tok_seq2
+        batches.append((_indices, [_ds1, _ds2]))
+    return batches
+
+def predict(dnn, samples, batch, progress = 1):
+    """
+    Predict similarity of samples by batches of similar lengths
+    Parameters:
+    - dnn       -- trained DNN
+    - samples   -- list of pairs of token sequences
+    - batch     -- batch size
+    - progress  -- mode of Keras progress bar
+    Returns:
+    - numpy array of probabilities of similarities 
+      in the original order of samples
+    """
+    prob = np.zeros(shape=(len(samples), 1), dtype=np.float32)
+    batches = makeBatches(samples, batch)
+    _bar = tf.keras.utils.Progbar(len(batches), verbose = progress)
+    for _step, (_indices, _ds) in enumerate(batches, 1):
+        prob[_indices] = np.asarray(
+            dnn.predict_on_batch(_ds)).reshape(len(_indices), -1)[:, :1]
+        _bar.update(_step)
+    return prob
+
+def evaluate(dnn, prob, labels):
+    """
+    Evaluate DNN accuracy and loss from predicted probabilities
+    Parameters:
+    - dnn     -- trained DNN
+    - prob    -- numpy array of probabilities of similarities
+    - labels  -- numpy array with ground truth labels
+    Returns:
+    - loss or None if DNN has no loss function
+    - accuracy
+    """
+    acc = np.mean((prob[:, 0] >= 0.5) == (labels == 1))
+    if dnn.loss is None:
+        return None, acc
+    loss = tf.reduce_mean(tf.keras.losses.get(dnn.loss)(
+        labels.reshape(-1, 1).astype(np.float32), prob))
+    return float(loss), acc
 
 def loadLabels(filename):
     """
@@ -191,6 +290,166 @@ def writePredictions(test, probabilities, filename):
                              else "Dissimilar"])
             _i += 1
     
+def readChunks(test, labels, chunk):
+    """
+    Read test pairs and their labels by chunks
+    Parameters:
+    - test    -- path to the testset file specifying pairs 
+                 of source code file to analyze similarity
+    - labels  -- path to file with ground truth labels or None
+    - chunk   -- number of pairs in chunk
+    Yields:
+    - list of rows <sample number, 1-st file, 2-nd file> of chunk
+    - numpy array with labels of chunk or None if labels are 
+      not given or their number differs from number of pairs
+    """
+    with open(test, newline='') as csvfile:
+        test_reader = csv.reader(csvfile)
+        test_reader.__next__() #Skip csv header
+        _lblfile = open(labels, newline='') if labels else None
+        try:
+            _lbl_reader = csv.reader(_lblfile) if _lblfile else None
+            if _lbl_reader:
+                _lbl_reader.__next__() #Skip csv header
+            while True:
+                _rows = list(itertools.islice(test_reader, chunk))
+                if not _rows:
+                    break
+                _labels = None
+                if _lbl_reader:
+                    _labels = np.asarray(
+                        [int(_lbl) for _num, _lbl in
+                         itertools.islice(_lbl_reader, len(_rows))])
+                    if _labels.shape[0] != len(_rows):
+                        _labels = _lbl_reader = None
+                yield _rows, _labels
+            if _lbl_reader and next(_lbl_reader, None) is not None:
+                #More labels than pairs
+                yield [], None
+        finally:
+            if _lblfile:
+                _lblfile.close()
+
+def runStage(stage, out_queue):
+    """
+    Run pipeline stage in a thread passing its exception 
+    to the next stage
+    Parameters:
+    - stage      -- function performing the stage
+    - out_queue  -- queue of results of the stage
+                    It receives None when the stage is finished,
+                    or the exception that stopped the stage
+    """
+    try:
+        stage()
+        out_queue.put(None)
+    except BaseException as _err:
+        out_queue.put(_err)
+
+def streamPredictions(args, dnn):
+    """
+    Predict similarity of testset samples by chunks
+    Chunks are tokenized, predicted and written in separate
+    overlapping threads. Memory used is defined by sizes of 
+    chunk and token cache and does not depend on size of testset
+    Parameters:
+    - args  -- Parsed command line arguments
+    - dnn   -- trained DNN
+    """
+    _labels = args.labels
+    if _labels is None or not os.path.exists(_labels):
+        loadLabels(_labels)
+        _labels = None
+    _token_q = queue.Queue(maxsize = 2)
+    _predict_q = queue.Queue(maxsize = 2)
+    _stats = {"pairs": 0, "evaluated": _labels is not None,
+              "loss": 0.0, "correct": 0.0}
+
+    def tokenizeStage():
+        _cache = TokenCache(args.cache)
+        with ProcessPoolExecutor(max_workers = args.jobs) as _pool:
+            for _rows, _lbls in readChunks(args.test, _labels, args.chunk):
+                _tokens = _cache.lookup(
+                    [_fn for _r in _rows for _fn in _r[1:]],
+                    lambda _fns: tokenizeFiles(args.source_code, _fns,
+                                               args.tokenizer,
+                                               pool = _pool))
+                _samples = [(_tokens[_fn1], _tokens[_fn2])
+                            for _num, _fn1, _fn2 in _rows]
+                _token_q.put((_rows, _lbls, _samples))
+
+    def writeStage():
+        with open(args.predictions, 'w', newline='') as csvout:
+            writer = csv.writer(csvout, lineterminator=os.linesep)
+            writer.writerow(["pair-id", "file1", "file2",
+                             "confidence", "prediction"])
+            while True:
+                _chunk = _predict_q.get()
+                if _chunk is None:
+                    break
+                _rows, _prob = _chunk
+                for (_num, _fn1, _fn2), _p in zip(_rows, _prob[:, 0]):
+                    writer.writerow([_num, _fn1, _fn2, _p,
+                                     "Similar" if _p >= 0.5
+                                     else "Dissimilar"])
+
+    def toWriter(item):
+        #Queue is not waited for forever if writing failed
+        while _writer.is_alive():
+            try:
+                _predict_q.put(item, timeout = 1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    _write_q = queue.Queue()
+    _tokenizer = threading.Thread(target = runStage, daemon = True,
+                                  args = (tokenizeStage, _token_q))
+    _writer = threading.Thread(target = runStage, daemon = True,
+                               args = (writeStage, _write_q))
+    _tokenizer.start()
+    _writer.start()
+    try:
+        while True:
+            _chunk = _token_q.get()
+            if _chunk is None:
+                break
+            if isinstance(_chunk, BaseException):
+                raise _chunk
+            _rows, _lbls, _samples = _chunk
+            if not _rows:
+                _stats["evaluated"] = False
+                continue
+            _prob = predict(dnn, _samples, args.batch, progress = 0)
+            if _lbls is None:
+                _stats["evaluated"] = False
+            elif _stats["evaluated"]:
+                _loss, _acc = evaluate(dnn, _prob, _lbls)
+                _stats["loss"] += (_loss or 0.0) * len(_rows)
+                _stats["correct"] += _acc * len(_rows)
+            if not toWriter((_rows, _prob)):
+                #Writing of predictions failed
+                break
+            _stats["pairs"] += len(_rows)
+            if args.progress:
+                print(f"{_stats['pairs']} pairs are predicted")
+    finally:
+        toWriter(None)
+        _writer.join()
+    _err = _write_q.get()
+    if _err is not None:
+        raise _err
+    if _stats["evaluated"] and _stats["pairs"]:
+        print("\nEvaluation accuracy is {:5.2f}%".format(
+            _stats["correct"] / _stats["pairs"] * 100))
+        if dnn.loss is not None:
+            print("Evaluation loss is {:5.2f}".format(
+                _stats["loss"] / _stats["pairs"]))
+    elif _labels is not None:
+        print("Numers of labels and samples is different")
+        print("Accuracy of DNN on this test cannot be evaluated")
+
 def main(args):
     """
     Main function of program for predicting similarity testset samples
@@ -207,22 +466,29 @@ def main(args):
         sys.exit(f"Tokenizer {args.tokenizer} is not found")
     if not os.path.exists(args.dnn):
         sys.exit(f"Check point with dnn model {args.dnn} is not found")
-    ds = makeDataset(args.source_code, args.test, args.tokenizer)
+    if args.chunk:
+        #Load trained DNN from TF checkpoint
+        dnn = tf.keras.models.load_model(args.dnn)
+        streamPredictions(args, dnn)
+        return
+    ds = makeDataset(args.source_code, args.test, args.tokenizer,
+                     n_jobs = args.jobs)
     labels = loadLabels(args.labels)
     #Load trained DNN from TF checkpoint
     dnn = tf.keras.models.load_model(args.dnn)
+    #Compute probabilities of similarity predicted by DNN
+    prob = predict(dnn, ds, args.batch, progress = args.progress)
     if labels is not None:
-        if ds[0].shape[0] == labels.shape[0]:
+        if len(ds) == labels.shape[0]:
             #Evaluate DNN accuracy on the testset
-            loss, acc = dnn.evaluate(ds, labels, verbose = args.progress)
+            loss, acc = evaluate(dnn, prob, labels)
             print("\nEvaluation accuracy is {:5.2f}%".format(acc * 100))
-            print("Evaluation loss is {:5.2f}".format(loss))
+            if loss is not None:
+                print("Evaluation loss is {:5.2f}".format(loss))
         else:
             print(f"Numers of labels {labels.shape[0]} " +
-                f"and samples {ds[0].shape[0]} is different ")
+                f"and samples {len(ds)} is different ")
             print("Accuracy of DNN on this test cannot be evaluated")
-    #Compute probabilities of similarity predicted by DNN
-    prob = dnn.predict(ds, verbose = args.progress)
     writePredictions(args.test, prob, args.predictions)
 ##############################################################################
 # Program arguments are described below
@@ -245,6 +511,16 @@ if __name__ == '__main__':
                         type=str, help="file to write similarity predictions")
     parser.add_argument("--batch", default=400, type=int,
                         help="batch size")
+    parser.add_argument("--jobs", default=None, type=int,
+                        help="number of tokenization processes, " +
+                        "number of CPUs by default")
+    parser.add_argument("--chunk", default=None, type=int,
+                        help="number of pairs processed at once " +
+                        "in streaming mode; the whole test set is " +
+                        "processed at once if it is not specified")
+    parser.add_argument("--cache", default=100000, type=int,
+                        help="maximum number of files with cached " +
+                        "tokenizations in streaming mode")
     parser.add_argument('--progress', default=1, type=int,
                         choices=[0, 1, 2],
                         help="mode of Keras training progress bar")
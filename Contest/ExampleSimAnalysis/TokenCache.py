@@ -0,0 +1,67 @@
+"""
+Module with cache of tokenizations of source code files
+used by TestSetEval.py and SimService.py
+"""
+from collections import OrderedDict
+
+class TokenCache():
+    """
+    Cache of token sequences of least recently used files
+    """
+    def __init__(self, capacity):
+        """
+        Initialize cache
+        Parameters:
+        - capacity  -- maximum number of cached files
+        """
+        self.capacity = capacity
+        self.tokens = OrderedDict()
+
+    def missing(self, filenames):
+        """
+        Get files that are not cached
+        Parameters:
+        - filenames  -- list of file names
+        Returns:
+        - list of unique names of files missing in the cache
+        """
+        return [_fn for _fn in dict.fromkeys(filenames)
+                if _fn not in self.tokens]
+
+    def get(self, filename):
+        """
+        Get cached token sequence of file and mark it recently used
+        """
+        self.tokens.move_to_end(filename)
+        return self.tokens[filename]
+
+    def add(self, tokenizations):
+        """
+        Add token sequences of files evicting least recently used ones
+        Parameters:
+        - tokenizations  -- dictionary of token sequences of files
+        """
+        self.tokens.update(tokenizations)
+        while len(self.tokens) > self.capacity:
+            self.tokens.popitem(last = False)
+
+    def lookup(self, filenames, tokenize):
+        """
+        Get token sequences of files tokenizing files that are not cached
+        Cached sequences are taken before adding new ones,
+        so they are available even if adding evicts them
+        Parameters:
+        - filenames  -- list of file names
+        - tokenize   -- function tokenizing list of files and
+                        returning dictionary of their token sequences
+        Returns:
+        - dictionary of token sequences of all files
+        """
+        _missing = self.missing(filenames)
+        _new = tokenize(_missing) if _missing else {}
+        _tokens = {_fn: self.get(_fn) for _fn in dict.fromkeys(filenames)
+                   if _fn not in _new}
+        self.add(_new)
+        _tokens.update(_new)
+        return _tokens
+#---------------- End of class TokenCache ----------------------------------
@@ -0,0 +1,40 @@
+"""
+Tests of cache of tokenizations used in streaming mode of TestSetEval.py
+Run with: python -m unittest test_TokenCache
+"""
+import unittest
+
+from TokenCache import TokenCache
+
+class TokenCacheTest(unittest.TestCase):
+    def tokenize(self, filenames):
+        self.tokenized.extend(filenames)
+        return {_fn: f"tokens of {_fn}" for _fn in filenames}
+
+    def setUp(self):
+        self.tokenized = []
+
+    def testCachedFileEvictedByChunk(self):
+        _cache = TokenCache(4)
+        _cache.lookup(["A", "B", "C", "D"], self.tokenize)
+        _tokens = _cache.lookup(["A", "E"], self.tokenize)
+        self.assertEqual(_tokens, {"A": "tokens of A", "E": "tokens of E"})
+        self.assertEqual(self.tokenized, ["A", "B", "C", "D", "E"])
+
+    def testChunkLargerThanCache(self):
+        _cache = TokenCache(2)
+        _cache.lookup(["A", "B"], self.tokenize)
+        _tokens = _cache.lookup(["A", "B", "C", "D", "A"], self.tokenize)
+        self.assertEqual(sorted(_tokens), ["A", "B", "C", "D"])
+        self.assertEqual(self.tokenized, ["A", "B", "C", "D"])
+        self.assertEqual(len(_cache.tokens), 2)
+
+    def testLeastRecentlyUsedEvicted(self):
+        _cache = TokenCache(3)
+        _cache.lookup(["A", "B", "C"], self.tokenize)
+        _cache.lookup(["A"], self.tokenize)
+        _cache.lookup(["D"], self.tokenize)
+        self.assertEqual(list(_cache.tokens), ["C", "A", "D"])
+
+if __name__ == '__main__':
+    unittest.main()
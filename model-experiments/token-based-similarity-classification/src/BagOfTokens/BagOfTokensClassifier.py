@@ -29,6 +29,7 @@ from ProgramArguments import (makeArgParserCodeML, parseArguments)
 from Utilities        import *
 from BagTokDataset    import BagTokDataset
 from DsUtilities      import DataRand
+from DataLoader       import SeqOfTokensLoader
 from SeqModelMaker    import SeqModelFactory
 
 def main(args):
@@ -39,7 +40,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
 
     if args.ckpt_dir:
         _latest_checkpoint = setupCheckpoint(args.ckpt_dir)
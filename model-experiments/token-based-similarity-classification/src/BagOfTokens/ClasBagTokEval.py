@@ -18,6 +18,7 @@ sys.path.extend([f"{main_dir}/BagOfTokens",
                  f"{main_dir}/PostProcessor"])
 from BagTokDataset    import BagTokDataset
 from DsUtilities      import DataRand
+from DataLoader       import SeqOfTokensLoader
 from ProgramArguments import (makeArgParserCodeML, parseArguments)
 from Utilities        import *
 from ClassConfusion   import ClassConfusAnalysis
@@ -32,7 +33,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     
     _checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
 
@@ -53,7 +57,8 @@ def main(args):
                                   verbose = args.progress)
     _prob = _dnn.predict(_test_ds[0], verbose = args.progress)
     _confusion = ClassConfusAnalysis(_prob, _labels, _sample_names,
-                                     _label_names)
+                                     _label_names,
+                                     matrix_format = args.matrix_format)
     _confusion.writeReport()
     print("\n")
     print("Evaluation accuracy is {:5.2f}%".format(_eval_acc * 100))
@@ -69,6 +74,10 @@ if __name__ == '__main__':
         task = "classification")
     parser.add_argument("--ckpt", default = None,
                         type=str, help="checkpoint file to load")
+    parser.add_argument("--matrix_format", default="text", type=str,
+                        choices=["text", "binary", "all"],
+                        help="format of confusion matrices: text listing, " +
+                        "binary - numpy .npy and csv files, all - both")
     args = parseArguments(parser)
 
     main(args)
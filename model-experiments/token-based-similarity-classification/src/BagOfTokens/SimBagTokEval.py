@@ -21,6 +21,7 @@ from BagTokSimilarityDS import BagTokSimilarityDS
 from ProgramArguments import *
 from Utilities import *
 from DsUtilities import DataRand
+from DataLoader  import SeqOfTokensLoader
 from SimilConfusion import SimilConfusAnalysis
 
 def main(args):
@@ -33,7 +34,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
 
     _checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
 
@@ -26,6 +26,7 @@ from ProgramArguments   import (makeArgParserCodeML, parseArguments)
 from Utilities          import *
 from BagTokSimilarityDS import BagTokSimilarityDS
 from DsUtilities        import DataRand
+from DataLoader         import SeqOfTokensLoader
 from SeqModelMaker      import SeqModelFactory
 
 def main(args):
@@ -38,7 +39,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     if args.ckpt_dir:
         _latest_checkpoint = setupCheckpoint(args.ckpt_dir)
         _checkpoint_callback = makeCkptCallback(args.ckpt_dir)
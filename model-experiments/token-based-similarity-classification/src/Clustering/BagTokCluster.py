@@ -21,7 +21,9 @@ def main(args):
     """
     ds = BagOfTokensLoader(args.samples, args.tokens)
     samples, _, _, _, _, = ds.loadProblem(args.problem)
-    sol_clustered = VectorsClustered(samples)
+    sol_clustered = VectorsClustered(samples,
+                                     diameter_mode = args.diameter,
+                                     n_jobs = args.jobs)
     sol_clustered.kmeansCluster(args.clusters)
     sol_clustered.printClustersStat()
 #######################################################################
@@ -41,6 +43,13 @@ if __name__ == '__main__':
                         help='number of tokens')
     parser.add_argument('--clusters', default=8, type=int,
                         help='number of clusters')
+    parser.add_argument('--diameter', default="exact", type=str,
+                        choices=["exact", "approx"],
+                        help='computation of cluster diameters: exact or ' +
+                        'approximate by farthest point heuristic')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='number of threads computing separations ' +
+                        'of clusters')
     args = parser.parse_args()
 
     print("Parameter settings used:")
@@ -38,9 +38,14 @@ def main(args):
     train_samples = \
         [_solutions[int(float(len(_solutions)) * val_train_split) :] 
          for _solutions in problem_samples]
-    classifier = NearestClusterClassifier(train_samples, val_samples)
-    #classifier.nClustersTrain(args.clusters)
-    classifier.scaledClustersTrain(args.clusters)
+    classifier = NearestClusterClassifier(train_samples, val_samples,
+                                          n_jobs = args.jobs,
+                                          backend = args.kmeans,
+                                          batch = args.batch)
+    if args.training == "fixed":
+        classifier.nClustersTrain(args.clusters)
+    else:
+        classifier.scaledClustersTrain(args.clusters)
     accuracy = classifier.validate()
     print("Accuracy: ", accuracy)
 
@@ -62,6 +67,19 @@ if __name__ == '__main__':
                         help='fraction of samples for validation')
     parser.add_argument('--clusters', default=8, type=int,
                         help='number of clusters')
+    parser.add_argument('--training', default="scaled", type=str,
+                        choices=["scaled", "fixed"],
+                        help='numbers of clusters of classes: scaled - ' +
+                        'proportional to numbers of class samples, ' +
+                        'fixed - the same for all classes')
+    parser.add_argument('--kmeans', default="kmeans", type=str,
+                        choices=["kmeans", "minibatch"],
+                        help='k-means implementation: kmeans - sklearn ' +
+                        'KMeans, minibatch - sklearn MiniBatchKMeans')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='number of processes clustering classes')
+    parser.add_argument('--batch', default=4096, type=int,
+                        help='number of samples classified at once')
     args = parser.parse_args()
 
     print("Parameter settings used:")
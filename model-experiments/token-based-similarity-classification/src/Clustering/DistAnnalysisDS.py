@@ -20,7 +20,9 @@ def main(args):
     """
     ds_loader = BagOfTokensLoader(args.samples, args.tokens)
     all_samples, problem_samples = ds_loader.getPartitionedSampes()
-    dist_analyzer = SetOfClusters(problem_samples)
+    dist_analyzer = SetOfClusters(problem_samples,
+                                  diameter_mode = args.diameter,
+                                  n_jobs = args.jobs)
     dist_analyzer.printClustCentersDistr()
     dist_analyzer.printClustToCentersDistr()
     dist_analyzer.printClustersDistr()
@@ -39,6 +41,13 @@ if __name__ == '__main__':
                         type=str, help='path to data directory')
     parser.add_argument('--tokens', default=17, type=int,
                         help='number of tokens')
+    parser.add_argument('--diameter', default="exact", type=str,
+                        choices=["exact", "approx"],
+                        help='computation of cluster diameters: exact or ' +
+                        'approximate by farthest point heuristic')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='number of threads computing separations ' +
+                        'of clusters')
     args = parser.parse_args()
 
     print("Parameter settings used:")
@@ -1,49 +1,91 @@
 """
 """
-import sys
-import os
-import math
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from VectorKMeans import VectorsClustered
+from VectorKMeans import VectorsClustered, fitKMeans, squaredDistances
 
 class NearestClusterClassifier(object):
     """
     """
-    def __init__(self, train_samples, val_samples):
+    def __init__(self, train_samples, val_samples, n_jobs = 1,
+                 backend = "kmeans", batch = 4096):
         """
+        Parameters:
+        - n_jobs   -- number of processes clustering classes
+        - backend  -- k-means implementation: "kmeans" or "minibatch"
+        - batch    -- number of samples classified at once
         """
         self._val_samples = val_samples
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.batch = batch
+        self._centers = None
+        self._center_classes = None
         self._min_n_class_samples = min(map(len, train_samples))
         print("_min_n_class_samples: ", self._min_n_class_samples)
         self._classes = [VectorsClustered(_samples) 
                          for _samples in train_samples]
         self.n_classes = len(self._classes)
 
+    def clustersTrain(self, n_clusters):
+        """
+        Cluster samples of each class
+        Classes are clustered by a pool of processes if n_jobs > 1
+        Parameters:
+        - n_clusters  -- list of numbers of clusters of classes
+        """
+        _jobs = [(_class.samples, _n, _class._random_seed, self.backend)
+                 for _class, _n in zip(self._classes, n_clusters)]
+        if self.n_jobs <= 1:
+            _results = [fitKMeans(*_args) for _args in _jobs]
+        else:
+            with ProcessPoolExecutor(max_workers = self.n_jobs) as _pool:
+                _results = list(_pool.map(fitKMeans, *zip(*_jobs)))
+        for _class, _result in zip(self._classes, _results):
+            _class.setClusters(*_result)
+        self._centers = np.concatenate(
+            [_class.clust_centers for _class in self._classes]).astype(
+                np.float64)
+        self._center_classes = np.concatenate(
+            [np.full(_class.n_clusters, _i)
+             for _i, _class in enumerate(self._classes)])
+
     def nClustersTrain(self, n_clusters):
         """
         """
-        for _class in self._classes:
-            _class.kmeansCluster(n_clusters)
+        self.clustersTrain([n_clusters] * self.n_classes)
 
     def scaledClustersTrain(self, n_clusters):
         """
         """
+        _n_clusters = []
         for _class in self._classes:
             _scale = _class.n_samples // self._min_n_class_samples
             print("Scale: ", _scale)
-            _class.kmeansCluster(n_clusters * _scale)
+            _n_clusters.append(n_clusters * _scale)
+        self.clustersTrain(_n_clusters)
             
     def classify(self, sample):
         """
         """
-        _min_d = sys.maxsize
-        _classification = None
-        for _i, _class in enumerate(self._classes):
-            _class_dist = _class.distanceToCenters(sample)
-            if _class_dist < _min_d:
-                _min_d = _class_dist
-                _classification = _i
-        return _classification
+        return self.classifyBatch(np.asarray(sample)[None, :])[0]
+
+    def classifyBatch(self, samples):
+        """
+        Classify samples by the nearest center of clusters
+        of all classes, computing distances of samples to all
+        centers by blocks of samples
+        Parameters:
+        - samples  -- 2D numpy array or list of samples
+        Returns: numpy array of classes of samples
+        """
+        _x = np.asarray(samples, dtype = np.float64)
+        _sq = np.einsum("ij,ij->i", self._centers, self._centers)
+        return np.concatenate(
+            [self._center_classes[np.argmin(squaredDistances(
+                _x[_i : _i + self.batch], self._centers, y_sq = _sq),
+                axis = 1)]
+             for _i in range(0, _x.shape[0], self.batch)])
 
     def validate(self):
         """
@@ -58,10 +100,9 @@ class NearestClusterClassifier(object):
         _n_val_samples = sum(map(len, val_samples))
         print(_n_val_samples)
         for _i, _val_class_samples in enumerate(val_samples):
-            _n_correct = 0
-            for _sample in _val_class_samples:
-                if _i == self.classify(_sample):
-                    _n_correct += 1
+            _n_correct = int(np.sum(
+                self.classifyBatch(_val_class_samples) == _i)) \
+                if len(_val_class_samples) else 0
             _n_correct_list.append(_n_correct)
             _acc_list.append(float(_n_correct) / 
                              float(len(_val_class_samples)))
@@ -0,0 +1,235 @@
+"""
+Program for search of source code solutions most similar
+to given solutions with approximate nearest neighbour index
+
+Solutions are represented either by bags of tokens or by
+tower embeddings of trained siamese similarity DNN.
+The program performs one of actions:
+- build      -- builds index of all solutions of tokenized dataset
+                and saves it into index directory
+- query      -- finds solutions most similar to solutions of
+                tokenized query dataset
+- benchmark  -- compares recall and speed of index search with
+                exact (brute force) cosine search on random
+                indexed solutions used as queries
+
+Program arguments are defined below in definition of
+argparse Argmuments Parser object
+"""
+import sys
+import os
+import argparse
+import time
+import numpy as np
+
+main_dir = os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+sys.path.extend([f"{main_dir}/Dataset",
+                 f"{main_dir}/CommonFunctions",
+                 f"{main_dir}/PostProcessor"])
+
+from DataLoader import SeqOfTokensLoader
+from VectorIndex import VectorIndex
+
+class SolutionVectorsLoader(SeqOfTokensLoader):
+    """
+    Loader of tokenized solutions as bags or sequences of tokens
+    """
+    def __init__(self, dir_name, vectors = "bot", short_code_th = 1):
+        """
+        Initialize loader
+        Parameters:
+        - dir_name       -- directory with tokenized dataset
+        - vectors        -- representation of solutions:
+                            * "bot"   -- bags of tokens
+                            * "tower" -- sequences of tokens
+                                         for tower of siamese DNN
+        - short_code_th  -- minimum length of code to load
+        """
+        super(SolutionVectorsLoader, self).__init__(
+            dir_name, min_n_solutions = 1,
+            short_code_th = short_code_th)
+        self.vectors = vectors
+
+    def makeSample(self, tokens):
+        """
+        Compute bag of tokens or sequence of tokens
+        shifted by 1 for padding
+        Parameters:
+        - tokens list of tokens as int values
+        Returns:
+        - sample as numpy array
+        """
+        if self.vectors == "bot":
+            return self.makeBagOfTokens(tokens)
+        return np.asarray(tokens, dtype = np.int32) + 1
+
+    def loadSamples(self):
+        """
+        Load solutions of all problems of dataset
+        Returns:
+        - list of samples
+        - list of names of problems of samples
+        - list of names of samples
+        """
+        _samples = []
+        _problems = []
+        _names = []
+        for _problem in self.problem_list:
+            _n, *_ = self.loadSolutions(_problem, _samples, _names)
+            _problems.extend([_problem] * _n)
+        print(f"Loaded {len(_samples)} solutions of " +
+              f"{len(self.problem_list)} problems")
+        return _samples, _problems, _names
+
+def makeVectors(args, dataset):
+    """
+    Compute vectors of all solutions of tokenized dataset
+    Parameters:
+    - args     -- parsed main program arguments
+    - dataset  -- directory with tokenized dataset
+    Returns:
+    - 2D numpy array of vectors
+    - list of names of problems of vectors
+    - list of names of solutions of vectors
+    """
+    _loader = SolutionVectorsLoader(dataset, vectors = args.vectors)
+    _samples, _problems, _names = _loader.loadSamples()
+    if args.vectors == "bot":
+        return np.stack(_samples), _problems, _names
+    if not args.ckpt_dir:
+        sys.exit("Tower embeddings require checkpoint directory --ckpt_dir")
+    #Tensorflow is required only for computing embeddings
+    import tensorflow as tf
+    from Utilities import getCheckpoint
+    from SiamesePairsEval import SiamesePairsEvaluator
+    _checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
+    print("Restoring from", _checkpoint)
+    _evaluator = SiamesePairsEvaluator(
+        tf.keras.models.load_model(_checkpoint))
+    _emb, _ = _evaluator.embeddings(_samples, batch = args.batch,
+                                    project = False)
+    return _emb, _problems, _names
+
+def buildIndex(args):
+    """
+    Build index of solutions of dataset and save it
+    Parameters:
+    - args  -- parsed main program arguments
+    """
+    _vectors, _problems, _names = makeVectors(args, args.dataset)
+    _index = VectorIndex.build(_vectors, n_lists = args.lists,
+                               info = {"vectors":  args.vectors,
+                                       "problems": _problems,
+                                       "names":    _names})
+    _index.save(args.index)
+
+def queryIndex(args):
+    """
+    Find and print indexed solutions most similar to query solutions
+    Parameters:
+    - args  -- parsed main program arguments
+    """
+    _index = VectorIndex.load(args.index)
+    if _index.info["vectors"] != args.vectors:
+        sys.exit(f"Index has vectors of type {_index.info['vectors']}")
+    _vectors, _problems, _names = makeVectors(args, args.dataset)
+    _start = time.perf_counter()
+    _scores, _ids = _index.search(_vectors, k = args.k,
+                                  n_probe = args.probes,
+                                  batch = args.batch)
+    print(f"{len(_names)} queries are processed in " +
+          f"{time.perf_counter() - _start:.2f} sec")
+    _ind_problems = _index.info["problems"]
+    _ind_names = _index.info["names"]
+    for _i, (_problem, _name) in enumerate(zip(_problems, _names)):
+        print(f"\n{_problem} {_name}:")
+        for _score, _id in zip(_scores[_i], _ids[_i]):
+            if _id < 0:
+                break
+            print(f"    {_score:6.4f}  {_ind_problems[_id]} {_ind_names[_id]}")
+
+def benchmarkIndex(args):
+    """
+    Compare index search with exact cosine search
+    Parameters:
+    - args  -- parsed main program arguments
+    """
+    _index = VectorIndex.load(args.index)
+    _rng = np.random.default_rng(0)
+    _queries = np.sort(_rng.choice(_index.n_vectors,
+                                   min(args.queries, _index.n_vectors),
+                                   replace = False))
+    _queries = np.asarray(_index.vectors[_queries])
+    _start = time.perf_counter()
+    _, _exact = _index.bruteForce(_queries, k = args.k, batch = args.batch)
+    _exact_time = time.perf_counter() - _start
+    print(f"Exact search: {_queries.shape[0] / _exact_time:.1f} queries/sec")
+    print("Probes  Recall@k  Queries/sec  Speedup")
+    for _n_probe in args.probe_list:
+        _start = time.perf_counter()
+        _, _ids = _index.search(_queries, k = args.k, n_probe = _n_probe,
+                                batch = args.batch)
+        _time = time.perf_counter() - _start
+        print("{:6d}  {:8.4f}  {:11.1f}  {:7.1f}".format(
+            _n_probe, VectorIndex.recall(_ids, _exact),
+            _queries.shape[0] / _time, _exact_time / _time))
+
+def main(args):
+    """
+    Main function of program for search of similar solutions
+    Arguments are descibed below
+    """
+    if args.action == "build":
+        buildIndex(args)
+    elif args.action == "query":
+        queryIndex(args)
+    else:
+        benchmarkIndex(args)
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nSEARCH OF SIMILAR SOURCE CODE SOLUTIONS")
+
+    #Command-line arguments
+    parser = argparse.ArgumentParser(
+        description = "Search of similar source code solutions")
+    parser.add_argument('action', type=str,
+                        choices=["build", "query", "benchmark"],
+                        help='action to perform')
+    parser.add_argument('index', type=str,
+                        help='directory of index of solutions')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='tokenized dataset to index or to query')
+    parser.add_argument('--vectors', type=str, default="bot",
+                        choices=["bot", "tower"],
+                        help='vectors of solutions: bot - bags of tokens, ' +
+                        'tower - tower embeddings of siamese DNN')
+    parser.add_argument('--ckpt_dir', type=str, default=None,
+                        help='checkpoint directory of siamese DNN')
+    parser.add_argument('--ckpt', type=str, default=None,
+                        help='checkpoint file')
+    parser.add_argument('--lists', type=int, default=None,
+                        help='number of lists of index; ' +
+                        'square root of number of solutions if not defined')
+    parser.add_argument('--k', type=int, default=10,
+                        help='number of most similar solutions to find')
+    parser.add_argument('--probes', type=int, default=8,
+                        help='number of lists probed by query')
+    parser.add_argument('--probe_list', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32],
+                        help='numbers of probed lists to benchmark')
+    parser.add_argument('--queries', type=int, default=1000,
+                        help='number of queries to benchmark')
+    parser.add_argument('--batch', type=int, default=256,
+                        help='number of queries processed at once')
+    args = parser.parse_args()
+
+    print("Parameter settings used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    if args.action != "benchmark" and not args.dataset:
+        sys.exit(f"Action {args.action} requires dataset --dataset")
+    main(args)
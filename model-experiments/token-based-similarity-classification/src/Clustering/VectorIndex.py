@@ -0,0 +1,290 @@
+"""
+Module with approximate nearest neighbour index of vectors
+of source code solutions for search of similar solutions
+
+The index is inverted file (IVF) index for cosine similarity:
+- vectors are normalized and clustered by spherical k-means
+  into lists, each list has vectors closest to its centroid
+- query is compared only with vectors of n_probe lists with
+  centroids most similar to the query
+
+Vectors are either bags of tokens or tower embeddings of
+siamese DNN. Index is saved into directory as numpy files
+and loaded with memmapping of vectors, so large indices are
+not read into memory.
+"""
+import sys
+import os
+import json
+import time
+import numpy as np
+
+class VectorIndex():
+    """
+    Inverted file index of vectors for cosine similarity search
+    Vectors are stored sorted by lists, list l has vectors
+    list_offsets[l] : list_offsets[l + 1]
+    """
+    #Names of files of saved index
+    fn_info = "index.json"
+    fn_vectors = "vectors.npy"
+    fn_ids = "ids.npy"
+    fn_offsets = "list_offsets.npy"
+    fn_centroids = "centroids.npy"
+
+    def __init__(self, vectors, ids, list_offsets, centroids, info = None):
+        """
+        Initialize index from its arrays
+        Parameters:
+        - vectors       -- normalized vectors sorted by lists
+        - ids           -- indices of vectors in the original order
+        - list_offsets  -- offsets of lists in array of vectors
+        - centroids     -- normalized centroids of lists
+        - info          -- dictionary of description of indexed vectors
+        """
+        self.vectors = vectors
+        self.ids = ids
+        self.list_offsets = list_offsets
+        self.centroids = centroids
+        self.info = info or {}
+        self.n_vectors, self.dim = vectors.shape
+        self.n_lists = centroids.shape[0]
+
+    @classmethod
+    def normalize(cls, vectors):
+        """
+        Normalize vectors to unit length
+        Parameters:
+        - vectors  -- 2D numpy array of vectors
+        Returns: numpy array of normalized vectors as float32
+        """
+        _v = np.asarray(vectors, dtype = np.float32)
+        _norm = np.linalg.norm(_v, axis = 1, keepdims = True)
+        return _v / np.maximum(_norm, np.finfo(np.float32).tiny)
+
+    @classmethod
+    def assignLists(cls, vectors, centroids, batch = 8192):
+        """
+        Assign vectors to lists of the most similar centroids
+        Parameters:
+        - vectors    -- normalized vectors
+        - centroids  -- normalized centroids
+        - batch      -- number of vectors processed at once
+        Returns: numpy array of list indices of vectors
+        """
+        return np.concatenate(
+            [np.argmax(vectors[_i : _i + batch] @ centroids.T, axis = 1)
+             for _i in range(0, vectors.shape[0], batch)])
+
+    @classmethod
+    def build(cls, vectors, n_lists = None, n_iter = 10,
+              train_size = 65536, seed = 0, info = None):
+        """
+        Build index of vectors
+        Centroids are computed by spherical k-means on a random
+        subset of vectors, then all vectors are assigned to lists
+        Parameters:
+        - vectors     -- 2D numpy array of vectors to index
+        - n_lists     -- number of lists
+                         If it is None, it is square root of
+                         number of vectors
+        - n_iter      -- number of iterations of k-means
+        - train_size  -- maximum number of vectors for k-means
+        - seed        -- seed of random selection of vectors
+        - info        -- dictionary of description of indexed vectors
+        Returns: VectorIndex object
+        """
+        _start = time.perf_counter()
+        _v = cls.normalize(vectors)
+        _n = _v.shape[0]
+        _n_lists = n_lists or max(1, int(np.sqrt(_n)))
+        _n_lists = min(_n_lists, _n)
+        _rng = np.random.default_rng(seed)
+        _train = _v[_rng.choice(_n, min(train_size, _n), replace = False)]
+        _centroids = _train[_rng.choice(_train.shape[0], _n_lists,
+                                        replace = False)]
+        for _ in range(n_iter):
+            _lists = cls.assignLists(_train, _centroids)
+            _sums = np.zeros_like(_centroids)
+            np.add.at(_sums, _lists, _train)
+            _empty = np.bincount(_lists, minlength = _n_lists) == 0
+            #Empty lists get random training vectors as centroids
+            _sums[_empty] = _train[_rng.choice(_train.shape[0],
+                                               int(_empty.sum()))]
+            _centroids = cls.normalize(_sums)
+        _lists = cls.assignLists(_v, _centroids)
+        _ids = np.argsort(_lists, kind = "stable")
+        _offsets = np.zeros(_n_lists + 1, dtype = np.int64)
+        np.cumsum(np.bincount(_lists, minlength = _n_lists),
+                  out = _offsets[1 :])
+        print(f"Index of {_n} vectors in {_n_lists} lists is built in " +
+              f"{time.perf_counter() - _start:.1f} sec")
+        return cls(_v[_ids], _ids, _offsets, _centroids, info)
+
+    def save(self, out_dir):
+        """
+        Save index into directory
+        Parameters:
+        - out_dir  -- directory to write index to
+        """
+        os.makedirs(out_dir, exist_ok = True)
+        np.save(f"{out_dir}/{self.fn_vectors}", self.vectors)
+        np.save(f"{out_dir}/{self.fn_ids}", self.ids)
+        np.save(f"{out_dir}/{self.fn_offsets}", self.list_offsets)
+        np.save(f"{out_dir}/{self.fn_centroids}", self.centroids)
+        with open(f"{out_dir}/{self.fn_info}", 'w') as _f:
+            json.dump(dict(self.info, n_vectors = self.n_vectors,
+                           dim = self.dim, n_lists = self.n_lists), _f)
+
+    @classmethod
+    def load(cls, in_dir, mmap = True):
+        """
+        Load saved index
+        Parameters:
+        - in_dir  -- directory with saved index
+        - mmap    -- flag to memmap vectors instead of reading them
+        Returns: VectorIndex object
+        """
+        try:
+            with open(f"{in_dir}/{cls.fn_info}") as _f:
+                _info = json.load(_f)
+            _vectors = np.load(f"{in_dir}/{cls.fn_vectors}",
+                               mmap_mode = "r" if mmap else None)
+            _ids = np.load(f"{in_dir}/{cls.fn_ids}")
+            _offsets = np.load(f"{in_dir}/{cls.fn_offsets}")
+            _centroids = np.load(f"{in_dir}/{cls.fn_centroids}")
+        except OSError as _err:
+            sys.exit(f"Cannot load vector index from {in_dir}: {_err}")
+        return cls(_vectors, _ids, _offsets, _centroids, _info)
+
+    @classmethod
+    def mergeTop(cls, scores, ids, new_scores, new_ids, k):
+        """
+        Merge top k candidates with new candidates
+        Parameters:
+        - scores, ids          -- 2D arrays of current top candidates
+        - new_scores, new_ids  -- 2D arrays of new candidates
+        - k                    -- number of top candidates to keep
+        Returns: merged arrays of top k scores and ids
+        """
+        _scores = np.concatenate([scores, new_scores], axis = 1)
+        _ids = np.concatenate([ids, new_ids], axis = 1)
+        if _scores.shape[1] > k:
+            _top = np.argpartition(-_scores, k - 1, axis = 1)[:, : k]
+            _scores = np.take_along_axis(_scores, _top, axis = 1)
+            _ids = np.take_along_axis(_ids, _top, axis = 1)
+        return _scores, _ids
+
+    @classmethod
+    def sortTop(cls, scores, ids):
+        """
+        Sort top candidates by descending scores
+        Returns: sorted arrays of scores and ids
+        """
+        _order = np.argsort(-scores, axis = 1, kind = "stable")
+        return np.take_along_axis(scores, _order, axis = 1), \
+            np.take_along_axis(ids, _order, axis = 1)
+
+    def searchBatch(self, queries, k, n_probe):
+        """
+        Find top k most similar vectors of batch of queries
+        Queries are grouped by probed lists, so each list is
+        compared with all its queries by one matrix product
+        Parameters:
+        - queries  -- normalized query vectors
+        - k        -- number of neighbours
+        - n_probe  -- number of probed lists
+        Returns: arrays of cosine similarities and ids of neighbours
+                 sorted by descending similarity
+                 Missing neighbours have id -1 and similarity -inf
+        """
+        _n_q = queries.shape[0]
+        _n_probe = min(n_probe, self.n_lists)
+        _c_scores = queries @ self.centroids.T
+        _probes = np.argpartition(-_c_scores, _n_probe - 1,
+                                  axis = 1)[:, : _n_probe]
+        _scores = np.full((_n_q, k), -np.inf, dtype = np.float32)
+        _ids = np.full((_n_q, k), -1, dtype = np.int64)
+        _probe_q = np.repeat(np.arange(_n_q), _n_probe)
+        _probe_l = _probes.reshape(-1)
+        _order = np.argsort(_probe_l, kind = "stable")
+        _probe_q = _probe_q[_order]
+        _probe_l = _probe_l[_order]
+        _bounds = np.flatnonzero(np.diff(_probe_l)) + 1
+        for _q, _l in zip(np.split(_probe_q, _bounds),
+                          np.split(_probe_l, _bounds)):
+            _l = _l[0]
+            _begin, _end = self.list_offsets[_l], self.list_offsets[_l + 1]
+            if _begin == _end:
+                continue
+            _sim = queries[_q] @ np.asarray(self.vectors[_begin : _end]).T
+            _k = min(k, _end - _begin)
+            _top = np.argpartition(-_sim, _k - 1, axis = 1)[:, : _k]
+            _new_scores, _new_ids = \
+                self.mergeTop(_scores[_q], _ids[_q],
+                              np.take_along_axis(_sim, _top, axis = 1),
+                              self.ids[_begin + _top], k)
+            _scores[_q] = _new_scores
+            _ids[_q] = _new_ids
+        return self.sortTop(_scores, _ids)
+
+    def search(self, queries, k = 10, n_probe = 8, batch = 1024):
+        """
+        Find top k most similar vectors of queries
+        Parameters:
+        - queries  -- 2D numpy array of query vectors
+        - k        -- number of neighbours
+        - n_probe  -- number of probed lists
+        - batch    -- number of queries processed at once
+        Returns: arrays of cosine similarities and ids of neighbours
+                 sorted by descending similarity
+        """
+        _q = self.normalize(queries)
+        _results = [self.searchBatch(_q[_i : _i + batch], k, n_probe)
+                    for _i in range(0, _q.shape[0], batch)]
+        return np.concatenate([_r[0] for _r in _results]), \
+            np.concatenate([_r[1] for _r in _results])
+
+    def bruteForce(self, queries, k = 10, batch = 1024, block = 65536):
+        """
+        Find exact top k most similar vectors of queries
+        Parameters:
+        - queries  -- 2D numpy array of query vectors
+        - k        -- number of neighbours
+        - batch    -- number of queries processed at once
+        - block    -- number of indexed vectors processed at once
+        Returns: arrays of cosine similarities and ids of neighbours
+                 sorted by descending similarity
+        """
+        _q_all = self.normalize(queries)
+        _all_scores = []
+        _all_ids = []
+        for _i in range(0, _q_all.shape[0], batch):
+            _q = _q_all[_i : _i + batch]
+            _scores = np.full((_q.shape[0], 0), -np.inf, dtype = np.float32)
+            _ids = np.full((_q.shape[0], 0), -1, dtype = np.int64)
+            for _j in range(0, self.n_vectors, block):
+                _sim = _q @ np.asarray(self.vectors[_j : _j + block]).T
+                _k = min(k, _sim.shape[1])
+                _top = np.argpartition(-_sim, _k - 1, axis = 1)[:, : _k]
+                _scores, _ids = self.mergeTop(
+                    _scores, _ids, np.take_along_axis(_sim, _top, axis = 1),
+                    self.ids[_j + _top], k)
+            _scores, _ids = self.sortTop(_scores, _ids)
+            _all_scores.append(_scores)
+            _all_ids.append(_ids)
+        return np.concatenate(_all_scores), np.concatenate(_all_ids)
+
+    @classmethod
+    def recall(cls, ids, exact_ids):
+        """
+        Compute recall of approximate search
+        Parameters:
+        - ids        -- ids of neighbours found by approximate search
+        - exact_ids  -- ids of neighbours found by exact search
+        Returns: fraction of exact neighbours found
+        """
+        _found = sum(np.intersect1d(_a, _e[_e >= 0]).shape[0]
+                     for _a, _e in zip(ids, exact_ids))
+        return _found / max(1, int((exact_ids >= 0).sum()))
+#---------------- End of class VectorIndex -------------------------
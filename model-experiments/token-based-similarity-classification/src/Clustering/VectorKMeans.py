@@ -3,8 +3,9 @@
 import sys
 import os
 import math
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
 sys.path.extend(["../BagOfTokens"])
 from DatasetLoader import BagOfTokensLoader
@@ -27,21 +28,133 @@ def setSeparation(s1, s2):
     """
     return min([sampleToSetDistance(s1[_i], s2)
                 for _i in range(s1.shape[0])])
+
+def squaredDistances(x, y, x_sq = None, y_sq = None):
+    """
+    Squared distances between all pairs of vectors of two sets
+    computed as |x|^2 + |y|^2 - 2xy with one matrix product
+    Parameters:
+    - x, y        -- 2D numpy arrays of vectors
+    - x_sq, y_sq  -- squared norms of vectors if they are precomputed
+    Returns: 2D numpy array of squared distances
+    """
+    x_sq = np.einsum("ij,ij->i", x, x) if x_sq is None else x_sq
+    y_sq = np.einsum("ij,ij->i", y, y) if y_sq is None else y_sq
+    _d = x_sq[:, None] + y_sq[None, :] - 2 * (x @ y.T)
+    #Rounding errors can make distances of close vectors negative
+    return np.maximum(_d, 0, out = _d)
+
+def setDiameter(samples, block = 1024):
+    """
+    Exact diameter of set of vectors
+    Distances are computed by blocks of pairs of the upper triangle
+    Parameters:
+    - samples  -- 2D numpy array of vectors
+    - block    -- number of vectors in block
+    Returns: maximum distance between vectors
+    """
+    _x = np.asarray(samples, dtype = np.float64)
+    _sq = np.einsum("ij,ij->i", _x, _x)
+    _d = 0.0
+    for _i in range(0, _x.shape[0], block):
+        for _j in range(_i, _x.shape[0], block):
+            _d = max(_d, float(np.max(squaredDistances(
+                _x[_i : _i + block], _x[_j : _j + block],
+                _sq[_i : _i + block], _sq[_j : _j + block]))))
+    return math.sqrt(_d)
+
+def blockedSetSeparation(s1, s2, block = 1024, s1_sq = None, s2_sq = None):
+    """
+    Separation of two sets of vectors computed by blocks of 
+    distances with running minimum
+    Parameters:
+    - s1, s2        -- 2D numpy arrays of vectors
+    - block         -- number of vectors in block
+    - s1_sq, s2_sq  -- squared norms of vectors if they are precomputed
+    Returns: minimum distance between vectors of the sets
+    """
+    s1_sq = np.einsum("ij,ij->i", s1, s1) if s1_sq is None else s1_sq
+    s2_sq = np.einsum("ij,ij->i", s2, s2) if s2_sq is None else s2_sq
+    _d = np.inf
+    for _i in range(0, s1.shape[0], block):
+        for _j in range(0, s2.shape[0], block):
+            _d = min(_d, float(np.min(squaredDistances(
+                s1[_i : _i + block], s2[_j : _j + block],
+                s1_sq[_i : _i + block], s2_sq[_j : _j + block]))))
+    return math.sqrt(_d)
+
+def fitKMeans(samples, n_clusters, seed = 0, backend = "kmeans",
+              batch = 1024):
+    """
+    Cluster samples by k-means
+    It is defined at module level to be run in a pool of processes
+    Parameters:
+    - samples     -- 2D numpy array of vectors
+    - n_clusters  -- number of clusters
+    - seed        -- random seed of k-means
+    - backend     -- k-means implementation:
+                     * "kmeans"    -- sklearn KMeans
+                     * "minibatch" -- sklearn MiniBatchKMeans
+    - batch       -- size of mini batches of MiniBatchKMeans
+    Returns:
+    - numpy array of centers of clusters
+    - numpy array of cluster labels of samples
+    - inertia of clustering
+    """
+    if backend == "minibatch":
+        _kmeans = MiniBatchKMeans(n_clusters = n_clusters,
+                                  batch_size = batch,
+                                  random_state = seed)
+    else:
+        _kmeans = KMeans(n_clusters = n_clusters, random_state = seed)
+    _kmeans.fit(samples)
+    return _kmeans.cluster_centers_, _kmeans.labels_, _kmeans.inertia_
+
+def approxSetDiameter(samples, n_iter = 4):
+    """
+    Approximate diameter of set of vectors by farthest point heuristic
+    Starting from the sample farthest from the mean, the farthest
+    sample from the current one is taken repeatedly. The result
+    is a lower bound of the diameter not less than half of it
+    Parameters:
+    - samples  -- 2D numpy array of vectors
+    - n_iter   -- maximum number of farthest point steps
+    Returns: approximate maximum distance between vectors
+    """
+    _x = np.asarray(samples, dtype = np.float64)
+    _i = int(np.argmax(np.linalg.norm(_x - _x.mean(axis = 0), axis = 1)))
+    _d = 0.0
+    for _ in range(n_iter):
+        _dist = np.linalg.norm(_x - _x[_i], axis = 1)
+        _j = int(np.argmax(_dist))
+        if _dist[_j] <= _d:
+            break
+        _d = float(_dist[_j])
+        _i = _j
+    return _d
 #--------------End of utility functions------------------------------
 
 class VectCluster(object):
     """
     Cluster of vectors
     """
-    def __init__(self, samples, center = None, inertia = None):
+    def __init__(self, samples, center = None, inertia = None,
+                 diameter_mode = "exact"):
         """   
+        Parameters:
+        - diameter_mode  -- computation of diameter:
+                            * "exact"  -- blocked all pairs distances
+                            * "approx" -- farthest point heuristic
         """
         self.samples = samples if isinstance(samples, np.ndarray) \
                        else np.stack(samples)
         self.n_samples = self.samples.shape[0]
         self.vect_len = self.samples.shape[1]
+        self.diameter_mode = diameter_mode
         self.centroid = center if center is not None else \
                         self.compCentroid()
+        #Distances of samples to centroid shared by statistics
+        self.radii = np.linalg.norm(self.samples - self.centroid, axis=1)
         self.inertia = inertia if inertia is not None else \
                        self.compInertia()
         self.rmsRadius = self.compRmsRadius()
@@ -58,18 +171,12 @@ class VectCluster(object):
     def compCentroid(self):
         """
         """
-        _l = self.samples.shape[0]
-        _v_dim = self.samples.shape[1]
-        _c = np.zeros(_v_dim)
-        for _i in range(_v_dim):
-            _c[_i] = np.sum(self.samples[:, _i])/_l
-        return np.stack(_c)
+        return np.mean(self.samples, axis=0, dtype=np.float64)
 
     def compInertia(self):
         """
         """
-        return np.sum(np.linalg.norm(
-            self.samples - self.centroid, axis=1) ** 2)
+        return np.dot(self.radii, self.radii)
 
     def compRmsRadius(self):
         """
@@ -79,64 +186,116 @@ class VectCluster(object):
     def compMaxRadius(self):
         """
         """    
-        return np.max(np.linalg.norm(
-            self.samples - self.centroid, axis=1))
+        return np.max(self.radii)
 
     def compAvrRadius(self):
         """
         """
-        #print("Checking np.linalg.norm\n")
-        #print(np.linalg.norm(
-        #    self.samples - self.centroid, axis=1))
-        #print("End of np.linalg.norm\n")
-        return np.average(np.linalg.norm(
-            self.samples - self.centroid, axis=1))
+        return np.average(self.radii)
 
     def compDiameter(self):
         """
         """
-        _d = 0
-        for _i in range(self.n_samples):
-            _d = max(_d, np.max(np.linalg.norm(
-                self.samples - self.samples[_i], axis=1)))
-        return _d
+        if self.diameter_mode == "approx":
+            return approxSetDiameter(self.samples)
+        return setDiameter(self.samples)
 #---------------- End of class VectCluster -----------------------------
 
 class SetOfClusters(object):
     """
     """
-    def __init__(self, clusters, centers = None, inertia = None):
+    def __init__(self, clusters, centers = None, inertia = None,
+                 diameter_mode = "exact", n_jobs = 1, block = 1024):
         """
+        Parameters:
+        - n_jobs  -- number of threads computing separations of clusters
+        - block   -- number of vectors in blocks of distances
         """
         self.clusters = \
             [VectCluster(_cluster, center = 
-                         centers[_i] if centers is not None else None)
+                         centers[_i] if centers is not None else None,
+                         diameter_mode = diameter_mode)
              for _i, _cluster in enumerate(clusters)]
+        self.diameter_mode = diameter_mode
         self.clust_centers = centers if centers is not None \
             else np.stack([_cluster.centroid for _cluster in self.clusters])
         self.n_clusters = len(self.clusters)
+        self.n_jobs = n_jobs
+        self.block = block
+        self._separations = None
+        self._center_separations = None
+        self._center_to_clust = None
+
+    def centersSeparationMatrix(self):
+        """
+        Matrix of distances between centers of clusters
+        """
+        if self._center_separations is None:
+            _c = np.asarray(self.clust_centers, dtype = np.float64)
+            self._center_separations = np.sqrt(squaredDistances(_c, _c))
+            np.fill_diagonal(self._center_separations, 0)
+        return self._center_separations
+
+    def centerToClustersMatrix(self):
+        """
+        Matrix of distances from centers of clusters (rows)
+        to other clusters (columns)
+        """
+        if self._center_to_clust is None:
+            _c = np.stack([_cluster.centroid 
+                           for _cluster in self.clusters]).astype(np.float64)
+            self._center_to_clust = np.stack(
+                [np.sqrt(np.min(squaredDistances(
+                    _c, self._floatSamples(_j)), axis=1))
+                 for _j in range(self.n_clusters)], axis=1)
+        return self._center_to_clust
+
+    def separationMatrix(self):
+        """
+        Matrix of separations of clusters, i.e. minimum distances
+        between their samples
+        Separations of pairs of clusters are computed by a pool
+        of threads, since matrix products release the GIL
+        """
+        if self._separations is not None:
+            return self._separations
+        _samples = [self._floatSamples(_i) for _i in range(self.n_clusters)]
+        _sq = [np.einsum("ij,ij->i", _s, _s) for _s in _samples]
+        _pairs = [(_i, _j) for _i in range(self.n_clusters)
+                  for _j in range(_i + 1, self.n_clusters)]
+        def _separation(_pair):
+            _i, _j = _pair
+            return blockedSetSeparation(_samples[_i], _samples[_j],
+                                        self.block, _sq[_i], _sq[_j])
+        with ThreadPoolExecutor(max_workers = self.n_jobs) as _pool:
+            _seps = list(_pool.map(_separation, _pairs))
+        self._separations = np.zeros((self.n_clusters, self.n_clusters))
+        for (_i, _j), _sep in zip(_pairs, _seps):
+            self._separations[_i, _j] = self._separations[_j, _i] = _sep
+        return self._separations
+
+    def _floatSamples(self, i):
+        """
+        Samples of cluster as float64 array
+        """
+        return np.asarray(self.clusters[i].samples, dtype = np.float64)
  
     def _clustCentersSeparation(self, i, j):
         """
         Distance between centers of two clusters
         """
-        return distance(self.clust_centers[i], 
-                        self.clust_centers[j])
+        return self.centersSeparationMatrix()[i, j]
 
     def _clustToCenterSeparation(self, i, j):
         """
         Distance from center of one cluster to other cluster
         """
-        return sampleToSetDistance(self.clusters[i].centroid,
-                                   self.clusters[j].samples)
+        return self.centerToClustersMatrix()[i, j]
 
     def _clustSeparation(self, i, j):
         """
         """
-        if self.clusters[i].n_samples > self.clusters[j].n_samples:
-            i,j = j,i
-        return setSeparation(self.clusters[i].samples,
-                             self.clusters[j].samples)
+        return self.separationMatrix()[i, j]
 
     def printClustCentersDistr(self):
         """
@@ -227,27 +386,41 @@ class VectorsClustered(VectCluster):
     """
     Clustered source code of problem solutions 
     """
-    def __init__(self, samples):
+    def __init__(self, samples, diameter_mode = "exact", n_jobs = 1):
         """
         """
-        super(VectorsClustered, self).__init__(samples)
+        super(VectorsClustered, self).__init__(
+            samples, diameter_mode = diameter_mode)
+        self.n_jobs = n_jobs
         self._random_seed = 0
 
-    def kmeansCluster(self, n_clusters):
+    def kmeansCluster(self, n_clusters, backend = "kmeans"):
         """
         Cluster samples into n clusters
         Parameters:
-        - n  -- number of clusters
-        """
-        _kmeans = KMeans(n_clusters = n_clusters, 
-                         random_state =
-                         self._random_seed).fit(self.samples)
-        self._kmeans_inertia = _kmeans.inertia_
-        self.clust_centers = _kmeans.cluster_centers_
-        self.n_clusters = n_clusters
-        self.labels = _kmeans.labels_
+        - n        -- number of clusters
+        - backend  -- k-means implementation: "kmeans" or "minibatch"
+        """
+        self.setClusters(*fitKMeans(self.samples, n_clusters,
+                                    seed = self._random_seed,
+                                    backend = backend))
+
+    def setClusters(self, centers, labels, inertia):
+        """
+        Set clusters computed by k-means
+        Parameters:
+        - centers  -- numpy array of centers of clusters
+        - labels   -- numpy array of cluster labels of samples
+        - inertia  -- inertia of clustering
+        """
+        self._kmeans_inertia = inertia
+        self.clust_centers = centers
+        self.n_clusters = centers.shape[0]
+        self.labels = labels
         self.clusters = SetOfClusters(self.clustersFromLabels(),
-                                      self.clust_centers)
+                                      self.clust_centers,
+                                      diameter_mode = self.diameter_mode,
+                                      n_jobs = self.n_jobs)
 
     def clustersFromLabels(self):
         """
@@ -31,8 +31,43 @@ def makeArgParserCodeML(description, task = "classification"):
                         help="fraction of training dataset for validation")
     parser.add_argument("--batch", default=32, type=int,
                         help="batch size")
+    parser.add_argument("--buckets", type=int, nargs='*', default=None,
+                        help="boundaries of sequence length buckets " +
+                        "for batching samples of similar lengths")
+    parser.add_argument("--shard", type=str, default="OFF",
+                        choices=["OFF", "DATA", "WORKER"],
+                        help="sharding of datasets among workers: " +
+                        "OFF - every worker iterates whole dataset, " +
+                        "DATA - TF auto sharding by batches, " +
+                        "WORKER - every worker makes only its part " +
+                        "of global batches")
+    parser.add_argument("--records", type=str, default=None,
+                        help="directory of datasets exported " +
+                        "into TFRecord files by ExportTfRecords.py")
     parser.add_argument("--seed_ds", type=int, default=101,
                         help = "seed for making randomized dataset")
+    parser.add_argument("--seed_mode", type=str, default="compat",
+                        choices=["compat", "streams"],
+                        help = "randomization of dataset: " + 
+                        "compat reproduces earlier datasets, " +
+                        "streams uses independent seed substreams")
+    parser.add_argument("--ds_jobs", type=int, default=1,
+                        help = "number of processes making dataset " +
+                        "in streams randomization mode")
+    parser.add_argument("--duplicates", type=str, default=None,
+                        help = "json file with clusters of near-duplicate " +
+                        "solutions made by NearDuplicates.py")
+    parser.add_argument("--dup_mode", type=str, default="collapse",
+                        choices=["collapse", "group"],
+                        help = "handling of near-duplicates: " +
+                        "collapse loads one solution of each cluster, " +
+                        "group keeps clusters within one split")
+    parser.add_argument("--manifest", type=str, default="none",
+                        choices=["none", "quick", "hash"],
+                        help = "verification of dataset against manifest " +
+                        "made by DsManifest.py at startup: " +
+                        "quick checks sizes and modification times, " +
+                        "hash checks hashes of all files")
     parser.add_argument("--seed_model", type=int, default=101,
                         help = "seed for making randomized model")    
     parser.add_argument("--dnn", default="basic",
@@ -0,0 +1,244 @@
+"""
+Program for detecting near-duplicate solutions of problems
+in tokenized dataset
+
+Near-duplicates are solutions with close sets of token shingles,
+i.e. sequences of several consecutive tokens. They are detected
+with MinHash and LSH (locality sensitive hashing) technique:
+- for each solution MinHash signature of its shingles is computed,
+  fraction of equal signature values estimates Jaccard similarity
+  of sets of shingles
+- signatures are split into bands, solutions having the same
+  values of at least one band are candidate near-duplicates
+- candidate pairs with estimated similarity not less than
+  threshold are near-duplicates; they are joined into clusters
+
+Solutions of each problem are processed independently
+by a pool of processes. Clusters of near-duplicates are
+written into json file with the following structure:
+{"settings": {<parameters of detection>},
+ "clusters": {<problem>: [[<solution>, ...], ...], ...}}
+Solutions of each cluster are sorted, the first one is
+the representative of the cluster.
+The file is used by dataset loaders with option --duplicates
+"""
+import sys
+import os
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+main_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.extend([f"{main_dir}/Dataset",
+                 f"{main_dir}/CommonFunctions"])
+from DsUtilities import getProblemSet
+
+#Multiplier of polynomial hashing of shingles
+SHINGLE_BASE = np.uint64(1000003)
+
+def readSolutions(fn):
+    """
+    Read tokenized solutions of problem
+    Parameters:
+    - fn  -- file with tokenized solutions of problem
+    Returns:
+    - list of names of solutions
+    - list of numpy arrays of tokens of solutions
+    """
+    _names = []
+    _tokens = []
+    with open(fn) as _f:
+        for _line in _f:
+            _name, _seq = _line.split(":")
+            _names.append(_name)
+            _tokens.append(np.fromstring(_seq, dtype = np.uint64, sep = ','))
+    return _names, _tokens
+
+def shingleHashes(tokens, k):
+    """
+    Compute hashes of unique shingles of tokens
+    Parameters:
+    - tokens  -- numpy array of tokens as uint64
+    - k       -- number of tokens in shingle
+    Returns: numpy array of unique hashes of shingles
+             Code shorter than k tokens is one shingle
+    """
+    _k = max(1, min(k, tokens.shape[0]))
+    _n = tokens.shape[0] - _k + 1
+    _h = np.zeros(max(_n, 1), dtype = np.uint64)
+    for _j in range(_k):
+        _h = _h * SHINGLE_BASE + tokens[_j : _j + _n] + np.uint64(1)
+    return np.unique(_h)
+
+def minHash(shingles, a, b, block = 4096):
+    """
+    Compute MinHash signature of set of shingles
+    Hash functions are (a * x + b) >> 32 in 64 bit arithmetic
+    Parameters:
+    - shingles  -- numpy array of hashes of shingles
+    - a, b      -- numpy arrays of parameters of hash functions
+    - block     -- number of shingles hashed at once
+    Returns: numpy array of minimum values of hash functions
+    """
+    _sig = np.full(a.shape[0], np.iinfo(np.uint64).max, dtype = np.uint64)
+    for _i in range(0, shingles.shape[0], block):
+        _h = (shingles[_i : _i + block, None] * a[None, :] + b[None, :]) \
+            >> np.uint64(32)
+        np.minimum(_sig, _h.min(axis = 0), out = _sig)
+    return _sig
+
+def hashParameters(n_perm, seed):
+    """
+    Make parameters of MinHash functions
+    Parameters:
+    - n_perm  -- number of hash functions
+    - seed    -- random seed
+    Returns: numpy arrays a and b of parameters
+    """
+    _rng = np.random.default_rng(seed)
+    _max = np.iinfo(np.uint64).max
+    _a = _rng.integers(1, _max, size = n_perm, dtype = np.uint64,
+                       endpoint = True) | np.uint64(1)
+    _b = _rng.integers(0, _max, size = n_perm, dtype = np.uint64,
+                       endpoint = True)
+    return _a, _b
+
+def lshClusters(signatures, bands, threshold):
+    """
+    Cluster near-duplicates by LSH banding of signatures
+    Parameters:
+    - signatures  -- 2D numpy array of MinHash signatures of solutions
+    - bands       -- number of bands of signatures
+    - threshold   -- minimum estimated Jaccard similarity
+                     of near-duplicates
+    Returns: list of clusters as lists of indices of solutions
+    """
+    _n, _n_perm = signatures.shape
+    _rows = _n_perm // bands
+    _parent = list(range(_n))
+    def _root(_i):
+        while _parent[_i] != _i:
+            _parent[_i] = _parent[_parent[_i]]
+            _i = _parent[_i]
+        return _i
+    _checked = set()
+    for _band in range(bands):
+        _buckets = {}
+        _keys = signatures[:, _band * _rows : (_band + 1) * _rows]
+        for _i in range(_n):
+            _buckets.setdefault(_keys[_i].tobytes(), []).append(_i)
+        for _bucket in _buckets.values():
+            for _k, _j in enumerate(_bucket[1 :], 1):
+                #Candidate is joined with the first similar solution
+                for _i in _bucket[: _k]:
+                    _ri, _rj = _root(_i), _root(_j)
+                    if _ri == _rj:
+                        break
+                    if (_i, _j) in _checked:
+                        continue
+                    _checked.add((_i, _j))
+                    if np.mean(signatures[_i] == signatures[_j]) >= \
+                       threshold:
+                        _parent[max(_ri, _rj)] = min(_ri, _rj)
+                        break
+    _clusters = {}
+    for _i in range(_n):
+        _clusters.setdefault(_root(_i), []).append(_i)
+    return [_c for _c in _clusters.values() if len(_c) > 1]
+
+def problemDuplicates(dataset, problem, shingle, n_perm, bands,
+                      threshold, seed):
+    """
+    Find near-duplicate solutions of problem
+    It is defined at module level to be run in a pool of processes
+    Parameters:
+    - dataset    -- directory with tokenized dataset
+    - problem    -- name of problem
+    - other parameters are described in lshClusters and hashParameters
+    Returns:
+    - problem
+    - number of solutions of problem
+    - list of clusters as sorted lists of names of solutions
+    """
+    _names, _tokens = readSolutions(f"{dataset}/{problem}.tkn")
+    _a, _b = hashParameters(n_perm, seed)
+    _signatures = np.stack([minHash(shingleHashes(_t, shingle), _a, _b)
+                            for _t in _tokens]) if _tokens else \
+        np.zeros((0, n_perm), dtype = np.uint64)
+    _clusters = [sorted(_names[_i] for _i in _c)
+                 for _c in lshClusters(_signatures, bands, threshold)]
+    _clusters.sort()
+    return problem, len(_names), _clusters
+
+def main(args):
+    """
+    Main function of program for detecting near-duplicates
+    Arguments are descibed below
+    """
+    if args.perms % args.bands:
+        sys.exit(f"Number of hash functions {args.perms} is not " +
+                 f"divisible by number of bands {args.bands}")
+    _problems = [_p for _p, _ in getProblemSet(args.dataset, 1, None)]
+    _jobs = [(args.dataset, _p, args.shingle, args.perms, args.bands,
+              args.threshold, args.seed) for _p in _problems]
+    _chunk = max(1, len(_jobs) // (4 * args.jobs))
+    with ProcessPoolExecutor(max_workers = args.jobs) as _pool:
+        _results = list(_pool.map(problemDuplicates, *zip(*_jobs),
+                                  chunksize = _chunk))
+    _clusters = {_p: _c for _p, _, _c in _results if _c}
+    _n_solutions = sum(_n for _, _n, _ in _results)
+    _n_clustered = sum(len(_c) for _cl in _clusters.values() for _c in _cl)
+    _n_clusters = sum(len(_cl) for _cl in _clusters.values())
+    _out = args.output or f"{args.dataset}/near_duplicates.json"
+    with open(_out, 'w') as _f:
+        json.dump({"settings": {"shingle":   args.shingle,
+                                "perms":     args.perms,
+                                "bands":     args.bands,
+                                "threshold": args.threshold,
+                                "seed":      args.seed},
+                   "clusters": _clusters}, _f, indent = 1)
+    print(f"{_n_solutions} solutions of {len(_problems)} problems " +
+          "are processed")
+    print(f"{_n_clustered} solutions are in {_n_clusters} clusters " +
+          "of near-duplicates")
+    print(f"Collapsing clusters removes {_n_clustered - _n_clusters} " +
+          f"({100.0 * (_n_clustered - _n_clusters) / max(1, _n_solutions):.2f}%) "
+          + "solutions")
+    print(f"Clusters are written into {_out}")
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nDETECTION OF NEAR-DUPLICATE SOLUTIONS IN TOKENIZED DATASET")
+
+    #Command-line arguments
+    parser = argparse.ArgumentParser(
+        description = "Detection of near-duplicate solutions " +
+        "in tokenized dataset")
+    parser.add_argument('dataset', type=str,
+                        help='directory with tokenized dataset')
+    parser.add_argument('--output', type=str, default=None,
+                        help='json file to write clusters of ' +
+                        'near-duplicates to; near_duplicates.json ' +
+                        'in dataset directory by default')
+    parser.add_argument('--shingle', default=5, type=int,
+                        help='number of tokens in shingle')
+    parser.add_argument('--perms', default=128, type=int,
+                        help='number of MinHash functions')
+    parser.add_argument('--bands', default=32, type=int,
+                        help='number of LSH bands of signatures')
+    parser.add_argument('--threshold', default=0.9, type=float,
+                        help='minimum estimated Jaccard similarity ' +
+                        'of shingles of near-duplicates')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='random seed of MinHash functions')
+    parser.add_argument('--jobs', default=os.cpu_count(), type=int,
+                        help='number of processes')
+    args = parser.parse_args()
+
+    print("Parameter settings used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    main(args)
@@ -17,9 +17,9 @@ import os
 import math
 from abc import ABC, abstractmethod
 import numpy as np
-import random
 import json
 from DsUtilities import *
+from Manifest import readManifest, verifyManifest
 
 class WrongToken(Exception):
     """
@@ -37,6 +37,83 @@ class SeqOfTokensLoader(ABC):
     Child classes should reimplement method makeSample
     transforming sequence of tokens into sample to classify
     """    
+    #Clusters of near-duplicate solutions found by NearDuplicates.py
+    #Dictionary of problems, its values are dictionaries mapping 
+    #names of clustered solutions to representatives of their clusters
+    duplicates = None
+    #Handling of near-duplicates:
+    # - "collapse" -- only representatives of clusters are loaded
+    # - "group"    -- solutions of cluster are placed together and
+    #                 splits of dataset do not separate them
+    dup_mode = "collapse"
+    #Verification of dataset manifest made by DsManifest.py:
+    # - None     -- dataset is not verified
+    # - "quick"  -- sizes and modification times are verified
+    # - "hash"   -- hashes of all files are verified
+    manifest_check = None
+    #Directories of datasets already verified
+    verified_dirs = set()
+
+    @classmethod
+    def setManifestCheck(cls, mode):
+        """
+        Set verification of dataset manifest used by all loaders
+        Parameters:
+        - mode  -- "none", "quick" or "hash"
+        """
+        SeqOfTokensLoader.manifest_check = None if mode == "none" else mode
+
+    @classmethod
+    def checkManifest(cls, dir_name):
+        """
+        Verify dataset directory against its manifest
+        Exit if manifest is not found or dataset is corrupted
+        Parameters:
+        - dir_name  -- directory with tokenized dataset
+        """
+        _dir = os.path.realpath(dir_name)
+        if not cls.manifest_check or _dir in cls.verified_dirs:
+            return
+        _manifest = readManifest(dir_name)
+        if _manifest is None:
+            sys.exit(f"Manifest of dataset {dir_name} is not found; " +
+                     "make it with DsManifest.py")
+        _errors, _warnings, _ = verifyManifest(
+            dir_name, _manifest, full_hash = cls.manifest_check == "hash")
+        for _w in _warnings:
+            print(f"Warning: {_w}")
+        if _errors:
+            for _e in _errors:
+                print(f"Error: {_e}")
+            sys.exit(f"Dataset {dir_name} does not match its manifest: " +
+                     f"{len(_errors)} errors")
+        cls.verified_dirs.add(_dir)
+        print(f"Dataset {dir_name} matches its manifest")
+
+    @classmethod
+    def setDuplicates(cls, fn, mode = "collapse"):
+        """
+        Set clusters of near-duplicates used by all loaders
+        Parameters:
+        - fn    -- json file with clusters written by NearDuplicates.py
+                   If it is None near-duplicates are not handled
+        - mode  -- handling of near-duplicates: "collapse" or "group"
+        """
+        SeqOfTokensLoader.dup_mode = mode
+        if fn is None:
+            SeqOfTokensLoader.duplicates = None
+            return
+        try:
+            with open(fn) as _f:
+                _clusters = json.load(_f)["clusters"]
+        except (OSError, ValueError, KeyError) as _err:
+            sys.exit(f"Cannot read clusters of near-duplicates {fn}: {_err}")
+        SeqOfTokensLoader.duplicates = \
+            {_p: {_s: _c[0] for _c in _cl for _s in _c}
+             for _p, _cl in _clusters.items()}
+        print(f"Near-duplicates of {len(_clusters)} problems are " +
+              f"handled in {mode} mode")
+
     def __init__(self, dir_name, min_n_solutions = 1,
                  problem_list = None, max_n_problems = None,
                  short_code_th = 4, long_code_th = None,
@@ -70,6 +147,7 @@ class SeqOfTokensLoader(ABC):
         else:
             self.long_code_th = sys.maxsize
         self.dir_name = dir_name
+        self.checkManifest(self.dir_name)
         self._min_n_solutions = min_n_solutions
         self._max_n_problems = max_n_problems
         self.report_dir = report_dir
@@ -118,6 +196,8 @@ class SeqOfTokensLoader(ABC):
         #       <solution name, its length>
         self._long_solutions = {}
         self._short_solutions = {}
+        #Number of near-duplicates skipped in collapse mode
+        self.n_collapsed = 0
 
     def _registerSolution(self, reg_dict, name, data):
         """
@@ -219,6 +299,8 @@ class SeqOfTokensLoader(ABC):
         print(f"Successfully loaded {len(_samples)} code solutions " +
               f"for {_i} problems")
         print(f"Longest code has {self.code_max_length} tokens\n")
+        if self.n_collapsed:
+            print(f"{self.n_collapsed} near-duplicate solutions are skipped")
         self.reportWrongLengthCode()
         self.n_labels = len(self.problems)
         return _samples, _problem_solutions, _sample_names
@@ -262,9 +344,9 @@ class SeqOfTokensLoader(ABC):
              for _i in range(1, len(_problem_sol_indices))]
         #Randomize order of solutions of each problem individually
         DataRand.setSeed("PROBLEM_SOLUTIONS_SEED")
-        for _l in _named_probl_sols:
+        for _i, _l in enumerate(_named_probl_sols):
             _l.sort(key = lambda _s: _s[0])
-            random.shuffle(_l)
+            DataRand.shuffle(_l, "PROBLEM_SOLUTIONS_SEED", _i)
         _sample_names, _samples = zip(*_named_samples)
         _sample_names = list(_sample_names)
         _samples = list(_samples)
@@ -276,6 +358,15 @@ class SeqOfTokensLoader(ABC):
             [_sample_names[_problem_sol_indices[_i - 1] :
                            _problem_sol_indices[_i]]
              for _i in range(1, len(_problem_sol_indices))]
+        if self.duplicates and self.dup_mode == "group":
+            for _i, _problem in enumerate(self.problems):
+                _order = self.groupDuplicates(
+                    [self.duplicateKey(_problem, _s)
+                     for _s in _solution_names[_i]])
+                _problems_solutions[_i] = \
+                    [_problems_solutions[_i][_k] for _k in _order]
+                _solution_names[_i] = \
+                    [_solution_names[_i][_k] for _k in _order]
         return _problems_solutions, _solution_names
 
     def getPartitionedSampesOld(self):
@@ -300,9 +391,9 @@ class SeqOfTokensLoader(ABC):
              for _i in range(1, len(_problem_sol_indices))]
         #Randomize order of solutions of each problem individually
         DataRand.setSeed("PROBLEM_SOLUTIONS_SEED")
-        for _l in _named_probl_sols:
+        for _i, _l in enumerate(_named_probl_sols):
             _l.sort(key = lambda _s: _s[0])
-            random.shuffle(_l)
+            DataRand.shuffle(_l, "PROBLEM_SOLUTIONS_SEED", _i)
         _problems_solutions = \
             [_samples[_problem_sol_indices[_i - 1] :
                       _problem_sol_indices[_i]]
@@ -333,9 +424,9 @@ class SeqOfTokensLoader(ABC):
                             _problem_sol_indices[_i]]
              for _i in range(1, len(_problem_sol_indices))]
         DataRand.setSeed("PROBLEM_SOLUTIONS_SEED")
-        for _l in _named_probl_sols:
+        for _i, _l in enumerate(_named_probl_sols):
             _l.sort(key = lambda _s: _s[0])
-            random.shuffle(_l)
+            DataRand.shuffle(_l, "PROBLEM_SOLUTIONS_SEED", _i)
         _sample_names, _samples = zip(*_named_samples)
         _sample_names = list(_sample_names)
         _samples = list(_samples)
@@ -348,8 +439,69 @@ class SeqOfTokensLoader(ABC):
         DataRand.randPreordered(_samples, "ALL_SOLUTIONS_SEED")
         DataRand.randPreordered(_labels, "ALL_SOLUTIONS_SEED")
         DataRand.randPreordered(_sample_names, "ALL_SOLUTIONS_SEED")
+        if self.duplicates and self.dup_mode == "group":
+            _order = self.groupDuplicates(
+                [self.duplicateKey(self.problems[_l], _s)
+                 for _l, _s in zip(_labels, _sample_names)])
+            _samples = [_samples[_k] for _k in _order]
+            _labels = [_labels[_k] for _k in _order]
+            _sample_names = [_sample_names[_k] for _k in _order]
         return _samples, _labels, _sample_names
 
+    def duplicateKey(self, problem, solution):
+        """
+        Get cluster of near-duplicates of solution
+        Parameters:
+        - problem   -- name of problem
+        - solution  -- name of solution
+        Returns: pair <problem, representative of cluster>
+                 or None if solution has no near-duplicates
+        """
+        if not self.duplicates:
+            return None
+        _rep = self.duplicates.get(problem, {}).get(solution)
+        return None if _rep is None else (problem, _rep)
+
+    def groupDuplicates(self, keys):
+        """
+        Order samples so that near-duplicates follow the first
+        sample of their cluster, other samples keep their order
+        Parameters:
+        - keys  -- list of clusters of samples as returned
+                   by duplicateKey
+        Returns: list of indices of samples in the new order
+        """
+        _first = {}
+        _pos = [_i if _k is None else _first.setdefault(_k, _i)
+                for _i, _k in enumerate(keys)]
+        return sorted(range(len(keys)), key = lambda _i: (_pos[_i], _i))
+
+    def splitPoint(self, keys, index):
+        """
+        Move point of splitting list of samples so that near-duplicates
+        grouped by groupDuplicates are not separated
+        The point is moved forward, or backward if cluster extends
+        to the end of list
+        Parameters:
+        - keys   -- list of clusters of samples as returned
+                    by duplicateKey
+        - index  -- index of the first sample of the second part
+        Returns: index of the first sample of the second part
+        """
+        if not self.duplicates or self.dup_mode != "group":
+            return index
+        _inside = lambda _j: 0 < _j < len(keys) and \
+            keys[_j] is not None and keys[_j] == keys[_j - 1]
+        _j = index
+        while _inside(_j):
+            _j += 1
+        if _j < len(keys):
+            return _j
+        _j = index
+        while _inside(_j):
+            _j -= 1
+        return _j if _j > 0 else index
+
     def getShuffledLabeledSamplesOld(self):
         """
         Load tokenized samples of all solutions of programming problems,
@@ -425,6 +577,11 @@ class SeqOfTokensLoader(ABC):
                     self._registerSolution(self._long_solutions,
                                     problem, (_solution, _n_tokens))
                     continue
+                if self.dup_mode == "collapse" and \
+                   self.duplicateKey(problem, _solution) not in \
+                   (None, (problem, _solution)):
+                    self.n_collapsed += 1
+                    continue
                 _n_solutions += 1
                 _n_all_tokens += _n_tokens
                 _min_n_tokens = min(_min_n_tokens, _n_tokens)
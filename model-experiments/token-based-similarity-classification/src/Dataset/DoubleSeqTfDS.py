@@ -1,6 +1,8 @@
 """
 Module for constracting TF dataset 
 from two lists of sequences of tokens and array of labels
+Sequences of tokens are held in ragged tensors, batches are 
+gathered and padded in TF graph
 """
 import sys
 import os
@@ -10,7 +12,7 @@ import numpy as np
 import tensorflow as tf
 
 from TokensSimilDS import SimilarityDSMaker
-from DsUtilities  import makeShardOptions
+from DsUtilities  import makeRaggedTokens, paddedRows, indexedDataset
 
 class genConstructor():
     """
@@ -61,7 +63,9 @@ class DoubleSeqTfDataset():
         """
         Make TF dataset from two lists of sequences of tokens 
         and array of labels
-        The constructed dtaset of TensorFlow Dataset of from_generator type
+        Sequences are stored in ragged tensor of tokens.
+        Each distinct sequence object is stored once, 
+        even if it is used in many samples
         Parameters:
         - seq1         -- 1-st sequence of tokens
         - seq2         -- 2-nd sequence of tokens
@@ -72,35 +76,87 @@ class DoubleSeqTfDataset():
                         * "OFF"  -- AutoShardPolicy.OFF
                         " "DATA" -- AutoShardPolicy.DATA
         Returns:
-        - Tensorflow dataset combined from 
-          * two tensorflow datasets representing each sequence of tokens; and
-          * tensorflow dataset rezenting labels 
+        - Tensorflow dataset of batches of:
+          * pairs of padded sequences of tokens; and
+          * labels 
         """
-        _ds1 = cls.dsFromGenerator(seq1, batch_size)
-        _ds2 = cls.dsFromGenerator(seq2, batch_size)
-        _ds = tf.data.Dataset.zip((_ds1, _ds2))
-        _t_labels  = tf.convert_to_tensor(labels)
-        _l = tf.data.Dataset.from_tensor_slices(_t_labels)
-        _ds = tf.data.Dataset.zip((_ds, _l))
-        _ds_options = makeShardOptions(policy = shard)
-        _ds = _ds.batch(batch_size).with_options(_ds_options)
-        return _ds
+        #Indices of distinct sequences are found by object identity,
+        #as same solution is the same list object in all samples
+        _seq_indices = {}
+        _sequences = []
+        def _index(seq):
+            _idx = _seq_indices.get(id(seq))
+            if _idx is None:
+                _idx = len(_sequences)
+                _seq_indices[id(seq)] = _idx
+                _sequences.append(seq)
+            return _idx
+        _idx1 = np.fromiter(map(_index, seq1), dtype = np.int64,
+                            count = len(seq1))
+        _idx2 = np.fromiter(map(_index, seq2), dtype = np.int64,
+                            count = len(seq2))
+        return cls.makeIndexedDataset(_sequences, _idx1, _idx2, labels,
+                                      batch_size, shard = shard)
+
+    @classmethod
+    def makeIndexedDataset(cls, sequences, idx1, idx2, labels, batch_size,
+                           shard = "OFF"):
+        """
+        Make TF dataset of pairs of sequences of tokens 
+        specified with their indices in list of sequences
+        Sequences used by the dataset, or by its part of input pipeline
+        in "WORKER" shard mode, are stored in ragged tensor of tokens
+        Batches are gathered and padded in TF graph in parallel
+        Samples are dropped to make the dataset multiple of batch size
+        Parameters:
+        - sequences    -- list of sequences of tokens
+        - idx1         -- numpy array of indices of 1-st sequences
+        - idx2         -- numpy array of indices of 2-nd sequences
+        - labels       -- labels as numpy array
+                          If labels is None, the dataset is test dataset
+        - batch_size   -- batch size
+        - shard      -- option to shard dataset:
+                        * "OFF"    -- AutoShardPolicy.OFF
+                        * "DATA"   -- AutoShardPolicy.DATA
+                        * "WORKER" -- each worker makes its part of 
+                                      batches, see indexedDataset
+        Returns:
+        - Tensorflow dataset of batches of:
+          * pairs of padded sequences of tokens; and
+          * labels, if they are defined
+          In "WORKER" shard mode function making that dataset
+          is returned
+        """
+        _n = (idx1.shape[0] // batch_size) * batch_size
+        if labels is None:
+            return indexedDataset(
+                sequences, (idx1[: _n], idx2[: _n]), batch_size,
+                lambda _tokens, _i1, _i2: (paddedRows(_tokens, _i1),
+                                           paddedRows(_tokens, _i2)),
+                n_indices = 2, shard = shard)
+        return indexedDataset(
+            sequences, (idx1[: _n], idx2[: _n], labels[: _n]), batch_size,
+            lambda _tokens, _i1, _i2, _l: ((paddedRows(_tokens, _i1),
+                                            paddedRows(_tokens, _i2)), _l),
+            n_indices = 2, shard = shard)
 
     @classmethod
     def dsFromGenerator(cls, samples, batch_size):
         """
-        Make TF dataset from samples generator,
+        Make TF dataset of sequences of tokens,
         defined with list of sequences
+        Sequences are padded to the longest one of their batch,
+        but the dataset is not batched
         Parameters:
         - samples    -- list of samples (sequences of tokens)
         - batch_size -- batch size
         Returns: TF dataset
         """
-        _s = tf.data.Dataset.from_generator(
-            lambda: samples, output_signature=(
-                tf.TensorSpec(shape=([None]), dtype=tf.int32)))
-        _s = _s.padded_batch(batch_size, padding_values = 0,
-                             drop_remainder=True)
+        _tokens = makeRaggedTokens(samples)
+        _s = tf.data.Dataset.range(len(samples))
+        _s = _s.batch(batch_size, drop_remainder = True)
+        _s = _s.map(lambda _i: paddedRows(_tokens, _i),
+                    num_parallel_calls = tf.data.AUTOTUNE)
         _s = _s.unbatch()
         return _s
 
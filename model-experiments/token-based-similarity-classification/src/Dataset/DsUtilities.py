@@ -8,6 +8,8 @@ from abc import ABC, abstractmethod
 import numpy as np
 import random
 import json
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 import tensorflow as tf
 
 def getProblemSet(ds, n_solutions_th, max_n_problems):
@@ -64,8 +66,8 @@ def makeShardOptions(policy = "OFF"):
     Parameters:
     - policy  -- policy to shard dataset:
                  * "OFF"    -- AutoShardPolicy.OFF
-                * "DATA" -- AutoShardPolicy.DATA
-Returns: dataset options
+                 * "DATA"   -- AutoShardPolicy.DATA
+    Returns: dataset options
     """
     #Setting TF sharding policy for multi GPU mode. 
     #It should be either OFF or DATA
@@ -75,10 +77,232 @@ Returns: dataset options
             tf.data.experimental.AutoShardPolicy.OFF
     elif policy == "DATA":
         _options.experimental_distribute.auto_shard_policy = \
-            tf.data.experimental.AutoShardPolicy.OFF
+            tf.data.experimental.AutoShardPolicy.DATA
     else:
         sys.exit(f"Invalid shard policy {policy}")
     return _options
+
+def workerSlice(array, batch_size, input_context):
+    """
+    Select part of each global batch processed by one input pipeline
+    of distribution strategy
+    Parts of global batch are assigned to pipelines in order of 
+    their replicas, so the outputs gathered from all replicas 
+    follow the order of samples of the whole dataset
+    Parameters:
+    - array         -- numpy array with length multiple of batch size
+    - batch_size    -- global batch size,
+                       multiple of number of input pipelines
+    - input_context -- tf.distribute.InputContext of input pipeline
+    Returns: numpy array of samples of the input pipeline
+    """
+    _n = input_context.num_input_pipelines
+    if batch_size % _n:
+        sys.exit(f"Batch size {batch_size} is not divisible by " +
+                 f"number of input pipelines {_n} in WORKER shard mode")
+    _batches = array.reshape(array.shape[0] // batch_size, _n,
+                             batch_size // _n)
+    return _batches[:, input_context.input_pipeline_id].reshape(-1)
+
+def indexedRows(samples, indices):
+    """
+    Make ragged tensor of samples referred by indices
+    Only referred samples are stored, each of them once
+    Parameters:
+    - samples  -- list of samples (sequences of tokens)
+    - indices  -- list of numpy arrays of indices of samples
+    Returns:
+    - tf.RaggedTensor of referred samples
+    - list of numpy arrays of indices of the samples 
+      in the ragged tensor
+    """
+    _rows, _inverse = np.unique(np.concatenate(indices),
+                                return_inverse = True)
+    _tokens = makeRaggedTokens([samples[_r] for _r in _rows])
+    _bounds = np.cumsum([0] + [_i.shape[0] for _i in indices])
+    return _tokens, [_inverse[_b : _e] 
+                     for _b, _e in zip(_bounds[: -1], _bounds[1 :])]
+
+def indexedDataset(samples, arrays, batch_size, make_batch,
+                   n_indices = 1, shard = "OFF"):
+    """
+    Make TF dataset of batches gathered by indices of samples
+    Samples referred by the dataset are stored in ragged tensor,
+    which is made from the part of the dataset of input pipeline
+    in "WORKER" shard mode
+    Parameters:
+    - samples     -- list of samples (sequences of tokens)
+    - arrays      -- tuple of numpy arrays of sample indices and labels
+                     Their lengths are multiple of batch size
+    - batch_size  -- global batch size
+    - make_batch  -- function making batch of dataset from 
+                     ragged tensor of samples and 
+                     batches of elements of the arrays
+    - n_indices   -- number of first arrays with sample indices
+    - shard       -- option to shard dataset:
+                     * "OFF"    -- AutoShardPolicy.OFF
+                     * "DATA"   -- AutoShardPolicy.DATA
+                     * "WORKER" -- each input pipeline of distribution
+                                   strategy makes only its part of 
+                                   every global batch
+    Returns: TF dataset, or if shard is "WORKER" function making 
+             TF dataset of input pipeline from its input context
+             to be distributed with function distributeDataset
+    """
+    def _makeDs(arrays, batch_size, policy):
+        _tokens, _indices = indexedRows(samples, arrays[: n_indices])
+        _ds = tf.data.Dataset.from_tensor_slices(
+            tuple(_indices) + tuple(arrays[n_indices :]))
+        _ds = _ds.batch(batch_size, drop_remainder = True)
+        _ds = _ds.map(lambda *_batch: make_batch(_tokens, *_batch),
+                      num_parallel_calls = tf.data.AUTOTUNE)
+        _ds_options = makeShardOptions(policy = policy)
+        return _ds.with_options(_ds_options).prefetch(tf.data.AUTOTUNE)
+    if shard != "WORKER":
+        return _makeDs(arrays, batch_size, shard)
+    def _workerDs(input_context):
+        return _makeDs(tuple(workerSlice(_a, batch_size, input_context)
+                             for _a in arrays),
+                       input_context.get_per_replica_batch_size(batch_size),
+                       "OFF")
+    return _workerDs
+
+def distributeDataset(strategy, ds, transform = None):
+    """
+    Prepare dataset made by function indexedDataset 
+    for distribution strategy
+    Parameters:
+    - strategy   -- tf.distribute strategy
+    - ds         -- TF dataset, or function making TF dataset
+                    of input pipeline from its input context
+    - transform  -- function applied to TF dataset of batches,
+                    e.g. for shuffling or repeating them
+    Returns: TF dataset or distributed dataset
+    """
+    _transform = transform if transform is not None else lambda _ds: _ds
+    if callable(ds):
+        return strategy.distribute_datasets_from_function(
+            lambda _context: _transform(ds(_context)))
+    return _transform(ds)
+
+def makeRaggedTokens(samples):
+    """
+    Make ragged tensor of token sequences
+    All sequences are stored in one flat buffer of tokens 
+    and row splits indicating where each of them starts and ends
+    Parameters:
+    - samples  -- list of samples (sequences of tokens)
+    Returns: tf.RaggedTensor, its i-th row is i-th sample
+    """
+    _row_splits = np.zeros(len(samples) + 1, dtype = np.int64)
+    np.cumsum(np.fromiter(map(len, samples), dtype = np.int64,
+                          count = len(samples)),
+              out = _row_splits[1 :])
+    _tokens = np.fromiter(chain.from_iterable(samples), dtype = np.int32,
+                          count = int(_row_splits[-1]))
+    return tf.RaggedTensor.from_row_splits(_tokens, _row_splits,
+                                           validate = False)
+
+def paddedRows(tokens, indices):
+    """
+    Gather rows of ragged tensor of token sequences 
+    and pad them with 0 to the longest of them
+    Parameters:
+    - tokens   -- tf.RaggedTensor of token sequences
+    - indices  -- tensor of indices of rows to gather
+    Returns: dense tensor of gathered token sequences
+    """
+    return tf.gather(tokens, indices).to_tensor(default_value = 0)
+
+def bucketOrder(lengths, batch_size, boundaries, rng = None):
+    """
+    Order samples into batches of samples of similar lengths
+    Samples are distributed into buckets by their lengths.
+    Each bucket is split into full batches. Samples left in all 
+    buckets are joined in order of buckets and split into batches.
+    Samples not filling the last batch are placed at the end.
+    Parameters:
+    - lengths     -- numpy array of lengths of samples
+    - batch_size  -- batch size
+    - boundaries  -- ascending list of lengths separating buckets
+    - rng         -- numpy random generator for shuffling batches
+                     If it is None, batches are ordered by buckets
+    Returns: numpy array with permutation of sample indices.
+             Its first (len(lengths) // batch_size) * batch_size 
+             elements are indices of samples of consecutive batches
+    """
+    _buckets = np.digitize(lengths, boundaries)
+    _sorted = np.argsort(_buckets, kind = "stable")
+    _bounds = np.searchsorted(_buckets[_sorted],
+                              np.arange(len(boundaries) + 2))
+    _full = []
+    _left = []
+    for _b in range(len(boundaries) + 1):
+        _idx = _sorted[_bounds[_b] : _bounds[_b + 1]]
+        _n_full = (_idx.shape[0] // batch_size) * batch_size
+        _full.append(_idx[: _n_full])
+        _left.append(_idx[_n_full :])
+    _order = np.concatenate(_full + _left)
+    _n_batches = _order.shape[0] // batch_size
+    _batches = _order[: _n_batches * batch_size].reshape(_n_batches,
+                                                         batch_size)
+    if rng is not None:
+        _batches = _batches[rng.permutation(_n_batches)]
+    return np.concatenate((_batches.reshape(-1),
+                           _order[_n_batches * batch_size :]))
+
+def paddingRatio(order, batch_size, *lengths):
+    """
+    Compute fraction of padding tokens in batches of samples 
+    padded to the longest sample of the batch
+    Parameters:
+    - order       -- numpy array of indices of samples in batch order
+                     Samples not filling the last batch are ignored
+    - batch_size  -- batch size
+    - lengths     -- numpy arrays of lengths of sequences
+                     of each input of samples 
+    Returns: fraction of padding tokens
+    """
+    _n = (order.shape[0] // batch_size) * batch_size
+    _n_tokens = 0
+    _n_padded = 0
+    for _l in lengths:
+        _b = _l[order[: _n]].reshape(-1, batch_size)
+        _n_tokens += int(_b.sum())
+        _n_padded += int(_b.max(axis = 1).sum()) * batch_size
+    return 1.0 - float(_n_tokens) / _n_padded if _n_padded else 0.0
+
+def reportPadding(order, batch_size, *lengths):
+    """
+    Print fraction of padding tokens in batches of samples
+    made in original order and in the given order
+    Parameters:
+    - order       -- numpy array of indices of samples in batch order
+    - batch_size  -- batch size
+    - lengths     -- numpy arrays of lengths of sequences
+                     of each input of samples 
+    """
+    _plain = paddingRatio(np.arange(order.shape[0]), batch_size, *lengths)
+    _bucketed = paddingRatio(order, batch_size, *lengths)
+    print(f"Padded tokens: {100.0 * _plain:.2f}% without buckets, " +
+          f"{100.0 * _bucketed:.2f}% with length buckets")
+
+def mapJobs(func, jobs, n_jobs = 1):
+    """
+    Apply function to arguments of each job
+    Jobs are run in a pool of processes if n_jobs > 1
+    Parameters:
+    - func    -- function to apply. 
+                 It should be defined at module level to be pickled
+    - jobs    -- list of tuples of function arguments
+    - n_jobs  -- number of processes to use
+    Returns: list of function results in the order of jobs
+    """
+    if n_jobs <= 1 or len(jobs) <= 1:
+        return [func(*_args) for _args in jobs]
+    _chunk = max(1, len(jobs) // (4 * n_jobs))
+    with ProcessPoolExecutor(max_workers = n_jobs) as _pool:
+        return list(_pool.map(func, *zip(*jobs), chunksize = _chunk))
 #------------- End of utility functions -------------------
 
 class DataRand:
@@ -107,18 +331,40 @@ class DataRand:
         #Shuffle balanced validation dataset seed
         "VALID_SHUFFLE_SEED":  1961,
         #Shuffle balanced training dataset seed
-        "TRAIN_SHUFFLE_SEED":  1980}
+        "TRAIN_SHUFFLE_SEED":  1980,
+        #Shuffle batches of length buckets
+        "BUCKET_SHUFFLE_SEED": 1991}
+
+    #Mode of randomization:
+    # * "compat"  -- global generator of module random is reseeded
+    #                with the named seeds. It reproduces datasets made
+    #                by earlier versions of the package
+    # * "streams" -- each randomization procedure uses its own
+    #                numpy generator made from SeedSequence substream 
+    #                of the named seed, keyed by problem or shard.
+    #                Results do not depend on the order of execution
+    #                of the procedures and they can run in parallel
+    mode = "compat"
+    #Number of processes used for making datasets in "streams" mode
+    n_jobs = 1
 
     @classmethod
-    def setDsSeeds(cls, seed):
+    def setDsSeeds(cls, seed, mode = "compat", n_jobs = 1):
         """
         Setup all seeds used in dataset construction
         Function should be executed only once before making all datasets
         Parameters:
         - seed   -- starting value of all dataset related seeds
+        - mode   -- mode of randomization: either "compat" or "streams"
+        - n_jobs -- number of processes for making datasets
+                    It is used only in "streams" mode
         """
+        if mode not in ("compat", "streams"):
+            sys.exit(f"Invalid randomization mode {mode}")
         for _k in cls.seeds.keys():
             cls.seeds[_k] += seed
+        cls.mode = mode
+        cls.n_jobs = max(1, n_jobs) if mode == "streams" else 1
         
     @classmethod
     def setSeed(cls, seed_name):
@@ -129,6 +375,49 @@ class DataRand:
         """
         random.seed(cls.seeds[seed_name])
 
+    @classmethod
+    def seedSequence(cls, seed_name, *keys):
+        """
+        Make independent substream of the named seed 
+        Parameters:
+        - seed_name  -- name of the seed
+        - keys       -- non negative integers identifying the substream,
+                        e.g. index of problem or shard
+        Returns: numpy SeedSequence
+        """
+        return np.random.SeedSequence(cls.seeds[seed_name],
+                                      spawn_key = tuple(keys))
+
+    @classmethod
+    def generator(cls, seed_name, *keys):
+        """
+        Make numpy random generator of substream of the named seed 
+        Parameters:
+        - seed_name  -- name of the seed
+        - keys       -- non negative integers identifying the substream
+        Returns: numpy random Generator
+        """
+        return np.random.default_rng(cls.seedSequence(seed_name, *keys))
+
+    @classmethod
+    def shuffle(cls, l, seed_name, *keys):
+        """
+        Shuffle list in place 
+        In "compat" mode global generator of module random is used.
+        It should be seeded before with setSeed.
+        In "streams" mode the list is shuffled with the generator
+        of substream of the named seed
+        Parameters:
+        - l          -- list of elements to shuffle
+        - seed_name  -- name of the seed
+        - keys       -- non negative integers identifying the substream
+        """
+        if cls.mode == "compat":
+            random.shuffle(l)
+        else:
+            _perm = cls.generator(seed_name, *keys).permutation(len(l))
+            l[:] = [l[_i] for _i in _perm]
+
     @classmethod
     def randPreordered(cls, l, seed):
         """
@@ -140,6 +429,9 @@ class DataRand:
                 usually names of problems or solutions)
         seed -- name of the predefined seed for random shuffling 
         """
+        if cls.mode == "streams":
+            cls.shuffle(l, seed)
+            return
         _state = random.getstate()
         random.seed(cls.seeds[seed])
         random.shuffle(l)
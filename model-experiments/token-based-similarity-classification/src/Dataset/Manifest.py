@@ -0,0 +1,162 @@
+"""
+Module of functions for checksummed manifests of datasets
+
+Manifest of dataset directory records size, modification time
+and content hash of each file of the directory and of its
+subdirectories. It is written into json file with the structure:
+{"algorithm": <name of hash function>,
+ "files": {<relative file name>: [<size>, <mtime in ns>, <hash>], ...}}
+
+Manifest is verified in two modes:
+- quick  -- file names and sizes are compared with the manifest,
+            only files with changed modification time are hashed,
+            so verification of unchanged dataset, or dataset copied
+            with preserved times (rsync -a, cp -p), does not read files
+- full   -- hashes of all files are computed and compared
+Files are hashed in parallel by a pool of threads
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+#Default name of manifest file in dataset directory
+MANIFEST_FN = "manifest.json"
+#Hash function of file contents
+HASH_ALGORITHM = "sha256"
+
+def fileHash(fn, algorithm = HASH_ALGORITHM, block = 1 << 20):
+    """
+    Compute hash of file contents
+    Parameters:
+    - fn         -- file name
+    - algorithm  -- name of hashlib hash function
+    - block      -- number of bytes read at once
+    Returns: hex digest of file contents
+    """
+    _h = hashlib.new(algorithm)
+    with open(fn, 'rb') as _f:
+        for _data in iter(lambda: _f.read(block), b''):
+            _h.update(_data)
+    return _h.hexdigest()
+
+def listFiles(dir_name, exclude = (MANIFEST_FN,)):
+    """
+    List files of directory and of its subdirectories
+    Parameters:
+    - dir_name  -- directory to list
+    - exclude   -- names of files of top directory not to list
+    Returns: dictionary of files
+             * key   - file name relative to dir_name
+                       with '/' separators
+             * value - os.stat_result of file
+    """
+    _files = {}
+    _dirs = [""]
+    while _dirs:
+        _rel = _dirs.pop()
+        with os.scandir(os.path.join(dir_name, _rel)) as _entries:
+            for _e in _entries:
+                _name = f"{_rel}/{_e.name}" if _rel else _e.name
+                if _e.is_dir():
+                    _dirs.append(_name)
+                elif _e.is_file() and not (not _rel and _e.name in exclude):
+                    _files[_name] = _e.stat()
+    return _files
+
+def hashFiles(dir_name, names, n_jobs = 8, algorithm = HASH_ALGORITHM):
+    """
+    Compute hashes of files in parallel
+    Parameters:
+    - dir_name   -- directory of files
+    - names      -- list of file names relative to dir_name
+    - n_jobs     -- number of threads hashing files
+    - algorithm  -- name of hashlib hash function
+    Returns: list of hex digests of files in order of names
+    """
+    with ThreadPoolExecutor(max_workers = n_jobs) as _pool:
+        return list(_pool.map(
+            lambda _n: fileHash(os.path.join(dir_name, _n), algorithm),
+            names))
+
+def makeManifest(dir_name, n_jobs = 8):
+    """
+    Make manifest of dataset directory
+    Parameters:
+    - dir_name  -- dataset directory
+    - n_jobs    -- number of threads hashing files
+    Returns: manifest as dictionary
+    """
+    _files = listFiles(dir_name)
+    _names = sorted(_files)
+    _hashes = hashFiles(dir_name, _names, n_jobs)
+    return {"algorithm": HASH_ALGORITHM,
+            "files": {_n: [_files[_n].st_size, _files[_n].st_mtime_ns, _h]
+                      for _n, _h in zip(_names, _hashes)}}
+
+def writeManifest(dir_name, manifest, fn = None):
+    """
+    Write manifest of dataset directory
+    Parameters:
+    - dir_name  -- dataset directory
+    - manifest  -- manifest made by makeManifest
+    - fn        -- manifest file; MANIFEST_FN in dir_name if it is None
+    """
+    with open(fn or os.path.join(dir_name, MANIFEST_FN), 'w') as _f:
+        json.dump(manifest, _f, indent = 1)
+
+def readManifest(dir_name, fn = None):
+    """
+    Read manifest of dataset directory
+    Parameters:
+    - dir_name  -- dataset directory
+    - fn        -- manifest file; MANIFEST_FN in dir_name if it is None
+    Returns: manifest as dictionary or None if there is no manifest
+    """
+    _fn = fn or os.path.join(dir_name, MANIFEST_FN)
+    if not os.path.exists(_fn):
+        return None
+    with open(_fn) as _f:
+        return json.load(_f)
+
+def verifyManifest(dir_name, manifest, full_hash = False, n_jobs = 8):
+    """
+    Verify dataset directory with respect to its manifest
+    Parameters:
+    - dir_name   -- dataset directory
+    - manifest   -- manifest made by makeManifest
+    - full_hash  -- flag of hashing all files
+                    If it is False only files with changed
+                    modification time are hashed
+    - n_jobs     -- number of threads hashing files
+    Returns:
+    - list of error messages on missing, resized or changed files
+    - list of warning messages on files that are not in the manifest,
+      e.g. files written into dataset directory after making manifest
+    - dictionary of files with correct contents and changed
+      modification time, its values are their updated manifest records
+    """
+    _errors = []
+    _warnings = []
+    _files = listFiles(dir_name)
+    _recorded = manifest["files"]
+    _to_hash = []
+    for _n, (_size, _mtime, _) in _recorded.items():
+        _stat = _files.get(_n)
+        if _stat is None:
+            _errors.append(f"File {_n} is missing")
+        elif _stat.st_size != _size:
+            _errors.append(f"File {_n} has size {_stat.st_size} " +
+                           f"instead of {_size}")
+        elif full_hash or _stat.st_mtime_ns != _mtime:
+            _to_hash.append(_n)
+    for _n in sorted(_files.keys() - _recorded.keys()):
+        _warnings.append(f"File {_n} is not in manifest")
+    _hashes = hashFiles(dir_name, _to_hash, n_jobs, manifest["algorithm"])
+    _refreshed = {}
+    for _n, _h in zip(_to_hash, _hashes):
+        if _h != _recorded[_n][2]:
+            _errors.append(f"File {_n} has wrong contents")
+        elif _files[_n].st_mtime_ns != _recorded[_n][1]:
+            _refreshed[_n] = [_files[_n].st_size, _files[_n].st_mtime_ns, _h]
+    return _errors, _warnings, _refreshed
@@ -0,0 +1,312 @@
+"""
+Module for exporting datasets of sequences of tokens
+into sharded TFRecord files and reading them as TF datasets
+
+Exported datasets are used for repeated training
+without constructing datasets with python loaders
+
+Classification dataset record has:
+- sequence of tokens
+- label (index of problem)
+- sample name (name of solution)
+Similarity dataset record has:
+- two sequences of tokens
+- label
+- annotation <problem 1, solution 1, problem 2, solution 2>
+Sequences of tokens are stored as raw bytes of
+unsigned 16 bit integers, if all tokens fit them.
+
+Properties of exported datasets are written into json file
+dataset.json, and each exported dataset is described by
+json file <purpose>.json
+
+Samples are exported in the order of batches of training programs,
+possibly made of samples of similar lengths (option --buckets),
+and shards hold whole batches, so batches read from shards
+are the same as the ones made by the training programs
+"""
+import sys
+import os
+import json
+import numpy as np
+import tensorflow as tf
+
+from DsUtilities import makeShardOptions
+
+class TfRecordDS():
+    """
+    Class for exporting datasets into sharded TFRecord files
+    and reading them as TF datasets
+    """
+    #Name of json file with properties of exported datasets
+    fn_info = "dataset.json"
+
+    @classmethod
+    def tokenDtype(cls, n_token_types):
+        """
+        Select data type of tokens for storing them
+        Sequences of tokens are shifted by 1 for padding
+        Parameters:
+        - n_token_types  -- number of token types
+        Returns: name of numpy data type
+        """
+        return "uint16" if n_token_types < np.iinfo(np.uint16).max \
+            else "int32"
+
+    @classmethod
+    def _bytesFeature(cls, value):
+        return tf.train.Feature(
+            bytes_list = tf.train.BytesList(value = [value]))
+
+    @classmethod
+    def _int64Feature(cls, values):
+        return tf.train.Feature(
+            int64_list = tf.train.Int64List(value = values))
+
+    @classmethod
+    def writeInfo(cls, ds, out_dir, task):
+        """
+        Write down properties of exported datasets
+        Parameters:
+        - ds       -- dataset maker object: ClassifDSMaker
+                      or SimilarityDSMaker
+        - out_dir  -- directory to write dataset to
+        - task     -- either "classification" or "similarity"
+        """
+        os.makedirs(out_dir, exist_ok = True)
+        _info = {"task":          task,
+                 "n_token_types": ds.n_token_types,
+                 "token_dtype":   cls.tokenDtype(ds.n_token_types),
+                 "problems":      ds.problems}
+        if task == "similarity":
+            _info["labels01"] = ds.labels01
+            _info["solution_names"] = ds.solution_names
+        with open(f"{out_dir}/{cls.fn_info}", 'w') as _f:
+            json.dump(_info, _f)
+
+    @classmethod
+    def readInfo(cls, in_dir):
+        """
+        Read properties of exported datasets
+        Parameters:
+        - in_dir  -- directory with exported datasets
+        Returns: dictionary of dataset properties
+        """
+        try:
+            with open(f"{in_dir}/{cls.fn_info}") as _f:
+                return json.load(_f)
+        except OSError as _err:
+            sys.exit(f"Cannot read exported dataset properties: {_err}")
+
+    @classmethod
+    def writeShards(cls, out_dir, purpose, examples, n_samples,
+                    n_shards, batch_size = 1, bucketed = False):
+        """
+        Write examples into sharded TFRecord files
+        Each shard holds a contiguous part of the dataset
+        made of whole batches
+        Parameters:
+        - out_dir     -- directory to write dataset to
+        - purpose     -- purpose of dataset:
+                         "training", "validation" or "test"
+        - examples    -- iterator of serialized examples
+        - n_samples   -- number of examples, multiple of batch size
+        - n_shards    -- number of shards
+        - batch_size  -- batch size
+        - bucketed    -- flag of batches made of samples 
+                         of similar lengths
+        """
+        _n_batches = n_samples // batch_size
+        _n_shards = max(1, min(n_shards, _n_batches))
+        _bounds = [batch_size * ((_n_batches * _i) // _n_shards)
+                   for _i in range(_n_shards + 1)]
+        _files = [f"{purpose}-{_i:05d}-of-{_n_shards:05d}.tfrecord"
+                  for _i in range(_n_shards)]
+        for _i, _fn in enumerate(_files):
+            with tf.io.TFRecordWriter(f"{out_dir}/{_fn}") as _writer:
+                for _ in range(_bounds[_i + 1] - _bounds[_i]):
+                    _writer.write(next(examples))
+        with open(f"{out_dir}/{purpose}.json", 'w') as _f:
+            json.dump({"purpose":   purpose,
+                       "n_samples": n_samples,
+                       "batch":     batch_size,
+                       "bucketed":  bucketed,
+                       "files":     _files}, _f)
+        print(f"Dataset {purpose} of {n_samples} samples is written " +
+              f"into {_n_shards} files")
+
+    @classmethod
+    def exportClassif(cls, ds, split, purpose, out_dir, n_shards = 8,
+                      batch_size = 1, buckets = None):
+        """
+        Export classification dataset
+        Samples are exported in the order of batches
+        Parameters:
+        - ds          -- ClassifDSMaker object
+        - split       -- ClassDatasetBase object of dataset to export
+        - purpose     -- purpose of dataset:
+                         "training", "validation" or "test"
+        - out_dir     -- directory to write dataset to
+        - n_shards    -- number of shards
+        - batch_size  -- batch size
+        - buckets     -- boundaries of sequence length buckets
+        """
+        _dtype = cls.tokenDtype(ds.n_token_types)
+        _order, _labels, _names = split.batchOrder(batch_size, buckets)
+        def _examples():
+            for _i, _label, _name in zip(_order, _labels, _names):
+                _features = {
+                    "tokens": cls._bytesFeature(
+                        np.asarray(split.samples[_i],
+                                   dtype = _dtype).tobytes()),
+                    "label": cls._int64Feature([_label]),
+                    "name": cls._bytesFeature(_name.encode())}
+                yield tf.train.Example(features = tf.train.Features(
+                    feature = _features)).SerializeToString()
+        cls.writeShards(out_dir, purpose, _examples(), len(_order),
+                        n_shards, batch_size, bool(buckets))
+
+    @classmethod
+    def exportSimilarity(cls, ds, split, purpose, out_dir, n_shards = 8,
+                         batch_size = 1, bucketed = False):
+        """
+        Export similarity dataset
+        Parameters:
+        - ds          -- SimilarityDSMaker object
+        - split       -- dataset to export as made by SimilarityDSMaker:
+                         <dataset, labels, annotations>
+                         Samples are in the order of batches
+        - purpose     -- purpose of dataset:
+                         "training", "validation" or "test"
+        - out_dir     -- directory to write dataset to
+        - n_shards    -- number of shards
+        - batch_size  -- batch size
+        - bucketed    -- flag of batches made of samples 
+                         of similar lengths
+        """
+        _dtype = cls.tokenDtype(ds.n_token_types)
+        _, _labels, _annotations = split
+        _n_samples = (len(_annotations) // batch_size) * batch_size
+        def _tokens(problem, solution):
+            return cls._bytesFeature(np.asarray(
+                ds.problems_solutions[problem][solution],
+                dtype = _dtype).tobytes())
+        def _examples():
+            for _label, _annot in zip(_labels, _annotations):
+                _features = {
+                    "tokens1": _tokens(_annot[0], _annot[1]),
+                    "tokens2": _tokens(_annot[2], _annot[3]),
+                    "label": cls._int64Feature([int(_label)]),
+                    "annotation": cls._int64Feature(list(_annot))}
+                yield tf.train.Example(features = tf.train.Features(
+                    feature = _features)).SerializeToString()
+        cls.writeShards(out_dir, purpose, _examples(), _n_samples,
+                        n_shards, batch_size, bucketed)
+
+    @classmethod
+    def makeParser(cls, task, token_dtype):
+        """
+        Make function parsing serialized example into sample
+        Parameters:
+        - task         -- either "classification" or "similarity"
+        - token_dtype  -- name of data type of stored tokens
+        Returns: parsing function
+        """
+        _dtype = tf.dtypes.as_dtype(token_dtype)
+        def _tokens(raw):
+            return tf.cast(tf.io.decode_raw(raw, _dtype), tf.int32)
+        if task == "classification":
+            _features = {
+                "tokens": tf.io.FixedLenFeature([], tf.string),
+                "label":  tf.io.FixedLenFeature([], tf.int64)}
+            def _parse(record):
+                _ex = tf.io.parse_single_example(record, _features)
+                return (_tokens(_ex["tokens"]),
+                        tf.cast(_ex["label"], tf.int32))
+        else:
+            _features = {
+                "tokens1": tf.io.FixedLenFeature([], tf.string),
+                "tokens2": tf.io.FixedLenFeature([], tf.string),
+                "label":   tf.io.FixedLenFeature([], tf.int64)}
+            def _parse(record):
+                _ex = tf.io.parse_single_example(record, _features)
+                return ((_tokens(_ex["tokens1"]),
+                         _tokens(_ex["tokens2"])),
+                        tf.cast(_ex["label"], tf.int32))
+        return _parse
+
+    @classmethod
+    def readDataset(cls, in_dir, purpose, batch_size,
+                    training = False, cache = True, shard = "OFF"):
+        """
+        Read exported dataset as TF dataset
+        Records are read from all files in parallel,
+        parsed in parallel, and optionally cached in memory
+        Batches are padded to the longest sequence in them
+        Parameters:
+        - in_dir      -- directory with exported datasets
+        - purpose     -- purpose of dataset:
+                         "training", "validation" or "test"
+        - batch_size  -- global batch size
+                         It should be the batch size of export
+        - training    -- flag of training dataset
+                         Records of training dataset are
+                         interleaved from all files, otherwise
+                         they are read in the order of the dataset
+                         Batches of bucketed training dataset are
+                         read whole from files taken in random order
+        - cache       -- flag to cache parsed samples in memory
+        - shard       -- option to shard dataset:
+                         * "OFF"    -- AutoShardPolicy.OFF
+                         * "DATA"   -- AutoShardPolicy.DATA
+                         * "WORKER" -- each input pipeline of
+                                       distribution strategy reads
+                                       only its part of files
+        Returns: TF dataset, or if shard is "WORKER" function making
+                 TF dataset of input pipeline from its input context
+        """
+        _info = cls.readInfo(in_dir)
+        try:
+            with open(f"{in_dir}/{purpose}.json") as _f:
+                _split = json.load(_f)
+        except OSError as _err:
+            sys.exit(f"Cannot read exported {purpose} dataset: {_err}")
+        _files = [f"{in_dir}/{_fn}" for _fn in _split["files"]]
+        if _split.get("batch", batch_size) != batch_size:
+            sys.exit(f"Batch size {batch_size} differs from batch size " +
+                     f"{_split['batch']} of exported {purpose} dataset")
+        #Bucketed batches are read whole from one file, so records
+        #are interleaved deterministically, and randomness comes
+        #from the order of files
+        _bucketed = _split.get("bucketed", False)
+        _parse = cls.makeParser(_info["task"], _info["token_dtype"])
+        def _makeDs(files, batch_size, policy):
+            _ds = tf.data.Dataset.from_tensor_slices(files)
+            if training and _bucketed:
+                _ds = _ds.shuffle(len(files),
+                                  reshuffle_each_iteration = True)
+            _ds = _ds.interleave(
+                tf.data.TFRecordDataset,
+                cycle_length = len(files) if training else 1,
+                block_length = batch_size if _bucketed else 1,
+                num_parallel_calls = tf.data.AUTOTUNE,
+                deterministic = _bucketed or not training)
+            _ds = _ds.map(_parse, num_parallel_calls = tf.data.AUTOTUNE)
+            if cache:
+                _ds = _ds.cache()
+            _ds = _ds.padded_batch(batch_size, drop_remainder = True)
+            _ds_options = makeShardOptions(policy = policy)
+            return _ds.with_options(_ds_options).prefetch(tf.data.AUTOTUNE)
+        if shard != "WORKER":
+            return _makeDs(_files, batch_size, shard)
+        def _workerDs(input_context):
+            _n = input_context.num_input_pipelines
+            if len(_files) < _n:
+                sys.exit(f"Dataset {purpose} has {len(_files)} files, " +
+                         f"it is fewer than {_n} workers")
+            return _makeDs(_files[input_context.input_pipeline_id :: _n],
+                           input_context.get_per_replica_batch_size(
+                               batch_size),
+                           "OFF")
+        return _workerDs
+#---------------- End of class TfRecordDS -------------------------
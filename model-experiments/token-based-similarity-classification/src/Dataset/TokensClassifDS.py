@@ -54,6 +54,7 @@ class ClassDatasetBase():
         """
         self.label_names = ds.problems
         self.report_dir = report_dir
+        self.purpose = purpose
         if dump:
             self.dumpDataset(f"{self.report_dir}/{self.fn_ds_dump[purpose]}.lst")
         if csv:
@@ -104,47 +105,85 @@ class ClassDatasetBase():
 
     def samplesDsFromGenerator(self, samples, batch_size):
         """
-        Make batched TF dataset of samples froms samples generator
+        Make batched TF dataset of samples 
         Samples are defined with list of sequences
+        They are stored in ragged tensor and each batch is
+        gathered and padded in TF graph
         Parameters:
         - samples    -- list of samples
         - batch_size -- batch size
         Returns: TF dataset
         """
-        _s = tf.data.Dataset.from_generator(
-            lambda: samples, output_signature=(
-                tf.TensorSpec(shape=([None]), dtype=tf.int32)))
-        _s = _s.padded_batch(batch_size, padding_values = 0,
-                             drop_remainder=True)
+        _tokens = makeRaggedTokens(samples)
+        _s = tf.data.Dataset.range(len(samples))
+        _s = _s.batch(batch_size, drop_remainder=True)
+        _s = _s.map(lambda _i: paddedRows(_tokens, _i),
+                    num_parallel_calls = tf.data.AUTOTUNE)
         return _s
 
-    def dsFromGenerator(self, batch_size, shard = "OFF"):
+    def batchOrder(self, batch_size, buckets = None):
         """
-        Make batched TF dataset from samples generator,
+        Compute order of samples in batches
+        Drop samples to make the dataset to be multiple of batch size
+        Parameters:
+        - batch_size -- batch size
+        - buckets    -- boundaries of sequence length buckets
+                        If they are defined, each batch is made of 
+                        samples of one bucket, where it is possible
+        Returns: 
+        - numpy array of indices of samples in the order of batches
+        - list of sample labels in the order of batches
+        - list of sample names in the order of batches
+        """
+        _ds_size = (len(self.labels) // batch_size) * batch_size
+        if buckets:
+            _lengths = np.fromiter(map(len, self.samples), dtype = np.int64,
+                                   count = len(self.samples))
+            _order = bucketOrder(
+                _lengths, batch_size, buckets,
+                DataRand.generator("BUCKET_SHUFFLE_SEED",
+                                   list(self.fn_ds_dump).index(self.purpose)))
+            reportPadding(_order, batch_size, _lengths)
+            _order = _order[: _ds_size]
+            _labels = [self.labels[_i] for _i in _order]
+            _sample_names = [self.sample_names[_i] for _i in _order]
+        else:
+            _order = np.arange(_ds_size, dtype = np.int64)
+            _labels = self.labels[: _ds_size]
+            _sample_names = self.sample_names[: _ds_size]
+        return _order, _labels, _sample_names
+
+    def dsFromGenerator(self, batch_size, shard = "OFF", buckets = None):
+        """
+        Make batched TF dataset from samples 
         Samples are defined with list of sequences
+        They are stored in ragged tensor and each batch is
+        gathered and padded in TF graph
         Drop samples to make the dataset to be multiple of batch size
         Parameters:
         - batch_size -- batch size
         - shard      -- option to shard dataset:
-                        * "OFF"  -- AutoShardPolicy.OFF
-                        " "DATA" -- AutoShardPolicy.DATA
+                        * "OFF"    -- AutoShardPolicy.OFF
+                        * "DATA"   -- AutoShardPolicy.DATA
+                        * "WORKER" -- each worker makes its part of 
+                                      batches, see indexedDataset
+        - buckets    -- boundaries of sequence length buckets
+                        If they are defined, each batch is made of 
+                        samples of one bucket, where it is possible,
+                        and the returned lists follow the order of batches
         Returns: 
-        - TF dataset
+        - TF dataset, or function making it in "WORKER" shard mode
         - list of sample labels (indices of problems)
         - list of sample names (names of solutions)
         - list of label names (name of problems)
         """
-        _ds_size = (len(self.labels) // batch_size) * batch_size
-        _s = self.samplesDsFromGenerator(self.samples[: _ds_size], batch_size)
-        _s = _s.unbatch()
-        _t_labels  = tf.convert_to_tensor(
-            np.asarray(self.labels[: _ds_size], dtype=np.int32))
-        _l = tf.data.Dataset.from_tensor_slices(_t_labels)
-        _ds = tf.data.Dataset.zip((_s, _l))
-        _ds_options = makeShardOptions(policy = shard)
-        _ds = _ds.batch(batch_size).with_options(_ds_options)
-        return (_ds, self.labels[: _ds_size],
-                self.sample_names[: _ds_size], self.label_names)
+        _order, _labels, _sample_names = self.batchOrder(batch_size, buckets)
+        _l = np.asarray(_labels, dtype=np.int32)
+        _ds = indexedDataset(
+            self.samples, (_order, _l), batch_size,
+            lambda _tokens, _i, _lab: (paddedRows(_tokens, _i), _lab),
+            shard = shard)
+        return (_ds, _labels, _sample_names, self.label_names)
     
     def rawDS(self, batch_size):
         """
@@ -323,7 +362,11 @@ class ClassifDSMaker(SeqOfTokensLoader):
                          "is only {_n_solutions}\n" + 
                          "It is not enough for training and testing")
             _n_test_solutions = max(1, int(_n_solutions * self.test_part))
-            _n_train_solutions = _n_solutions - _n_test_solutions
+            _n_train_solutions = self.splitPoint(
+                [self.duplicateKey(self.problems[_i], _s)
+                 for _s in self.sol_names[_i]],
+                _n_solutions - _n_test_solutions)
+            _n_test_solutions = _n_solutions - _n_train_solutions
             _test_samples.extend(self.probl_solutions[_i][_n_train_solutions :])
             _test_sample_names.extend(self.sol_names[_i][_n_train_solutions :])
             _test_labels.extend([_i] * _n_test_solutions)
@@ -364,7 +407,9 @@ class ClassifDSMaker(SeqOfTokensLoader):
                                  "whole", self.report_dir)
         #Reserve samples for test set
         self.test_size = int(len(self.samples) * self.test_part)
-        self.train_val_size = len(self.samples) - self.test_size
+        self.train_val_size = self.splitPoint(
+            self.sampleDuplicateKeys(), len(self.samples) - self.test_size)
+        self.test_size = len(self.samples) - self.train_val_size
         _test_ds = ClassDataset(
             self, len(self.samples) - self.test_size,
             self.test_size, "test", self.report_dir) \
@@ -394,7 +439,10 @@ class ClassifDSMaker(SeqOfTokensLoader):
                 sys.exit(f"Number of solutions of problem {self.problems[_i]} is " +
                          "only {_n_solutions}\n" + 
                          "It is not enough for training and validation")
-            _n_val_solutions = max(1, int(_n_solutions * valpart))
+            _n_val_solutions = self.splitPoint(
+                [self.duplicateKey(self.problems[_i], _s)
+                 for _s in self.sol_names[_i][: _n_solutions]],
+                max(1, int(_n_solutions * valpart)))
             _val_samples.extend(self.probl_solutions[_i][: _n_val_solutions])
             _val_sample_names.extend(self.sol_names[_i][: _n_val_solutions])
             _val_labels.extend([_i] * _n_val_solutions)
@@ -411,12 +459,15 @@ class ClassifDSMaker(SeqOfTokensLoader):
             "training", self.report_dir)
         return _val_ds, _train_ds
 
-    def testDS(self, batch_size):
+    def testDS(self, batch_size, buckets = None, shard = "OFF"):
         """
         Make test tf.dataset
         The tf.data.dataset is constructed from_generator
         Parameters:
         - batch_size -- batch size
+        - buckets    -- boundaries of sequence length buckets
+                        for batching samples of similar length
+        - shard      -- option to shard dataset, see dsFromGenerator
 
         Returns: 
         - TF dataset and 
@@ -425,11 +476,14 @@ class ClassifDSMaker(SeqOfTokensLoader):
         - list of lable names
         """
         if self.test_ds:
-            return self.test_ds.dsFromGenerator(batch_size)
+            return self.test_ds.dsFromGenerator(batch_size,
+                                                buckets = buckets,
+                                                shard = shard)
         else:
             sys.exit("Cannot make test dataset because it was not defined")
 
-    def trainValidDs(self, valpart, batch_size, dump = True):
+    def trainValidDs(self, valpart, batch_size, dump = True,
+                     buckets = None, shard = "OFF"):
         """
         Make training and validation tf.datasets by 
         splitting loaded data set
@@ -439,10 +493,33 @@ class ClassifDSMaker(SeqOfTokensLoader):
         - valpart    -- Fraction of dataset samples used for validation
                         as float
         - batch_size -- size for training dataset
+        - buckets    -- boundaries of sequence length buckets
+                        for batching samples of similar length
+        - shard      -- option to shard dataset, see dsFromGenerator
         Returns:
         - pair of <validation dataset>, <training dataset>
           Both training and validation dataset are tensorflow Datasets
         """
+        self.trainValidSplits(valpart, batch_size)
+        _train_ds = self.train_ds.dsFromGenerator(batch_size,
+                                                  buckets = buckets,
+                                                  shard = shard)
+        _val_ds = self.val_ds.dsFromGenerator(batch_size,
+                                              buckets = buckets,
+                                              shard = shard)
+        memoryUsage("After DS made")
+        return _val_ds, _train_ds
+
+    def trainValidSplits(self, valpart, batch_size):
+        """
+        Split loaded data set into training and validation datasets
+        without making tf.datasets
+        Parameters:
+        - valpart    -- Fraction of dataset samples used for validation
+                        as float
+        - batch_size -- size for training dataset
+        Computes: self.val_ds and self.train_ds
+        """
         if self.balanced_split:
             self.val_ds, self.train_ds = self.balancedValTrain(valpart)
         else:
@@ -452,10 +529,6 @@ class ClassifDSMaker(SeqOfTokensLoader):
             self.train_ds = ClassDataset(self, _val_len, _train_len,
                                          "training", self.report_dir)
         self.writeLabelDistribution()
-        _train_ds = self.train_ds.dsFromGenerator(batch_size)
-        _val_ds = self.val_ds.dsFromGenerator(batch_size)
-        memoryUsage("After DS made")
-        return _val_ds, _train_ds
 
     def trainValDsSize(self, valpart, batch_size):
         """
@@ -469,10 +542,22 @@ class ClassifDSMaker(SeqOfTokensLoader):
         Returns:
         - sizes of training and validation datasets
         """
-        _val_len = int(float(self.train_val_size) * valpart)
+        _val_len = self.splitPoint(
+            self.sampleDuplicateKeys()[: self.train_val_size],
+            int(float(self.train_val_size) * valpart))
         _train_len = self.train_val_size - _val_len
         return _train_len, _val_len
 
+    def sampleDuplicateKeys(self):
+        """
+        Get clusters of near-duplicates of shuffled samples
+        Returns: list of clusters as returned by duplicateKey
+        """
+        if not self.duplicates:
+            return []
+        return [self.duplicateKey(self.problems[_l], _s)
+                for _l, _s in zip(self.labels, self.sample_names)]
+
     def writeLabelDistribution(self):
         """
         Write down distribution of datasets lables
@@ -25,9 +25,56 @@ import numpy as np
 import math
 import random
 import csv
+from itertools import repeat
 
 from DataLoader import SeqOfTokensLoader
-from DsUtilities import DataRand
+from DsUtilities import DataRand, mapJobs
+
+def _similarPairs(seed_seq, n_solutions, n_samples):
+    """
+    Make random pairs of different solutions of one problem
+    Parameters:
+    - seed_seq     -- SeedSequence of the problem substream
+    - n_solutions  -- number of problem solutions
+    - n_samples    -- number of pairs to make
+    Returns:
+    - numpy arrays of indices of 1-st and 2-nd solutions of pairs
+    """
+    _rng = np.random.default_rng(seed_seq)
+    _s1 = _rng.integers(0, n_solutions, n_samples)
+    #Non zero shift guarantees that pair has different solutions
+    _s2 = (_s1 + _rng.integers(1, n_solutions, n_samples)) % n_solutions
+    return _s1, _s2
+
+def _dissimilarPairs(seed_seq, n_solutions, n_samples):
+    """
+    Make random pairs of solutions of different problems
+    Problems are selected with probabilities proportional 
+    to the number of their solutions
+    Parameters:
+    - seed_seq     -- SeedSequence of the shard substream
+    - n_solutions  -- numpy array of numbers of solutions of problems
+    - n_samples    -- number of pairs to make
+    Returns:
+    - numpy arrays of indices of 1-st problems, their solutions,
+      2-nd problems and their solutions
+    """
+    _rng = np.random.default_rng(seed_seq)
+    _probl_probabilities = n_solutions / float(n_solutions.sum())
+    _n_problems = n_solutions.shape[0]
+    _p1 = _rng.choice(_n_problems, n_samples, p = _probl_probabilities)
+    _p2 = _rng.choice(_n_problems, n_samples, p = _probl_probabilities)
+    #Reselect both problems of pairs of the same problem 
+    _same = np.flatnonzero(_p1 == _p2)
+    while _same.size:
+        _p1[_same] = _rng.choice(_n_problems, _same.size,
+                                 p = _probl_probabilities)
+        _p2[_same] = _rng.choice(_n_problems, _same.size,
+                                 p = _probl_probabilities)
+        _same = _same[_p1[_same] == _p2[_same]]
+    _s1 = (_rng.random(n_samples) * n_solutions[_p1]).astype(np.int64)
+    _s2 = (_rng.random(n_samples) * n_solutions[_p2]).astype(np.int64)
+    return _p1, _s1, _p2, _s2
 
 class SimilarityDSMaker(SeqOfTokensLoader):
     """
@@ -39,6 +86,13 @@ class SimilarityDSMaker(SeqOfTokensLoader):
     Test datset is always constructed for problems that are not used 
     either for training or validation
     """
+    #Keys of seed substreams used in "streams" randomization mode
+    _SIMILAR_STREAM = 0
+    _DISSIMILAR_STREAM = 1
+    _SHUFFLE_STREAM = 2
+    #Number of dissimilar samples made from one substream
+    _DISSIMILAR_SHARD = 64 * 1024
+
     def __init__(self, dir_name, min_n_solutions = 1,
                  problem_list = None, max_n_problems = None,
                  short_code_th = 4, long_code_th = None,
@@ -176,12 +230,12 @@ class SimilarityDSMaker(SeqOfTokensLoader):
             [_solutions[int(float(len(_solutions)) * 
                                  val_train_split) :] 
              for _solutions in self.train_ds_probl_solutions]
-        DataRand.setSeed("SIMIL_TRAIN_DS_SEED")
         self.train_ds = self._makeDs(0, _train_problem_solutions,
-                                     train_size, similar_part)
-        DataRand.setSeed("SIMIL_VALID_DS_SEED")
+                                     train_size, similar_part,
+                                     "SIMIL_TRAIN_DS_SEED")
         self.val_ds = self._makeDs(0, _val_problem_solutions,
-                                   val_size, similar_part)
+                                   val_size, similar_part,
+                                   "SIMIL_VALID_DS_SEED")
         self.reportDatasetStatistics(0, self.n_tran_ds_problems, 
                                      self.val_ds[2], 
                                      0, self.n_tran_ds_problems, 
@@ -265,12 +319,12 @@ class SimilarityDSMaker(SeqOfTokensLoader):
                               "validation_problems.txt")
         self.writeProblemList(self.train_ds_problems[_n_val_probls :],
                               "training_problems.txt")
-        DataRand.setSeed("SIMIL_VALID_DS_SEED")
         self.val_ds = self._makeDs(0, _val_problem_solutions,
-                                   val_size, similar_part)
-        DataRand.setSeed("SIMIL_TRAIN_DS_SEED")
+                                   val_size, similar_part,
+                                   "SIMIL_VALID_DS_SEED")
         self.train_ds = self._makeDs(_n_val_probls,
-            _train_problem_solutions, train_size, similar_part)
+            _train_problem_solutions, train_size, similar_part,
+            "SIMIL_TRAIN_DS_SEED")
         self.reportDatasetStatistics(0, _n_val_probls, self.val_ds[2], 
             _n_val_probls, self.n_tran_ds_problems - _n_val_probls, 
             self.train_ds[2])
@@ -303,10 +357,10 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         print("Constructing test dataset")
         if not self.test_problem_solutions:
             sys.exit("Test datset cannot be created as it was not defined.")
-        DataRand.setSeed("SIMIL_TEST_DS_SEED")
         _start_problem = self.n_problems - self.n_test_problems
         self.test_ds = self._makeDs(_start_problem,
-                        self.test_problem_solutions, size, similar_part) 
+                        self.test_problem_solutions, size, similar_part,
+                        "SIMIL_TEST_DS_SEED") 
         with open(f"{self.report_dir}/TestDatasetStatistics.lst", 'w') as _f:
             _f.write("PROBLEM DISTRIBUTION IN TEST DATASET\n")
             self.writeProblemDistribution(_start_problem, 
@@ -315,7 +369,7 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         return self.test_ds
 
     def _makeDs(self, start_problem, problems_solutions,
-                size, similar_part):
+                size, similar_part, seed):
         """
         Make a dataset for source code similarity analyser
         Parameters:
@@ -325,6 +379,7 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         - size               -- Size of dataset to create
         - similar_part       -- Fraction of samples of the created dataset 
                                 representing similar source code samples
+        - seed               -- name of the seed for randomization
         Returns:
         - constructed dataset 
           * either as single numpy array 
@@ -336,17 +391,22 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         """
         _annotations = []  #Similarity samples to construct
         _n_similar = int(float(size) * similar_part)
-
+        DataRand.setSeed(seed)
+        _add_similar, _add_dissimilar = \
+            (self._addSimilarSamples, self._addDisSimilarSamples) \
+            if DataRand.mode == "compat" else \
+            (self._addSimilarSamplesStreams, 
+             self._addDisSimilarSamplesStreams)
         #Add samples with similar solutions
-        self._addSimilarSamples(_annotations, start_problem, 
-                                problems_solutions,_n_similar)
+        _add_similar(_annotations, start_problem, 
+                     problems_solutions,_n_similar, seed)
         _n_similar_solutions = len(_annotations)
-        self._addDisSimilarSamples(_annotations, start_problem, 
-                                   problems_solutions,
-                                   size - _n_similar_solutions)
+        _add_dissimilar(_annotations, start_problem, 
+                        problems_solutions,
+                        size - _n_similar_solutions, seed)
         _n_samples = len(_annotations)
         _n_dissimilar_solutions = _n_samples - _n_similar_solutions
-        random.shuffle(_annotations)
+        DataRand.shuffle(_annotations, seed, self._SHUFFLE_STREAM)
         _labels  = self._makeLabels(_annotations)
         _samples = self.makeSimDataset(_annotations, _labels)
         print(f"Similarity dataset of {_n_samples} samples is ready")
@@ -355,7 +415,7 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         return (_samples, _labels, _annotations)
 
     def _addSimilarSamples(self, ds, start_problem, problems_solutions, 
-                           size):
+                           size, seed = None):
         """
         Add samples with similar solutions of the problems
         to the given dataset
@@ -365,6 +425,8 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         - problems_solutions -- source code solutions for constructing 
                                 samples of similar solutions
         - size               -- Size of dataset to create  
+        - seed               -- dummy parameter, global generator 
+                                of module random is used
         """
         #Number of all pairs of similar solutions that can be constructed 
         #from the given data
@@ -390,7 +452,7 @@ class SimilarityDSMaker(SeqOfTokensLoader):
                 ds.append(_sample_annot)
 
     def _addDisSimilarSamples(self, ds, start_problem, 
-                              problems_solutions, size):
+                              problems_solutions, size, seed = None):
         """
         Expand the given dataset with pairs of dissimilar solutions 
         Parameters:
@@ -399,6 +461,8 @@ class SimilarityDSMaker(SeqOfTokensLoader):
         - problems_solutions -- source code solutions for constructing 
                                 samples of similar solutions
         - size               -- Size of dataset to create   
+        - seed               -- dummy parameter, global generator 
+                                of module random is used
         """
         #Total number of problem solution
         _n_solutions = float(sum(map(len, problems_solutions)))
@@ -438,6 +502,73 @@ class SimilarityDSMaker(SeqOfTokensLoader):
                              start_problem + _p2_idx, _s2_idx)
             ds.append(_sample_annot)
 
+    def _addSimilarSamplesStreams(self, ds, start_problem, 
+                                  problems_solutions, size, seed):
+        """
+        Add samples with similar solutions of the problems
+        to the given dataset
+        Version for "streams" randomization mode:
+        Pairs of each problem are made with its own seed substream
+        Problems are processed in parallel if DataRand.n_jobs > 1
+        Parameters:
+        - ds                 -- dataset for adding samples to
+        - start_problem      -- index of fist problem to use for samples
+        - problems_solutions -- source code solutions for constructing 
+                                samples of similar solutions
+        - size               -- Size of dataset to create  
+        - seed               -- name of the seed for randomization
+        """
+        _n_pairs = \
+            float(sum(map(lambda _array: len(_array) * (len(_array) -1), 
+                          problems_solutions)))
+        _problems = []
+        _jobs = []
+        for _p, _solutions in enumerate(problems_solutions):
+            if len(_solutions) <= 1:
+                continue     #Cannot make any pair from 1 or 0 items
+            _n_samples = \
+                int((float(size) * 
+                     float(len(_solutions) * (len(_solutions) -1)) / 
+                     _n_pairs))
+            _problems.append(start_problem + _p)
+            _jobs.append((DataRand.seedSequence(seed, 
+                                self._SIMILAR_STREAM, start_problem + _p),
+                          len(_solutions), _n_samples))
+        for _p, _pairs in zip(_problems, 
+                    mapJobs(_similarPairs, _jobs, DataRand.n_jobs)):
+            _s1, _s2 = _pairs
+            ds.extend(zip(repeat(_p), _s1.tolist(),
+                          repeat(_p), _s2.tolist()))
+
+    def _addDisSimilarSamplesStreams(self, ds, start_problem, 
+                                     problems_solutions, size, seed):
+        """
+        Expand the given dataset with pairs of dissimilar solutions 
+        Version for "streams" randomization mode:
+        Samples are made by shards of self._DISSIMILAR_SHARD samples,
+        each of them with its own seed substream
+        Shards are processed in parallel if DataRand.n_jobs > 1
+        Parameters:
+        - ds                 -- dataset for adding samples to
+        - start_problem      -- index of fist problem to use for samples
+        - problems_solutions -- source code solutions for constructing 
+                                samples of similar solutions
+        - size               -- Size of dataset to create   
+        - seed               -- name of the seed for randomization
+        """
+        _n_solutions = np.asarray(list(map(len, problems_solutions)),
+                                  dtype = np.int64)
+        _jobs = [(DataRand.seedSequence(seed, 
+                                self._DISSIMILAR_STREAM, _k),
+                  _n_solutions,
+                  min(self._DISSIMILAR_SHARD, size - _start))
+                 for _k, _start in 
+                 enumerate(range(0, size, self._DISSIMILAR_SHARD))]
+        for _p1, _s1, _p2, _s2 in \
+                mapJobs(_dissimilarPairs, _jobs, DataRand.n_jobs):
+            ds.extend(zip((_p1 + start_problem).tolist(), _s1.tolist(),
+                          (_p2 + start_problem).tolist(), _s2.tolist()))
+
     def _makeLabels(self, annotations):
         """
         Make lables from set of similarity samples
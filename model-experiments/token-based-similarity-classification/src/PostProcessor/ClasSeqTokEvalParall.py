@@ -18,10 +18,12 @@ sys.path.extend([f"{main_dir}/SeqOfTokens",
                  f"{main_dir}/PostProcess"])
 
 from SeqTokDataset    import SeqTokDataset
-from DsUtilities      import DataRand
+from DsUtilities      import DataRand, distributeDataset
+from DataLoader       import SeqOfTokensLoader
 from ProgramArguments import *
 from Utilities        import *
 from ClassConfusion   import ClassConfusAnalysis
+from StreamingEval    import StreamingEvaluator
 
 def main(args):
     """
@@ -33,7 +35,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     
     latest_checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
 
@@ -59,16 +64,29 @@ def main(args):
         print("Restoring from", latest_checkpoint)
         _dnn = tf.keras.models.load_model(latest_checkpoint)
     _test_ds, _labels, _sample_names, _label_names = \
-                                _ds.testDS(args.batch)
-    _eval_loss, _eval_acc = _dnn.evaluate(_test_ds, 
-                                  verbose = args.progress)
-    _prob = _dnn.predict(_test_ds, verbose = args.progress)
-    _confusion = ClassConfusAnalysis(_prob, _labels, _sample_names,
-                                     _label_names)
+                                _ds.testDS(args.batch, buckets = args.buckets,
+                                           shard = args.shard)
+    if args.single_pass:
+        _evaluator = StreamingEvaluator(_dnn, len(_labels))
+        _evaluator.run(_test_ds, args.progress)
+        _eval_acc = _evaluator.accuracy(_labels)
+        _eval_loss = _evaluator.loss()
+        _confusion = _evaluator.classConfusion(
+            _labels, _sample_names, _label_names,
+            matrix_format = args.matrix_format)
+    else:
+        _test_ds = distributeDataset(strategy, _test_ds)
+        _eval_loss, _eval_acc = _dnn.evaluate(_test_ds, 
+                                      verbose = args.progress)
+        _prob = _dnn.predict(_test_ds, verbose = args.progress)
+        _confusion = ClassConfusAnalysis(_prob, _labels, _sample_names,
+                                         _label_names,
+                                         matrix_format = args.matrix_format)
     _confusion.writeReport()
     print("\n")
     print("Evaluation accuracy is {:5.2f}%".format(_eval_acc * 100))
-    print("Evaluation loss is {:5.2f}".format(_eval_loss))
+    if _eval_loss is not None:
+        print("Evaluation loss is {:5.2f}".format(_eval_loss))
 ################################################################################
 # Args are described below
 ################################################################################
@@ -82,6 +100,14 @@ if __name__ == '__main__':
                         type=str, help="checkpoint file")
     parser.add_argument('--seq_len', default=None, type=int,
                         help='maximum lengths of token sequence')
+    parser.add_argument("--matrix_format", default="text", type=str,
+                        choices=["text", "binary", "all"],
+                        help="format of confusion matrices: text listing, " +
+                        "binary - numpy .npy and csv files, all - both")
+    parser.add_argument("--single_pass", action="store_true",
+                        help="predict test dataset once and accumulate " +
+                        "loss, accuracy and confusion analysis results " +
+                        "batch by batch")
     args = parseArguments(parser)
     main(args)
 
@@ -18,7 +18,8 @@ class ClassConfusAnalysis(ConfusionAnalysis):
     Class for constructing and analysing confusion matrix
     """
     def __init__(self, probabilities, labels, solutions, 
-                 problems, extreme = 0.1):
+                 problems, extreme = 0.1, matrix_format = "text",
+                 predictions = None, confidence = None):
         """
         Construct confusion matrix
         Parameters:
@@ -30,14 +31,26 @@ class ClassConfusAnalysis(ConfusionAnalysis):
                           i.e names of classes for this case
         - extreme       - fraction of cases to be reported 
                           as extreme ones
+        - matrix_format - format of confusion matrices:
+                          * "text"   -- text listing
+                          * "binary" -- numpy .npy and csv files
+                          * "all"    -- both of them
+        - predictions   - predicted classes as numpy array
+        - confidence    - confidence of predictions as numpy array
+                          Predictions and confidence are given instead
+                          of probabilities by single pass evaluation
         """
         super(ClassConfusAnalysis, self).__init__(probabilities, 
             np.asarray(labels, dtype = np.int32), 
-            solutions, problems, extreme)
+            solutions, problems, extreme, predictions = predictions)
         self.class_stat_fn = "class_statistics.lst"
         self.class_stat_csv = "class_statistics.csv"
         self.confused_classes_fn = "confused_classes.lst"
         self.confused_classes_csv = "confused_classes.csv"
+        self.matrix_format = matrix_format
+        #Names of binary files of confusion matrices without extension
+        self.conf_mat_bin = "confusion_matrix"
+        self.norm_conf_mat_bin = "norm_confusion_matrix"
         #Number of best and worst correct predictions of
         #worst classified classes to report
         self.n_right_pred_report = 32
@@ -48,7 +61,8 @@ class ClassConfusAnalysis(ConfusionAnalysis):
         #Max number of misclassifications to report
         self.max_n_misclass_report = 32
         #Confidence in classification
-        self.confidence = np.max(probabilities, axis=1)
+        self.confidence = confidence if confidence is not None \
+            else np.max(probabilities, axis=1)
         #Number of samples in each class as numpy array
         self._n_class_samples = self.conf_mat.sum(axis=1)
         #Number of predictions of each class as numpy array
@@ -138,16 +152,19 @@ class ClassConfusAnalysis(ConfusionAnalysis):
                 Sublists correspond to given classes
                 Each sublist is sorted according to confidence
         """
+        _right = np.flatnonzero(self.predictions == self.labels)
+        _groups = self.groupSamples(_right, self.labels[_right])
+        #Samples of a class listed twice are given to its first entry
         _classifications = [[] for i in range(len(classes))]
-        for _i in range(self._n_samples):
-            if (self.predictions[_i] == self.labels[_i] and
-                self.labels[_i] in classes):
-                _idx = classes.index(self.labels[_i])
-                _classifications[_idx].append((self.solutions[_i],
-                                               self.confidence[_i]))
-        for _cls in _classifications:
-            if len(_cls) < 2: continue
-            _cls.sort(key = lambda _c: _c[1], reverse = True)
+        for _c in set(classes):
+            if _c not in _groups: continue
+            _samples = _groups[_c]
+            #Stable sort keeps order of samples of equal confidence
+            _samples = _samples[np.argsort(-self.confidence[_samples],
+                                           kind = "stable")]
+            _classifications[classes.index(_c)] = \
+                [(self.solutions[_i], self.confidence[_i]) 
+                 for _i in _samples]
         return _classifications
 
     def reportRightClassifications(self, classes, f):
@@ -206,12 +223,13 @@ class ClassConfusAnalysis(ConfusionAnalysis):
                 Sublists gives misclassifications of classes
         """
         #Number of classification mistakes
+        _wrong = np.flatnonzero(self.predictions != self.labels)
+        _groups = self.groupSamples(_wrong, self.labels[_wrong])
         _mistakes = [[] for i in range(len(classes))]
-        for _i in range(self._n_samples):
-            if (self.predictions[_i] != self.labels[_i] and
-                self.labels[_i] in classes):
-                _bad_idx = classes.index(self.labels[_i])
-                _mistakes[_bad_idx].append((_i, self.predictions[_i]))
+        for _c in set(classes):
+            if _c not in _groups: continue
+            _mistakes[classes.index(_c)] = \
+                [(_i, self.predictions[_i]) for _i in _groups[_c]]
         return _mistakes
 
     def reportMisclassifications(self, classes, mistakes, f):
@@ -345,15 +363,21 @@ class ClassConfusAnalysis(ConfusionAnalysis):
         """
         Write report on classification and misclassification
         """
-        with open(f"{self.report_dir}/{self._conf_mat_fn}", 'w') as _f:
-            _f.write("Unnormalized confusion matrix\n")
-            _f.write("row and column indices are labels\n")
-            _f.write("---------------------------------\n")
-            self.writeLargeMatrixInt(self.conf_mat, _f)
-            _f.write("Normalized confusion matrix\n")
-            _f.write("row and column indices are labels\n")
-            _f.write("---------------------------------\n")
-            self.writeLargeMatrixPct(self.norm_conf_mat, _f, 100.0)
+        if self.matrix_format in ("text", "all"):
+            with open(f"{self.report_dir}/{self._conf_mat_fn}", 'w') as _f:
+                _f.write("Unnormalized confusion matrix\n")
+                _f.write("row and column indices are labels\n")
+                _f.write("---------------------------------\n")
+                self.writeLargeMatrixInt(self.conf_mat, _f)
+                _f.write("Normalized confusion matrix\n")
+                _f.write("row and column indices are labels\n")
+                _f.write("---------------------------------\n")
+                self.writeLargeMatrixPct(self.norm_conf_mat, _f, 100.0)
+        if self.matrix_format in ("binary", "all"):
+            self.writeMatrixBinary(self.conf_mat,
+                                   f"{self.report_dir}/{self.conf_mat_bin}")
+            self.writeMatrixBinary(self.norm_conf_mat,
+                                   f"{self.report_dir}/{self.norm_conf_mat_bin}")
         with open(f"{self.report_dir}/{self.class_stat_fn}", 'w') as _f:
             self.printClassAccuracy(_f)
         self.reportConfusedClasses()
@@ -16,43 +16,66 @@ class ConfusionAnalysis(ABC):
     def writeLargeMatrixInt(cls, m, f):
         """
         Write large matrix to file
+        Each row is formatted at once
         Parameters:
         - m      -- matrix to write as numpy array of floats
         - f      -- file to write the matrix
         """
         _n = m.shape[0]
-        _s = "     "
-        for _i in range(_n):
-            _s += "{:5d} ".format(_i)
-        f.write(_s + "\n")
-        for _i in range(_n):
-            _s = "{:3d} ".format(_i)
-            for _j in range(_n):
-                _s += "{:5d} ".format(m[_i, _j])
-            f.write(_s + "\n")
+        f.write("     " + ("{:5d} " * _n).format(*range(_n)) + "\n")
+        _fmt = "{:3d} " + "{:5d} " * _n + "\n"
+        f.writelines(_fmt.format(_i, *_row)
+                     for _i, _row in enumerate(m.tolist()))
 
     @classmethod
     def writeLargeMatrixPct(cls, m, f, scale):
         """
         Write large matrix to file
+        Each row is formatted at once
         Parameters:
         - m      -- matrix to write as numpy array of floats
         - f      -- file to write the matrix
         - scale  -- multiplier to scale elements of matrix
         """
         _n = m.shape[0]
-        _s = "     "
-        for _i in range(_n):
-            _s += "{:4d} ".format(_i)
-        f.write(_s + "\n")
-        for _i in range(_n):
-            _s = "{:3d} ".format(_i)
-            for _j in range(_n):
-                _s += "{:4.1f} ".format(scale * m[_i, _j])
-            f.write(_s + "\n")
+        f.write("     " + ("{:4d} " * _n).format(*range(_n)) + "\n")
+        _fmt = "{:3d} " + "{:4.1f} " * _n + "\n"
+        f.writelines(_fmt.format(_i, *_row)
+                     for _i, _row in enumerate((scale * m).tolist()))
+
+    @classmethod
+    def writeMatrixBinary(cls, m, fn):
+        """
+        Write matrix into binary numpy file and csv file
+        Parameters:
+        - m   -- matrix to write as numpy array
+        - fn  -- name of files without extension
+        """
+        np.save(f"{fn}.npy", m)
+        np.savetxt(f"{fn}.csv", m, delimiter = ",",
+                   fmt = "%d" if np.issubdtype(m.dtype, np.integer)
+                   else "%.6g")
+
+    @classmethod
+    def groupSamples(cls, samples, keys):
+        """
+        Group indices of samples by keys
+        Parameters:
+        - samples  -- numpy array of ascending indices of samples
+        - keys     -- numpy array of keys of samples
+        Returns: dictionary of numpy arrays of ascending indices
+                 of samples indexed by keys
+        """
+        _order = np.argsort(keys, kind = "stable")
+        _keys = keys[_order]
+        _bounds = np.flatnonzero(np.diff(_keys)) + 1
+        return {int(_g_keys[0]): _g_samples for _g_keys, _g_samples in
+                zip(np.split(_keys, _bounds),
+                    np.split(samples[_order], _bounds))
+                if _g_keys.size}
 
     def __init__(self, probabilities, labels, solutions, 
-                 problems, extreme):
+                 problems, extreme, predictions = None):
         """
         Initialize base class
         for analysis and reporting confusion information
@@ -67,6 +90,9 @@ class ConfusionAnalysis(ABC):
                           as extreme ones;
                           * if extreme < 1.0 it is a fraction of number of problems
                           * if extreme >= 1  it is the number of problems  
+        - predictions   - classification predictions as numpy array
+                          If it is None, they are computed from 
+                          probabilities
         """
         super(ConfusionAnalysis, self).__init__()
         self.probabilities = probabilities
@@ -85,7 +111,8 @@ class ConfusionAnalysis(ABC):
             os.makedirs(self.report_dir)
         #Name of file to write large confusion matrices
         self._conf_mat_fn = "confusion_matrix.lst"
-        self.predictions = self.getPredictions()
+        self.predictions = predictions if predictions is not None \
+            else self.getPredictions()
         self.conf_mat = metrics.confusion_matrix(
             self.labels, self.predictions)
 
@@ -28,6 +28,7 @@ from SeqTok2WaySimDsTF import SeqTok2WaySimDsTF
 from ProgramArguments import *
 from Utilities import *
 from DsUtilities import DataRand
+from DataLoader  import SeqOfTokensLoader
 from SimilConfusion import SimilConfusAnalysis
 from ExpSiamModel import (getLossFunction,
                           relaxedCrossEntropy, sinCrossEntropy,
@@ -43,7 +44,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
 
     latest_checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
 
@@ -55,6 +59,7 @@ def main(args):
             max_seq_length = args.seq_len,
             test = args.testpart,
             batch = args.batch,
+            buckets = args.buckets,
             labels01 = not args.symmetric_labels)
 
     #Create parallelization strategy for multi GPU mode
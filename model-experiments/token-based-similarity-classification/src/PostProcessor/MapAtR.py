@@ -9,13 +9,28 @@ Input data are expected to be in the form of two pickled files:
                                    Each matrix column describes results
                                    of comparing one problem solution with 
                                    solutions of all other problems
+Instead of the pickled matrix, the matrix can be given by
+file similarity_probabilities.npy written by SimSeqTokFullTest.py.
+It is memmapped and processed by blocks of rows.
+
+Besides function computing the metric for the whole matrix in memory,
+the module has functions computing it by blocks of matrix rows.
+They read row blocks from memmapped matrix or from stream of 
+predictions, and process them in a pool of threads.
+MAP at R is computed from sums of average precisions of blocks,
+so the sums computed by different processes can be added up
+(see MergeSimShards.py).
 """
 import sys
 import os
 import argparse
 import pickle
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
+from SimMatrixStore import SimMatrixStore
+
 def map_at_r(sim, pids):
     """
     Function for computing MAP at R metric
@@ -52,6 +67,149 @@ def map_at_r(sim, pids):
     val = np.mean(ap).item()
     return val
 
+def top_predictions(start, rows, k):
+    """
+    Function for selecting top predictions of rows of a block
+    of matrix of predicted similarity measures
+    Similarity of sample to itself is ignored. 
+    Top k predictions of each row are selected with argpartition
+    and only they are sorted
+    Parameter:
+    - start -- index of the first row of the block
+    - rows  -- 2D numpy array of rows of the block
+    - k     -- number of top predictions to select
+    Returns: 
+    - rows of the block as float array with ignored diagonal
+    - 2D numpy array of column indices of top predictions
+      of each row sorted by decreasing similarity
+    """
+    _n_rows = rows.shape[0]
+    _sim = np.array(rows, dtype = np.promote_types(rows.dtype, np.float32))
+    _sim[np.arange(_n_rows), np.arange(start, start + _n_rows)] = -np.inf
+    _top = np.argpartition(-_sim, k - 1, axis = 1)[:, : k]
+    _order = np.argsort(-np.take_along_axis(_sim, _top, axis = 1),
+                        axis = 1, kind = "stable")
+    return _sim, np.take_along_axis(_top, _order, axis = 1)
+
+def average_precisions(result, pids, row_pids, r_rows, max_r):
+    """
+    Function for computing average precisions at R of rows
+    Parameter:
+    - result    -- 2D numpy array of column indices of at least max_r
+                   top predictions of each row sorted by similarity
+    - pids      -- 1D numpy array of problem ids corresponding 
+                   to columns of matrix of predicted similarity measures
+    - row_pids  -- 1D numpy array of problem ids of rows
+    - r_rows    -- 1D numpy array of R of rows, i.e. numbers of other
+                   solutions of their problems
+    - max_r     -- maximum R of all problems
+    Returns: 1D numpy array of average precisions at R of rows
+             Rows of not tested problems have zero precision
+    """
+    #Get correct similarity predictions within R of tested problem
+    tp = pids[result[:, : max_r]] == row_pids[:, np.newaxis]
+    tp &= np.arange(max_r)[np.newaxis, :] < r_rows[:, np.newaxis]
+    p = np.cumsum(tp, axis=1, 
+        dtype = np.float32) / np.arange(1, max_r+1, 
+                            dtype = np.float32)[np.newaxis, :]
+    return (p * tp).sum(axis=1) / np.where(r_rows > 0, r_rows, 1)
+
+def map_at_r_partial(start, rows, pids):
+    """
+    Function for computing sum of average precisions at R 
+    for a block of rows of matrix of predicted similarity measures
+    Similarity of sample to itself is ignored. 
+    Top R predictions of each row are selected with argpartition
+    and only they are sorted
+    Parameter:
+    - start -- index of the first row of the block
+    - rows  -- 2D numpy array of rows of the block
+    - pids  -- 1D numpy array of problem ids corresponding 
+               to columns of matrix of predicted similarity measures
+    Returns: 
+    - sum of average precisions at R of rows of tested problems
+    - number of rows of tested problems
+    """
+    r = np.bincount(pids) - 1
+    max_r = r.max()
+    _n_rows = rows.shape[0]
+    _row_pids = pids[start : start + _n_rows]
+    _r_rows = r[_row_pids]
+    valid = _r_rows > 0
+    if max_r == 0 or not valid.any():
+        return 0.0, 0
+    #Select top predictions and sort only them
+    _, result = top_predictions(start, rows, max_r)
+    ap = average_precisions(result, pids, _row_pids, _r_rows, max_r)[valid]
+    return float(ap.sum(dtype = np.float64)), int(valid.sum())
+
+def map_at_r_sums(blocks, pids, n_threads = 4):
+    """
+    Function for computing sum of average precisions at R 
+    from stream of row blocks of matrix of predicted similarity measures
+    Blocks are processed in a pool of threads. At most 
+    2 * n_threads blocks are held in memory at once
+    Sums computed for disjoint sets of rows can be added up
+    Parameter:
+    - blocks    -- iterable of pairs: <index of the first row of block,
+                   2D numpy array of rows of block>
+    - pids      -- 1D numpy array of problem ids corresponding 
+                   to columns of matrix  of predicted similarity measures
+    - n_threads -- number of threads
+    Returns:
+    - sum of average precisions at R of rows of tested problems
+    - number of rows of tested problems
+    """
+    _ap_sum = 0.0
+    _n_valid = 0
+    _pending = deque()
+    with ThreadPoolExecutor(max_workers = n_threads) as _pool:
+        for _start, _rows in blocks:
+            _pending.append(_pool.submit(map_at_r_partial,
+                                         _start, _rows, pids))
+            if len(_pending) >= 2 * n_threads:
+                _s, _n = _pending.popleft().result()
+                _ap_sum += _s
+                _n_valid += _n
+        for _future in _pending:
+            _s, _n = _future.result()
+            _ap_sum += _s
+            _n_valid += _n
+    return _ap_sum, _n_valid
+
+def map_at_r_blocks(blocks, pids, n_threads = 4):
+    """
+    Function for computing MAP at R metric from stream 
+    of row blocks of matrix of predicted similarity measures
+    Parameter:
+    - blocks    -- iterable of pairs: <index of the first row of block,
+                   2D numpy array of rows of block>
+                   Blocks should cover all rows of the matrix
+    - pids      -- 1D numpy array of problem ids corresponding 
+                   to columns of matrix  of predicted similarity measures
+    - n_threads -- number of threads
+    Returns: computed MAP at R metric
+    """
+    _ap_sum, _n_valid = map_at_r_sums(blocks, pids, n_threads = n_threads)
+    return _ap_sum / _n_valid if _n_valid else float("nan")
+
+def map_at_r_blocked(sim, pids, block = 1024, n_threads = 4):
+    """
+    Function for computing MAP at R metric by blocks of rows
+    The matrix is not modified, it can be read-only memmap
+    Parameter:
+    - sim       -- 2D numpy array or memmap of predicted similarity 
+                   measures for all pairs of samples
+    - pids      -- 1D numpy array of problem ids corresponding 
+                   to columns of matrix  of predicted similarity measures
+    - block     -- number of rows in block
+    - n_threads -- number of threads
+    Returns: computed MAP at R metric
+    """
+    return map_at_r_blocks(((_i, sim[_i : _i + block])
+                            for _i in range(0, sim.shape[0], block)),
+                           pids, n_threads = n_threads)
+
 def main(args):
     """
     Main function of program for computing MAP at R metric
@@ -62,16 +220,28 @@ def main(args):
     with open(f"{args.similarities}/problem_indices.pcl", "rb") as _f:
         pids = pickle.load(_f)
 
+    n_problem_solutions = pids.shape[0]
+    if os.path.exists(f"{args.similarities}/{SimMatrixStore.fn_matrix}"):
+        sim = SimMatrixStore.load(args.similarities)
+        if sim.shape != (n_problem_solutions, n_problem_solutions):
+            sys.exit(f"Similarity matrix of shape {sim.shape} does not " +
+                     f"match number of problem solutions {n_problem_solutions}")
+        map_r = map_at_r_blocked(sim, pids, block = args.block or 1024,
+                                 n_threads = args.threads)
+        print("Map@R is ", map_r)
+        return
+
     with open(f"{args.similarities}/similarity_probabilities.pcl", "rb") as _f:
         sim = pickle.load(_f)
     
-    n_problem_solutions = pids.shape[0]
     if sim.shape[0] != n_problem_solutions * n_problem_solutions:
         sys.exit(
             f"Number of similarity samples {n_problem_solutions.shape[0]} ",
             f" is not square of number of problem solutions {n_problem_solutions}")
-    map_r = map_at_r(sim.reshape(n_problem_solutions, n_problem_solutions),
-                     pids)
+    sim = sim.reshape(n_problem_solutions, n_problem_solutions)
+    map_r = map_at_r_blocked(sim, pids, block = args.block,
+                             n_threads = args.threads) \
+        if args.block else map_at_r(sim, pids)
 
     print("Map@R is ", map_r)
 
@@ -86,6 +256,12 @@ if __name__ == '__main__':
         description = "Computation of MAP at R metric")
     parser.add_argument('similarities', type=str,
                         help='Directory with similarity results')
+    parser.add_argument('--block', default=None, type=int,
+                        help='number of rows of similarity matrix ' +
+                        'processed at once; whole pickled matrix ' +
+                        'if not defined, 1024 for memmapped matrix')
+    parser.add_argument('--threads', default=4, type=int,
+                        help='number of threads processing row blocks')
     args = parser.parse_args()
 
     print("Parameter settings used:")
@@ -0,0 +1,162 @@
+"""
+Program for merging shards of matrix of predicted similarities
+computed by several runs of SimSeqTokFullTest.py with options
+--rows or --shard
+
+The program either:
+- assembles shards into the whole matrix written into file
+  similarity_probabilities.npy, which is read by MapAtR.py; or
+- computes MAP at R metric directly from shards, without
+  assembling the matrix. Partial sums of average precisions
+  written by SimSeqTokFullTest.py with option --map_r are used
+  for shards having them, the others are computed from shards 
+  by blocks of rows.
+"""
+import sys
+import os
+import argparse
+import glob
+import json
+import pickle
+import shutil
+import numpy as np
+
+from SimMatrixStore import SimMatrixStore
+from MapAtR import map_at_r_sums
+
+def readPartialSums(in_dirs):
+    """
+    Read partial sums of MAP at R of shards
+    Partial sums are used only if they were computed from the matrix
+    shard having the same settings as the current one
+    Parameters:
+    - in_dirs  -- list of directories with shards
+    Returns: dictionary of pairs <sum of average precisions,
+             number of rows of tested problems>
+             indexed by pairs <start, end> of rows of shards
+    """
+    _sums = {}
+    for _dir in in_dirs:
+        for _fn in glob.glob(f"{_dir}/map_r.*-*.json"):
+            with open(_fn) as _f:
+                _partial = json.load(_f)
+            _start, _end = _partial["rows"]
+            _store = _partial.get("store")
+            _manifest = None
+            if _store is not None:
+                _, _fn_manifest = SimMatrixStore.fileNames(
+                    _start, _end, _store["n_samples"])
+                _manifest = SimMatrixStore.readManifest(
+                    f"{_dir}/{_fn_manifest}")
+            if _manifest is None or \
+               SimMatrixStore.signature(_manifest) != _store:
+                print(f"Partial sums {_fn} do not match shard " +
+                      f"of rows {_start} - {_end} and are ignored")
+                continue
+            _sums[(_start, _end)] = (_partial["ap_sum"], _partial["n_valid"])
+    return _sums
+
+def mergeMatrix(shards, out_dir, block):
+    """
+    Assemble shards into the whole matrix
+    Parameters:
+    - shards   -- list of shards as returned by SimMatrixStore.shards
+    - out_dir  -- directory to write the matrix to
+    - block    -- number of rows copied at once
+    """
+    _n_samples = shards[0][2].shape[1]
+    _dtype = np.result_type(*(_rows.dtype for _, _, _rows in shards))
+    _store = SimMatrixStore(out_dir, _n_samples, block,
+                            dtype = _dtype.name,
+                            settings = {"merged": len(shards)})
+    for _start, _end, _rows in shards:
+        for _i in range(_start, _end, block):
+            _store.sim[_i : min(_i + block, _end)] = \
+                _rows[_i - _start : _i - _start + block]
+        _store.done(_end)
+    print(f"Matrix of {len(shards)} shards is written into " +
+          f"{_store.fn_matrix}")
+
+def mergeMapAtR(shards, in_dirs, pids, block, n_threads):
+    """
+    Compute MAP at R metric from shards
+    Parameters:
+    - shards     -- list of shards as returned by SimMatrixStore.shards
+    - in_dirs    -- list of directories with shards
+    - pids       -- 1D numpy array of problem ids of samples
+    - block      -- number of rows processed at once
+    - n_threads  -- number of threads
+    Returns: computed MAP at R metric
+    """
+    _sums = readPartialSums(in_dirs)
+    _ap_sum = 0.0
+    _n_valid = 0
+    for _start, _end, _rows in shards:
+        if (_start, _end) in _sums:
+            _s, _n = _sums[(_start, _end)]
+        else:
+            print(f"Computing partial sums of rows {_start} - {_end}")
+            _s, _n = map_at_r_sums(
+                ((_i, _rows[_i - _start : _i - _start + block])
+                 for _i in range(_start, _end, block)),
+                pids, n_threads = n_threads)
+        _ap_sum += _s
+        _n_valid += _n
+    return _ap_sum / _n_valid if _n_valid else float("nan")
+
+def main(args):
+    """
+    Main function of program for merging shards
+    Arguments are descibed below
+    """
+    _in_dirs = args.shards
+    for _dir in _in_dirs:
+        if not os.path.exists(_dir):
+            sys.exit(f"Directory {_dir} with shards does not exist")
+    _shards = SimMatrixStore.shards(_in_dirs)
+    if args.output == "matrix":
+        if not args.out_dir:
+            sys.exit("Option --out_dir is required to write the matrix")
+        os.makedirs(args.out_dir, exist_ok = True)
+        mergeMatrix(_shards, args.out_dir, args.block)
+        _fn_pids = f"{_in_dirs[0]}/problem_indices.pcl"
+        if not os.path.exists(f"{args.out_dir}/problem_indices.pcl"):
+            shutil.copy(_fn_pids, args.out_dir)
+        return
+    with open(f"{_in_dirs[0]}/problem_indices.pcl", "rb") as _f:
+        _pids = pickle.load(_f)
+    if _pids.shape[0] != _shards[0][2].shape[1]:
+        sys.exit(f"Number of problem indices {_pids.shape[0]} does not " +
+                 f"match number of samples {_shards[0][2].shape[1]}")
+    _map_r = mergeMapAtR(_shards, _in_dirs, _pids, args.block, args.threads)
+    print("Map@R is ", _map_r)
+
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nMerging shards of similarity matrix")
+
+    #Command-line arguments
+    parser = argparse.ArgumentParser(
+        description = "Merging shards of similarity matrix")
+    parser.add_argument('shards', type=str, nargs='+',
+                        help='directories with shards of similarity matrix')
+    parser.add_argument('--output', type=str, default="map_r",
+                        choices=["map_r", "matrix"],
+                        help='result of merging: map_r - MAP at R metric, ' +
+                        'matrix - the whole similarity matrix')
+    parser.add_argument('--out_dir', type=str, default=None,
+                        help='directory to write the whole matrix to')
+    parser.add_argument('--block', default=1024, type=int,
+                        help='number of rows of similarity matrix ' +
+                        'processed at once')
+    parser.add_argument('--threads', default=4, type=int,
+                        help='number of threads processing row blocks')
+    args = parser.parse_args()
+
+    print("Parameter settings used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    main(args)
@@ -0,0 +1,283 @@
+"""
+Program for computing retrieval metrics of similarity analysis
+using matrix of predicted similarity strength for all sample pairs
+
+Each row of the matrix is treated as a query retrieving solutions
+of the same problem among all other solutions. Metrics are:
+- MAP at R  -- mean average precision at R, where R is number of
+               other solutions of the problem of query
+- MRR       -- mean reciprocal rank of the first retrieved solution
+               of the same problem
+- P@k, R@k  -- precision and recall of k top retrieved solutions
+
+All metrics are computed in a single pass over blocks of rows:
+top predictions of each row are selected and sorted once and are
+shared by all metrics. Blocks are read from memmapped matrix or
+stream of predictions and processed in a pool of threads.
+
+Input data are the same as of MapAtR.py: problem_indices.pcl and
+either similarity_probabilities.npy or similarity_probabilities.pcl.
+Names of problems are read from problems.pcl, if it exists.
+Per-problem metrics are written into report file retrieval_stat.lst
+of the confusion report directory used by SimilConfusion.py, and
+metrics of all queries are pickled into retrieval_queries.pcl
+"""
+import sys
+import os
+import argparse
+import pickle
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from SimMatrixStore import SimMatrixStore
+from MapAtR import top_predictions, average_precisions
+
+class RetrievalMetrics():
+    """
+    Class computing retrieval metrics of similarity matrix
+    """
+    def __init__(self, pids, ks = (1, 5, 10), problems = None):
+        """
+        Initialize metrics
+        Parameters:
+        - pids      -- 1D numpy array of problem ids corresponding
+                       to rows and columns of similarity matrix
+        - ks        -- numbers of top predictions for P@k and R@k
+        - problems  -- list of names of problems
+                       If it is None, problem ids are used
+        """
+        self.pids = pids
+        self.ks = sorted(ks)
+        self.n_samples = pids.shape[0]
+        self.r = np.bincount(pids) - 1
+        self.max_r = int(self.r.max())
+        #Number of top predictions selected in each row
+        self.top_k = min(max(self.max_r, self.ks[-1]), self.n_samples - 1)
+        self.problems = problems if problems is not None else \
+            [str(_p) for _p in range(self.r.shape[0])]
+        #Metrics of all queries; rows of not tested problems are NaN
+        self.ap = np.full(self.n_samples, np.nan)
+        self.rr = np.full(self.n_samples, np.nan)
+        self.precision = np.full((self.n_samples, len(self.ks)), np.nan)
+        self.recall = np.full((self.n_samples, len(self.ks)), np.nan)
+
+    def blockMetrics(self, start, rows):
+        """
+        Compute metrics of queries of a block of rows
+        Similarity of sample to itself is ignored
+        Parameters:
+        - start -- index of the first row of the block
+        - rows  -- 2D numpy array of rows of the block
+        Returns: start of block and metrics of its rows:
+                 AP@R, reciprocal rank, P@k and R@k
+        """
+        _n_rows = rows.shape[0]
+        _row_pids = self.pids[start : start + _n_rows]
+        _r_rows = self.r[_row_pids]
+        #Top predictions are selected and sorted once for all metrics
+        _sim, _top = top_predictions(start, rows, self.top_k)
+        _rel = self.pids[_top] == _row_pids[:, np.newaxis]
+        _valid = _r_rows > 0
+        _r_valid = np.where(_valid, _r_rows, 1)
+        #Average precision at R is computed as by MapAtR.py
+        _ap = average_precisions(_top, self.pids, _row_pids, _r_rows,
+                                 self.max_r).astype(np.float64)
+        #Rank of the first relevant prediction; if it is beyond top
+        #predictions, it is found by counting more similar samples
+        _hit = _rel.any(axis = 1)
+        _rank = np.argmax(_rel, axis = 1) + 1.0
+        _miss = np.flatnonzero(~_hit & _valid)
+        if _miss.size:
+            _same = self.pids[np.newaxis, :] == _row_pids[_miss, np.newaxis]
+            _best = np.where(_same, _sim[_miss], -np.inf).max(axis = 1)
+            _rank[_miss] = (_sim[_miss] > _best[:, np.newaxis]).sum(axis = 1) + 1
+        _rr = 1.0 / _rank
+        #Precision and recall of top k predictions
+        _n_rel = np.cumsum(_rel, axis = 1)
+        _at_k = np.stack([_n_rel[:, min(_k, self.top_k) - 1]
+                          for _k in self.ks], axis = 1)
+        _precision = _at_k / np.asarray(self.ks, dtype = np.float64)
+        _recall = _at_k / _r_valid[:, np.newaxis]
+        _invalid = ~_valid
+        _ap[_invalid] = np.nan
+        _rr[_invalid] = np.nan
+        _precision[_invalid] = np.nan
+        _recall[_invalid] = np.nan
+        return start, _ap, _rr, _precision, _recall
+
+    def addMetrics(self, start, ap, rr, precision, recall):
+        """
+        Store metrics of block of rows
+        Parameters:
+        - start  -- index of the first row of the block
+        - ap, rr, precision, recall -- metrics returned by blockMetrics
+        """
+        _end = start + ap.shape[0]
+        self.ap[start : _end] = ap
+        self.rr[start : _end] = rr
+        self.precision[start : _end] = precision
+        self.recall[start : _end] = recall
+
+    def evaluate(self, blocks, n_threads = 4):
+        """
+        Compute metrics from stream of row blocks of similarity matrix
+        Blocks are processed in a pool of threads. At most
+        2 * n_threads blocks are held in memory at once
+        Parameters:
+        - blocks    -- iterable of pairs: <index of the first row of block,
+                       2D numpy array of rows of block>
+        - n_threads -- number of threads
+        """
+        _pending = deque()
+        with ThreadPoolExecutor(max_workers = n_threads) as _pool:
+            for _start, _rows in blocks:
+                _pending.append(_pool.submit(self.blockMetrics,
+                                             _start, _rows))
+                if len(_pending) >= 2 * n_threads:
+                    self.addMetrics(*_pending.popleft().result())
+            for _future in _pending:
+                self.addMetrics(*_future.result())
+
+    def evaluateMatrix(self, sim, block = 1024, n_threads = 4):
+        """
+        Compute metrics of similarity matrix by blocks of rows
+        The matrix is not modified, it can be read-only memmap
+        Parameters:
+        - sim       -- 2D numpy array or memmap of similarity matrix
+        - block     -- number of rows in block
+        - n_threads -- number of threads
+        """
+        self.evaluate(((_i, sim[_i : _i + block])
+                       for _i in range(0, sim.shape[0], block)),
+                      n_threads = n_threads)
+
+    def summary(self):
+        """
+        Compute metrics averaged over all tested queries
+        Returns: dictionary of metrics
+        """
+        _summary = {"MAP@R": float(np.nanmean(self.ap)),
+                    "MRR":   float(np.nanmean(self.rr))}
+        for _i, _k in enumerate(self.ks):
+            _summary[f"P@{_k}"] = float(np.nanmean(self.precision[:, _i]))
+            _summary[f"R@{_k}"] = float(np.nanmean(self.recall[:, _i]))
+        return _summary
+
+    def problemMetrics(self):
+        """
+        Compute metrics of queries of each problem
+        Returns: list of tuples for tested problems:
+                 <problem, number of queries, mean AP@R,
+                  median AP@R, min AP@R, max AP@R, MRR,
+                  list of P@k, list of R@k>
+        """
+        _metrics = []
+        for _p in np.flatnonzero(self.r > 0):
+            _queries = self.pids == _p
+            _ap = self.ap[_queries]
+            _metrics.append((int(_p), int(_queries.sum()),
+                             float(_ap.mean()), float(np.median(_ap)),
+                             float(_ap.min()), float(_ap.max()),
+                             float(self.rr[_queries].mean()),
+                             self.precision[_queries].mean(axis = 0).tolist(),
+                             self.recall[_queries].mean(axis = 0).tolist()))
+        return _metrics
+
+    def writeReport(self, report_dir = "confusion_report"):
+        """
+        Write per-problem retrieval report and metrics of all queries
+        Problems are sorted by ascending mean AP@R
+        Parameters:
+        - report_dir  -- directory to write report to
+        """
+        if not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+        _metrics = sorted(self.problemMetrics(), key = lambda _m: _m[2])
+        with open(f"{report_dir}/retrieval_stat.lst", 'w') as _f:
+            _f.write("Retrieval metrics of all queries\n")
+            _f.write("--------------------------------\n")
+            for _name, _value in self.summary().items():
+                _f.write(f"{_name:8s} {_value:.4f}\n")
+            _f.write("\nRetrieval metrics of problems\n")
+            _f.write("-----------------------------\n")
+            _f.write("#    Probl      N       AP@R:  mean  median     min" +
+                     "     max     MRR" +
+                     "".join(f"   P@{_k:<3d}" for _k in self.ks) +
+                     "".join(f"   R@{_k:<3d}" for _k in self.ks) +
+                     "  Problem name\n")
+            for _i, _m in enumerate(_metrics):
+                _f.write("{:4d}  {:4d}  {:5d}       {:7.4f} {:7.4f} {:7.4f} "
+                         "{:7.4f} {:7.4f}".format(_i, *_m[: 7]) +
+                         "".join(f" {_v:7.4f}" for _v in _m[7] + _m[8]) +
+                         f"  {self.problems[_m[0]]}\n")
+        with open(f"{report_dir}/retrieval_queries.pcl", 'wb') as _jar:
+            pickle.dump({"ks":        self.ks,
+                         "ap":        self.ap,
+                         "rr":        self.rr,
+                         "precision": self.precision,
+                         "recall":    self.recall}, _jar)
+#---------------- End of class RetrievalMetrics -------------------------
+
+def main(args):
+    """
+    Main function of program for computing retrieval metrics
+    Arguments are descibed below
+    """
+    if not os.path.exists(args.similarities):
+        sys.exit(f"Directory {args.similarities} with similarity analysis does not exist")
+    with open(f"{args.similarities}/problem_indices.pcl", "rb") as _f:
+        pids = pickle.load(_f)
+    problems = None
+    if os.path.exists(f"{args.similarities}/problems.pcl"):
+        with open(f"{args.similarities}/problems.pcl", "rb") as _f:
+            problems = pickle.load(_f)
+    n_problem_solutions = pids.shape[0]
+    if os.path.exists(f"{args.similarities}/{SimMatrixStore.fn_matrix}"):
+        sim = SimMatrixStore.load(args.similarities)
+    else:
+        with open(f"{args.similarities}/similarity_probabilities.pcl", "rb") as _f:
+            sim = pickle.load(_f)
+        if sim.shape[0] != n_problem_solutions * n_problem_solutions:
+            sys.exit(f"Number of similarity samples {sim.shape[0]} " +
+                     "is not square of number of problem solutions " +
+                     f"{n_problem_solutions}")
+        sim = sim.reshape(n_problem_solutions, n_problem_solutions)
+    if sim.shape != (n_problem_solutions, n_problem_solutions):
+        sys.exit(f"Similarity matrix of shape {sim.shape} does not " +
+                 f"match number of problem solutions {n_problem_solutions}")
+
+    _metrics = RetrievalMetrics(pids, ks = args.ks, problems = problems)
+    _metrics.evaluateMatrix(sim, block = args.block, n_threads = args.threads)
+    for _name, _value in _metrics.summary().items():
+        print(f"{_name} is {_value:.4f}")
+    _metrics.writeReport(args.report_dir)
+
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nComputation of retrieval metrics of similarity analysis")
+
+    #Command-line arguments
+    parser = argparse.ArgumentParser(
+        description = "Computation of retrieval metrics")
+    parser.add_argument('similarities', type=str,
+                        help='Directory with similarity results')
+    parser.add_argument('--ks', default=[1, 5, 10], type=int, nargs='+',
+                        help='numbers of top predictions for ' +
+                        'precision and recall at k')
+    parser.add_argument('--block', default=1024, type=int,
+                        help='number of rows of similarity matrix ' +
+                        'processed at once')
+    parser.add_argument('--threads', default=4, type=int,
+                        help='number of threads processing row blocks')
+    parser.add_argument('--report_dir', default="confusion_report", type=str,
+                        help='directory to write per-problem report to')
+    args = parser.parse_args()
+
+    print("Parameter settings used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    main(args)
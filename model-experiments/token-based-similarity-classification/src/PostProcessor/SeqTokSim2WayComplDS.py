@@ -139,7 +139,8 @@ class SeqTokSim2WayComplDS(SeqOfTokensLoader):
 
     #!!!Another version of tf datset constructor
     #=================================
-    def testDataset(self, batch = 500, shard = "OFF"):
+    def testDataset(self, batch = 500, shard = "OFF", upper = False,
+                    rows = None):
         """
         Make similarity dataset in the form of 
         TensorFlow  Dataset of from_generator type
@@ -156,11 +157,23 @@ class SeqTokSim2WayComplDS(SeqOfTokensLoader):
         - shard      -- option to shard dataset:
                         * "OFF"  -- AutoShardPolicy.OFF
                         " "DATA" -- AutoShardPolicy.DATA
+        - upper      -- flag to make only samples of upper triangle 
+                        of matrix of pairs including its diagonal:
+                        i-th subsequence has samples with j-th solutions
+                        for j >= i. Last batch is not dropped, so the
+                        dataset has all n * (n + 1) / 2 pairs.
+                        It is used for symmetric DNNs, see placeRows
+        - rows       -- pair <start, end> defining range of subsequences,
+                        i.e. of rows of matrix of pairs, to generate
+                        If it is defined, last batch is not dropped
+                        Range of shard of rows is given by shardRows
+                        If it is None, all subsequences are generated
         Returns:
         - Tensorflow dataset combined fromhaving 3 components 
           * two sequences of tokens; and
           * labels
         """
+        _start, _end = rows if rows is not None else (0, self.n_samples)
         def _sample_generator01():
             """
             Function-generator of similarity samples
@@ -171,8 +184,8 @@ class SeqTokSim2WayComplDS(SeqOfTokensLoader):
             - label: 1 if the files solve the same problem
                      0 otherwise
             """
-            for _i in range(self.n_samples):
-                for _j in range(self.n_samples):
+            for _i in range(_start, _end):
+                for _j in range(_i if upper else 0, self.n_samples):
                     yield (self.samples[_i], self.samples[_j]), \
                         int(self.sample_probl_indices[_i] == 
                             self.sample_probl_indices[_j])
@@ -187,8 +200,8 @@ class SeqTokSim2WayComplDS(SeqOfTokensLoader):
             - label: 1 if the files solve the same problem
                      0 otherwise
             """
-            for _i in range(self.n_samples):
-                for _j in range(self.n_samples):
+            for _i in range(_start, _end):
+                for _j in range(_i if upper else 0, self.n_samples):
                     yield (self.samples[_i], self.samples[_j]), \
                         2 * int(self.sample_probl_indices[_i] == 
                             self.sample_probl_indices[_j]) - 1
@@ -204,9 +217,53 @@ class SeqTokSim2WayComplDS(SeqOfTokensLoader):
 
         _ds = _ds.padded_batch(batch,         #padding_values = (0, 0),
                     padded_shapes = (([None], [None]), ()), 
-                               drop_remainder=True)
+                               drop_remainder = not upper and rows is None)
         _ds_options = makeShardOptions(policy = shard)
         _ds = _ds.with_options(_ds_options)
         return _ds
+
+    def shardRows(self, shard, n_shards):
+        """
+        Compute range of rows of shard of matrix of pairs
+        Rows are split into n_shards contiguous ranges of nearly 
+        equal sizes
+        Parameters:
+        - shard     -- index of shard: 0, ..., n_shards - 1
+        - n_shards  -- number of shards
+        Returns: pair <start, end> of rows of shard, 
+                 it can be passed to testDataset as rows
+        """
+        if not 0 <= shard < n_shards:
+            sys.exit(f"Shard index {shard} is not in range 0 - {n_shards - 1}")
+        return (self.n_samples * shard) // n_shards, \
+            (self.n_samples * (shard + 1)) // n_shards
+
+    def placeRows(self, sim, values, start, end, upper = False,
+                  offset = 0):
+        """
+        Place similarities predicted for test dataset of range of rows
+        into matrix of similarities of all pairs of samples
+        Parameters:
+        - sim     -- numpy array or memmap of rows of similarity matrix
+        - values  -- numpy array of similarities in order of samples 
+                     of test dataset
+        - start   -- first row of test dataset
+        - end     -- end of rows of test dataset
+        - upper   -- flag of test dataset of upper triangle of pairs
+                     Its similarities are mirrored into lower triangle
+        - offset  -- index of matrix row of the first row of sim
+                     It is used only without upper flag, since
+                     mirrored similarities are placed outside the rows
+        """
+        if not upper:
+            sim[start - offset : end - offset] = \
+                values.reshape(end - start, self.n_samples)
+            return
+        _counts = self.n_samples - np.arange(start, end)
+        _rows = np.repeat(np.arange(start, end), _counts)
+        _cols = _rows + np.arange(_rows.shape[0]) - \
+            np.repeat(np.cumsum(_counts) - _counts, _counts)
+        sim[_rows - offset, _cols] = values
+        sim[_cols - offset, _rows] = values
 #---------------- End of class SeqTok2WaySimDsTF -------------------------
 
@@ -0,0 +1,374 @@
+"""
+Module for evaluating siamese similarity DNN on all pairs
+of source code samples
+
+Siamese DNN applies the same tower to both its inputs and
+merges the tower outputs with a head. The module splits a loaded
+DNN into the tower and the head, computes embeddings of all samples
+once, and evaluates the head on blocks of the grid of all pairs.
+
+The head is evaluated by one of methods selected by its first layer:
+- dot      -- Dot layer, as in dot_prod_sigmoid and cosine merging:
+              the block is computed with matrix product of embeddings
+- concat   -- Concatenate layer followed by Dense layer:
+              the Dense layer is split into parts applied to
+              embeddings of each input, they are computed once
+              and summed for each pair of the block
+- pairs    -- any other head, e.g. subtract merging:
+              the head is applied to all pairs of embeddings
+              of the block
+Layers following the first layer of the head (or of the Dense layer)
+are applied to the block as a batch
+
+If DNN is symmetric, i.e. similarity of (i, j) pair equals 
+similarity of (j, i) pair, only blocks of upper triangle of the grid 
+are evaluated and the lower triangle is filled by mirroring them.
+Symmetry is detected from structure of the head: head of dot method 
+is applied to the same embeddings of both inputs, or otherwise
+by probing DNN or its head on random pairs in both orders.
+"""
+import sys
+from itertools import count
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from DsUtilities import makeRaggedTokens, paddedRows
+
+class SiamesePairsEvaluator():
+    """
+    Evaluator of siamese DNN on all pairs of samples
+    """
+    def __init__(self, dnn):
+        """
+        Split siamese DNN into tower and head
+        Parameters:
+        - dnn  -- loaded siamese DNN with two inputs
+        """
+        self.tower, _out1, _out2 = self.findTower(dnn)
+        _emb_shape = tuple(_out1.shape[1 :])
+        _emb1 = layers.Input(shape = _emb_shape)
+        _emb2 = layers.Input(shape = _emb_shape)
+        self.head = models.Model(
+            [_emb1, _emb2],
+            self.replay(dnn, [(_out1, _emb1), (_out2, _emb2)]))
+        self.emb_dim = int(np.prod(_emb_shape))
+        self.makeMethod()
+        self._block = tf.function(
+            self._pairBlock,
+            input_signature = [
+                tf.TensorSpec(shape = (None, self.proj_dim),
+                              dtype = tf.float32),
+                tf.TensorSpec(shape = (None, self.proj_dim),
+                              dtype = tf.float32)])
+        print(f"DNN is split into tower with {self.emb_dim} outputs " +
+              f"and head evaluated by {self.method} method")
+
+    @classmethod
+    def layerNodes(cls, layer):
+        """
+        Get inputs and outputs of all calls of layer
+        Parameters:
+        - layer  -- Keras layer
+        Returns: list of pairs <input, output> of layer calls
+        """
+        _nodes = []
+        for _k in count():
+            try:
+                _nodes.append((layer.get_input_at(_k),
+                               layer.get_output_at(_k)))
+            except (ValueError, IndexError, RuntimeError):
+                return _nodes
+
+    @classmethod
+    def findTower(cls, dnn):
+        """
+        Find shared tower of siamese DNN
+        Tower is a model applied to both inputs of DNN
+        Parameters:
+        - dnn  -- siamese DNN
+        Returns:
+        - tower as Keras model
+        - output of tower applied to 1-st input of DNN
+        - output of tower applied to 2-nd input of DNN
+        """
+        if len(dnn.inputs) != 2:
+            sys.exit("Siamese DNN should have two inputs")
+        for _layer in dnn.layers:
+            if not isinstance(_layer, tf.keras.Model):
+                continue
+            _outputs = {}
+            for _input, _output in cls.layerNodes(_layer):
+                for _i, _x in enumerate(dnn.inputs):
+                    if _input is _x:
+                        _outputs[_i] = _output
+            if len(_outputs) == 2:
+                return _layer, _outputs[0], _outputs[1]
+        sys.exit("DNN has no tower shared by its inputs. " +
+                 "It cannot be evaluated by embeddings")
+
+    @classmethod
+    def replay(cls, dnn, start):
+        """
+        Apply layers of DNN following the given tensors of DNN
+        to new tensors
+        Parameters:
+        - dnn    -- Keras functional model
+        - start  -- list of pairs <tensor of dnn, new tensor>
+        Returns: new output tensor of dnn
+        """
+        _map = {id(_old): _new for _old, _new in start}
+        #Calls of layers are collected before new calls are made
+        _nodes = [(_layer, _input, _output) for _layer in dnn.layers
+                  for _input, _output in cls.layerNodes(_layer)]
+        for _layer, _input, _output in _nodes:
+            if id(_output) in _map:
+                continue
+            _inputs = _input if isinstance(_input, list) else [_input]
+            if all(id(_x) in _map for _x in _inputs):
+                _new = [_map[id(_x)] for _x in _inputs]
+                _map[id(_output)] = _layer(
+                    _new if isinstance(_input, list) else _new[0])
+        try:
+            return _map[id(dnn.outputs[0])]
+        except KeyError:
+            sys.exit("DNN head does not depend only on its tower outputs")
+
+    def makeMethod(self):
+        """
+        Select method of evaluation of head
+        Computes:
+        - self.method    -- method of evaluation: dot, concat or pairs
+        - self.rest      -- model applied to results of first layer
+                            of head, or to all pairs of embeddings
+        - self.proj_dim  -- dimension of embeddings passed to blocks
+        """
+        _layers = [_l for _l in self.head.layers
+                   if not isinstance(_l, layers.InputLayer)]
+        _first = _layers[0]
+        _nodes = self.layerNodes(_first)
+        _in_order = len(_nodes) == 1 and \
+            isinstance(_nodes[0][0], list) and \
+            len(_nodes[0][0]) == 2 and \
+            _nodes[0][0][0] is self.head.inputs[0] and \
+            _nodes[0][0][1] is self.head.inputs[1]
+        self.proj_dim = self.emb_dim
+        self.method = "pairs"
+        self.rest = self.head
+        if not _in_order or len(self.head.inputs[0].shape) != 2:
+            return
+        if isinstance(_first, layers.Dot):
+            self.method = "dot"
+            self.normalize = _first.normalize
+            self.rest = self.restModel(_nodes[0][1])
+        elif isinstance(_first, layers.Concatenate) and len(_layers) > 1 \
+             and isinstance(_layers[1], layers.Dense):
+            _dense_nodes = self.layerNodes(_layers[1])
+            if len(_dense_nodes) != 1 or \
+               _dense_nodes[0][0] is not _nodes[0][1]:
+                return
+            self.method = "concat"
+            self.dense = _layers[1]
+            self.proj_dim = int(self.dense.units)
+            self.rest = self.restModel(_dense_nodes[0][1])
+
+    def restModel(self, tensor):
+        """
+        Make model of head layers following the given head tensor
+        Parameters:
+        - tensor  -- tensor of head
+        Returns: model or None if the tensor is output of head
+        """
+        if tensor is self.head.outputs[0]:
+            return None
+        _input = layers.Input(shape = tuple(tensor.shape[1 :]))
+        return models.Model(_input,
+                            self.replay(self.head, [(tensor, _input)]))
+
+    def embeddings(self, samples, batch = 256, project = True):
+        """
+        Compute tower embeddings of samples
+        For concat method embeddings are projected by parts of
+        Dense layer following concatenation
+        Parameters:
+        - samples  -- list of samples (sequences of tokens)
+        - batch    -- batch size
+        - project  -- flag to project embeddings for concat method
+                      Otherwise tower outputs are returned
+        Returns:
+        - numpy array of embeddings of samples for 1-st input
+        - numpy array of embeddings of samples for 2-nd input
+        """
+        _tokens = makeRaggedTokens(samples)
+        _ds = tf.data.Dataset.range(len(samples)).batch(batch)
+        _ds = _ds.map(lambda _i: paddedRows(_tokens, _i),
+                      num_parallel_calls = tf.data.AUTOTUNE)
+        _emb = self.tower.predict(_ds.prefetch(tf.data.AUTOTUNE))
+        _emb = _emb.reshape(len(samples), -1).astype(np.float32)
+        if self.method != "concat" or not project:
+            return _emb, _emb
+        _kernel = self.dense.kernel.numpy()
+        _bias = self.dense.bias.numpy() if self.dense.use_bias else 0
+        return _emb @ _kernel[: self.emb_dim], \
+            _emb @ _kernel[self.emb_dim :] + _bias
+
+    def _pairBlock(self, rows, cols):
+        """
+        Evaluate head on all pairs of a block
+        Parameters:
+        - rows  -- embeddings of samples of rows for 1-st input
+        - cols  -- embeddings of samples of columns for 2-nd input
+        Returns: tensor of similarities of block
+        """
+        _n_rows = tf.shape(rows)[0]
+        _n_cols = tf.shape(cols)[0]
+        if self.method == "dot":
+            if self.normalize:
+                rows = tf.math.l2_normalize(rows, axis = 1)
+                cols = tf.math.l2_normalize(cols, axis = 1)
+            _z = tf.reshape(tf.matmul(rows, cols, transpose_b = True),
+                            (-1, 1))
+        elif self.method == "concat":
+            _z = self.dense.activation(tf.reshape(
+                rows[:, None, :] + cols[None, :, :], (-1, self.proj_dim)))
+        else:
+            _z = [tf.repeat(rows, _n_cols, axis = 0),
+                  tf.tile(cols, [_n_rows, 1])]
+        if self.rest is not None:
+            _z = self.rest(_z, training = False)
+        return tf.reshape(_z, (_n_rows, _n_cols))
+
+    def similarityBlock(self, rows, cols):
+        """
+        Compute similarities of block of pairs
+        Parameters:
+        - rows  -- numpy array of embeddings of samples of rows
+        - cols  -- numpy array of embeddings of samples of columns
+        Returns: numpy array of similarities
+        """
+        return self._block(tf.constant(rows), tf.constant(cols)).numpy()
+
+    @classmethod
+    def probePairs(cls, n_samples, n_probes):
+        """
+        Select random pairs of samples for probing symmetry
+        Parameters:
+        - n_samples  -- number of samples
+        - n_probes   -- number of pairs
+        Returns: two numpy arrays of indices of samples of pairs
+        """
+        #Probes are fixed to make the decision reproducible
+        _rng = np.random.default_rng(n_samples)
+        return _rng.integers(0, n_samples, size = (2, n_probes))
+
+    @classmethod
+    def probeDnn(cls, dnn, samples, n_probes = 64, tol = 1e-5):
+        """
+        Check that DNN is symmetric on random pairs of samples
+        Parameters:
+        - dnn       -- DNN with two inputs
+        - samples   -- list of samples (sequences of tokens)
+        - n_probes  -- number of probed pairs
+        - tol       -- relative and absolute tolerance of comparison
+        Returns: True if DNN is symmetric on all probes
+        """
+        _idx1, _idx2 = cls.probePairs(len(samples), n_probes)
+        _tokens = makeRaggedTokens(samples)
+        _x1 = paddedRows(_tokens, _idx1)
+        _x2 = paddedRows(_tokens, _idx2)
+        _p12 = dnn.predict((_x1, _x2), verbose = 0)
+        _p21 = dnn.predict((_x2, _x1), verbose = 0)
+        return bool(np.allclose(_p12, _p21, rtol = tol, atol = tol))
+
+    def isSymmetric(self, emb1, emb2, n_probes = 64, tol = 1e-5):
+        """
+        Check that head is symmetric
+        Head of dot method is symmetric, if both its inputs 
+        are the same embeddings, other heads are probed 
+        on random pairs of embeddings
+        Parameters:
+        - emb1      -- numpy array of embeddings for 1-st input
+        - emb2      -- numpy array of embeddings for 2-nd input
+        - n_probes  -- number of probed pairs
+        - tol       -- relative and absolute tolerance of comparison
+        Returns: True if head is symmetric
+        """
+        if self.method == "dot" and emb1 is emb2:
+            return True
+        _idx1, _idx2 = self.probePairs(emb1.shape[0], n_probes)
+        #Pairs are taken from diagonals of blocks of probes
+        _p12 = np.diagonal(self.similarityBlock(emb1[_idx1], emb2[_idx2]))
+        _p21 = np.diagonal(self.similarityBlock(emb1[_idx2], emb2[_idx1]))
+        return bool(np.allclose(_p12, _p21, rtol = tol, atol = tol))
+
+    def prepare(self, samples, batch = 256, symmetry = "off"):
+        """
+        Compute embeddings of samples and decide on use of symmetry
+        Computes:
+        - self.emb1, self.emb2  -- embeddings for 1-st and 2-nd input
+        - self.symmetric        -- flag to evaluate only upper triangle
+        Parameters:
+        - samples  -- list of samples (sequences of tokens)
+        - batch    -- batch size for computing embeddings
+        - symmetry -- use of symmetry of DNN:
+                      * "off"  -- all blocks are evaluated
+                      * "auto" -- upper triangle of blocks is evaluated
+                                  and mirrored if head is symmetric
+                      * "on"   -- DNN is known to be symmetric
+        Returns: flag of evaluation of only upper triangle
+        """
+        self.emb1, self.emb2 = self.embeddings(samples, batch = batch)
+        self.symmetric = symmetry == "on" or \
+            (symmetry == "auto" and self.isSymmetric(self.emb1, self.emb2))
+        if symmetry != "off":
+            print("Upper triangle of similarity matrix is evaluated" 
+                  if self.symmetric else 
+                  "DNN is not symmetric, whole similarity matrix is evaluated")
+        return self.symmetric
+
+    def fillRows(self, sim, start, end, block = 256, offset = 0):
+        """
+        Compute similarities of range of rows of similarity matrix
+        If upper triangle is evaluated, only columns starting from
+        the first row of the range are computed, and they are mirrored
+        into the following rows, so the rows are complete if all
+        preceding rows were filled before
+        Parameters:
+        - sim    -- numpy array or memmap of similarity matrix
+        - start  -- first row of the range
+        - end    -- end of rows of the range
+        - block  -- number of columns of block of pairs
+        - offset -- index of matrix row of the first row of sim
+                    It is used only for evaluation of whole matrix,
+                    since mirrored similarities are placed outside 
+                    the rows
+        """
+        _n = self.emb1.shape[0]
+        _rows = self.emb1[start : end]
+        for _j in range(start if self.symmetric else 0, _n, block):
+            _sim = self.similarityBlock(_rows, self.emb2[_j : _j + block])
+            sim[start - offset : end - offset, _j : _j + block] = _sim
+            if self.symmetric:
+                #Columns of following rows are mirrored
+                _k = max(end - _j, 0)
+                sim[_j + _k : _j + block, start : end] = _sim[:, _k :].T
+
+    def similarityMatrix(self, samples, batch = 256, block = 256,
+                         symmetry = "off"):
+        """
+        Compute similarities of all pairs of samples
+        Parameters:
+        - samples  -- list of samples (sequences of tokens)
+        - batch    -- batch size for computing embeddings
+        - block    -- number of rows and columns of block of pairs
+        - symmetry -- use of symmetry of DNN, see prepare
+        Returns: numpy array of similarities:
+                 element [i, j] is similarity of i-th and j-th samples
+        """
+        self.prepare(samples, batch = batch, symmetry = symmetry)
+        _n = len(samples)
+        _sim = np.empty((_n, _n), dtype = np.float32)
+        for _i in range(0, _n, block):
+            self.fillRows(_sim, _i, min(_i + block, _n), block = block)
+        return _sim
+#---------------- End of class SiamesePairsEvaluator -------------------------
@@ -0,0 +1,214 @@
+"""
+Module for storing matrix of predicted similarities of all pairs
+of samples in a memmapped file written by blocks of rows
+
+The matrix is preallocated in file similarity_probabilities.npy
+in numpy format, so it can be memmapped by np.load.
+Progress of computation is recorded in manifest file
+similarity_manifest.json after each block of rows is written.
+Interrupted computation is resumed from the first incomplete block,
+if it is restarted with the same settings.
+
+Matrix can be computed by several processes, each computing
+a shard of the matrix, i.e. a range of its rows <start, end>.
+Shard is stored in files similarity_probabilities.<start>-<end>.npy
+and similarity_manifest.<start>-<end>.json
+"""
+import sys
+import os
+import glob
+import json
+import numpy as np
+
+class SimMatrixStore():
+    """
+    Memmapped matrix of similarities written by blocks of rows
+    """
+    #Names of files of the matrix and its manifest
+    fn_matrix = "similarity_probabilities.npy"
+    fn_manifest = "similarity_manifest.json"
+
+    def __init__(self, out_dir, n_samples, block,
+                 dtype = "float32", settings = None, rows = None):
+        """
+        Open matrix for writing
+        The matrix is resumed if its manifest has the same settings,
+        otherwise a new matrix is allocated
+        Parameters:
+        - out_dir    -- directory to write matrix to
+        - n_samples  -- number of samples
+        - block      -- number of rows in block
+        - dtype      -- data type of stored similarities:
+                        float16 or float32
+        - settings   -- dictionary of settings of computation
+                        which should be the same to resume it
+        - rows       -- pair <start, end> defining shard of matrix rows
+                        If it is None, the whole matrix is stored
+        """
+        self.start, self.end = rows if rows is not None else (0, n_samples)
+        _fn_matrix, _fn_manifest = \
+            self.fileNames(self.start, self.end, n_samples)
+        self.fn_matrix = f"{out_dir}/{_fn_matrix}"
+        self.fn_manifest = f"{out_dir}/{_fn_manifest}"
+        self.manifest = {"n_samples": n_samples,
+                         "rows":      [self.start, self.end],
+                         "shape":     [self.end - self.start, n_samples],
+                         "dtype":     dtype,
+                         "block":     block,
+                         "settings":  settings or {},
+                         "n_done":    0}
+        _old = self.readManifest(self.fn_manifest)
+        if _old is not None and os.path.exists(self.fn_matrix) and \
+           all(_old.get(_k) == self.manifest[_k]
+               for _k in self.manifest if _k != "n_done"):
+            self.manifest["n_done"] = _old["n_done"]
+            self.sim = np.load(self.fn_matrix, mmap_mode = "r+")
+            print("Similarity matrix is resumed from row " +
+                  f"{self.start + self.n_done} of rows " +
+                  f"{self.start} - {self.end}")
+        else:
+            self.sim = np.lib.format.open_memmap(
+                self.fn_matrix, mode = "w+", dtype = dtype,
+                shape = tuple(self.manifest["shape"]))
+            self.writeManifest()
+
+    @property
+    def n_done(self):
+        return self.manifest["n_done"]
+
+    @property
+    def complete(self):
+        return self.n_done >= self.manifest["shape"][0]
+
+    @classmethod
+    def fileNames(cls, start, end, n_samples):
+        """
+        Make names of files of matrix shard
+        Parameters:
+        - start      -- first row of shard
+        - end        -- end of rows of shard
+        - n_samples  -- number of samples
+        Returns: names of files of matrix and of its manifest
+        """
+        if start == 0 and end == n_samples:
+            return cls.fn_matrix, cls.fn_manifest
+        _matrix, _ext_matrix = os.path.splitext(cls.fn_matrix)
+        _manifest, _ext_manifest = os.path.splitext(cls.fn_manifest)
+        return f"{_matrix}.{start}-{end}{_ext_matrix}", \
+            f"{_manifest}.{start}-{end}{_ext_manifest}"
+
+    @staticmethod
+    def signature(manifest):
+        """
+        Get settings of matrix identifying its contents
+        Parameters:
+        - manifest  -- manifest of matrix
+        Returns: manifest without progress of computation
+        """
+        return {_k: _v for _k, _v in manifest.items() if _k != "n_done"}
+
+    @classmethod
+    def readManifest(cls, fn):
+        """
+        Read manifest of matrix
+        Parameters:
+        - fn  -- name of manifest file
+        Returns: manifest as dictionary or None if it does not exist
+        """
+        try:
+            with open(fn) as _f:
+                return json.load(_f)
+        except (OSError, ValueError):
+            return None
+
+    def writeManifest(self):
+        """
+        Write manifest of matrix
+        Manifest is replaced atomically
+        """
+        with open(f"{self.fn_manifest}.tmp", 'w') as _f:
+            json.dump(self.manifest, _f)
+        os.replace(f"{self.fn_manifest}.tmp", self.fn_manifest)
+
+    def blocks(self):
+        """
+        Generate ranges of rows of incomplete blocks
+        Returns: generator of pairs <start row, end row>
+                 Rows are numbered in the whole matrix
+        """
+        _block = self.manifest["block"]
+        for _start in range(self.start + self.n_done, self.end, _block):
+            yield _start, min(_start + _block, self.end)
+
+    def done(self, end):
+        """
+        Record completion of rows up to the given one
+        Parameters:
+        - end  -- end of completed rows in the whole matrix
+        """
+        self.sim.flush()
+        self.manifest["n_done"] = end - self.start
+        self.writeManifest()
+
+    @classmethod
+    def load(cls, in_dir):
+        """
+        Open complete matrix for reading
+        Parameters:
+        - in_dir  -- directory with the matrix
+        Returns: read-only memmap of the matrix
+        """
+        _manifest = cls.readManifest(f"{in_dir}/{cls.fn_manifest}")
+        if _manifest is None:
+            sys.exit(f"Similarity matrix in {in_dir} has no manifest")
+        if _manifest["n_done"] < _manifest["shape"][0]:
+            sys.exit(f"Similarity matrix in {in_dir} is incomplete: " +
+                     f"{_manifest['n_done']} of " +
+                     f"{_manifest['shape'][0]} rows are computed")
+        return np.load(f"{in_dir}/{cls.fn_matrix}", mmap_mode = "r")
+
+    @classmethod
+    def shards(cls, in_dirs):
+        """
+        Find complete shards of matrix
+        Shards should cover all rows of the matrix without overlaps
+        Parameters:
+        - in_dirs  -- list of directories with shards
+        Returns: list of triples sorted by first rows of shards:
+                 <first row of shard, end of rows of shard,
+                  read-only memmap of rows of shard>
+        """
+        _manifest, _ext = os.path.splitext(cls.fn_manifest)
+        _shards = []
+        _n_samples = None
+        for _dir in in_dirs:
+            for _fn in glob.glob(f"{_dir}/{_manifest}.*-*{_ext}"):
+                _m = cls.readManifest(_fn)
+                if _m is None:
+                    sys.exit(f"Cannot read manifest {_fn}")
+                _start, _end = _m["rows"]
+                if _m["n_done"] < _end - _start:
+                    sys.exit(f"Shard of rows {_start} - {_end} is " +
+                             f"incomplete: {_m['n_done']} rows are computed")
+                if _n_samples is not None and _m["n_samples"] != _n_samples:
+                    sys.exit(f"Shard {_fn} has {_m['n_samples']} samples, " +
+                             f"other shards have {_n_samples} samples")
+                _n_samples = _m["n_samples"]
+                _fn_matrix, _ = cls.fileNames(_start, _end, _n_samples)
+                _shards.append((_start, _end,
+                                np.load(f"{_dir}/{_fn_matrix}",
+                                        mmap_mode = "r")))
+        if not _shards:
+            sys.exit(f"No shards of similarity matrix in {in_dirs}")
+        _shards.sort(key = lambda _s: _s[0])
+        _expected = 0
+        for _start, _end, _ in _shards:
+            if _start != _expected:
+                sys.exit(f"Shards do not cover rows {_expected} - {_start}"
+                         if _start > _expected else
+                         f"Shards overlap at row {_start}")
+            _expected = _end
+        if _expected != _n_samples:
+            sys.exit(f"Shards do not cover rows {_expected} - {_n_samples}")
+        return _shards
+#---------------- End of class SimMatrixStore -------------------------
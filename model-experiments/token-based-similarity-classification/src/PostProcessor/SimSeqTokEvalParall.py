@@ -22,8 +22,10 @@ sys.path.extend([f"{main_dir}/SeqOfTokens",
 from SeqTok2WaySimDsTF import SeqTok2WaySimDsTF
 from ProgramArguments import *
 from Utilities import *
-from DsUtilities import DataRand
+from DsUtilities import DataRand, distributeDataset
+from DataLoader  import SeqOfTokensLoader
 from SimilConfusion import SimilConfusAnalysis
+from StreamingEval import StreamingEvaluator
 
 def main(args):
     """
@@ -35,7 +37,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
 
     latest_checkpoint = getCheckpoint(args.ckpt_dir, args.ckpt)
 
@@ -47,6 +52,8 @@ def main(args):
             max_seq_length = args.seq_len,
             test = args.testpart,
             batch = args.batch,
+            buckets = args.buckets,
+            shard = args.shard,
             labels01 = not args.symmetric_labels)
 
     #Create parallelization strategy for multi GPU mode
@@ -63,17 +70,30 @@ def main(args):
         _dnn = tf.keras.models.load_model(latest_checkpoint)
     _test_ds, _labels, _annotations = \
                     _ds.testDataset(args.valsize, args.similpart)
-    _eval_loss, _eval_acc = _dnn.evaluate(_test_ds.prefetch(2), 
-                                          verbose = args.progress)
+    if args.single_pass:
+        _evaluator = StreamingEvaluator(_dnn, len(_labels),
+                                        task = "similarity",
+                                        labels01 = not args.symmetric_labels)
+        _evaluator.run(_test_ds, args.progress)
+        _eval_acc = _evaluator.accuracy(_labels)
+        _eval_loss = _evaluator.loss()
+        _confusion = _evaluator.similConfusion(_labels, _ds.solution_names,
+                                               _ds.problems, _annotations)
+    else:
+        _test_ds = distributeDataset(strategy, _test_ds,
+                                     lambda _ds: _ds.prefetch(2))
+        _eval_loss, _eval_acc = _dnn.evaluate(_test_ds, 
+                                              verbose = args.progress)
 
-    _prob = _dnn.predict(_test_ds.prefetch(2), verbose = args.progress)
-    _confusion = SimilConfusAnalysis(_prob, _labels, 
-                                     _ds.solution_names,
-                                     _ds.problems, _annotations,
-                                     labels01 = not args.symmetric_labels)
+        _prob = _dnn.predict(_test_ds, verbose = args.progress)
+        _confusion = SimilConfusAnalysis(_prob, _labels, 
+                                         _ds.solution_names,
+                                         _ds.problems, _annotations,
+                                         labels01 = not args.symmetric_labels)
     print("\n")
     print("Evaluation accuracy is {:5.2f}%".format(_eval_acc * 100))
-    print("Evaluation loss is {:5.2f}".format(_eval_loss))
+    if _eval_loss is not None:
+        print("Evaluation loss is {:5.2f}".format(_eval_loss))
     _confusion.writeReport()
 ##############################################################################
 # Args are described below
@@ -91,6 +111,10 @@ if __name__ == '__main__':
     parser.add_argument('--symmetric_labels', action='store_true', 
                         default=False,
                         help="use symmetric labels: -1 and +1")
+    parser.add_argument("--single_pass", action="store_true",
+                        help="predict test dataset once and accumulate " +
+                        "loss, accuracy and confusion analysis results " +
+                        "batch by batch")
     args = parseArguments(parser)
     main(args)
 
@@ -3,11 +3,26 @@ Program for complete evaluation of source code similarity analyzer
 using sequence or Tokens technique by 2-way siamese type DNN
 Program analyzes all pairs of source code samples
 Program operated in in multi-GPU mode
+
+In embedding mode the siamese DNN is split into its tower and head.
+Tower embeddings of all samples are computed once, and the head is 
+evaluated on blocks of pairs of embeddings
+
+Similarity matrix is written by blocks of rows into preallocated
+file similarity_probabilities.npy (see SimMatrixStore), which 
+is memmapped by MapAtR.py. Progress is recorded in manifest file, 
+and restarted program resumes from the first incomplete block
+
+Matrix can be computed by several processes, each computing a shard,
+i.e. a range of rows defined by option --rows or --shard. 
+Shards are merged by program MergeSimShards.py
 """
 import sys
 import os
 import argparse
+import json
 import pickle
+import numpy as np
 import tensorflow as tf
 
 main_dir = os.path.dirname(
@@ -17,10 +32,60 @@ sys.path.extend([f"{main_dir}/Dataset",
                  f"{main_dir}/PostProcess"])
 
 from SeqTokSim2WayComplDS import SeqTokSim2WayComplDS
+from SiamesePairsEval import SiamesePairsEvaluator
+from SimMatrixStore import SimMatrixStore
+from MapAtR import map_at_r_sums
 from ProgramArguments import parseArguments
 from Utilities import *
 from SimilConfusion import SimilConfusAnalysis
 
+def matrixAccuracy(sim, problem_indices, threshold, block = 1024,
+                   start = 0):
+    """
+    Compute accuracy of matrix of similarities of all pairs of samples
+    Parameters:
+    - sim              -- numpy array of rows of similarity matrix
+    - problem_indices  -- numpy array of problem indices of samples
+    - threshold        -- similarities above it predict similar samples
+    - block            -- number of rows processed at once
+    - start            -- index of matrix row of the first row of sim
+    Returns: accuracy
+    """
+    _n_right = 0
+    for _i in range(0, sim.shape[0], block):
+        _similar = \
+            problem_indices[start + _i : start + _i + block, None] == \
+            problem_indices[None, :]
+        _n_right += int(np.count_nonzero(
+            (sim[_i : _i + block] > threshold) == _similar))
+    return _n_right / float(sim.shape[0] * sim.shape[1])
+
+def rowRange(args, ds):
+    """
+    Get range of rows of similarity matrix to compute
+    Parameters:
+    - args  -- parsed main program arguments
+    - ds    -- SeqTokSim2WayComplDS object
+    Returns: pair <start, end> of rows, or None for all rows
+    """
+    if args.rows and args.shard:
+        sys.exit("Only one of options --rows and --shard can be defined")
+    try:
+        if args.rows:
+            _start, _end = (int(_x) for _x in args.rows.split(":"))
+        elif args.shard:
+            _start, _end = ds.shardRows(
+                *(int(_x) for _x in args.shard.split("/")))
+        else:
+            return None
+    except ValueError:
+        sys.exit("Options --rows and --shard should have forms " +
+                 "start:end and k/n")
+    if not 0 <= _start < _end <= ds.n_samples:
+        sys.exit(f"Rows {_start} - {_end} are not in range " +
+                 f"0 - {ds.n_samples}")
+    return _start, _end
+
 def main(args):
     """
     Main function of program for predicting similarity of 
@@ -44,6 +109,8 @@ def main(args):
     _sample_probl_indices = _ds.sample_probl_indices
     with open(f"{args.out_dir}/problem_indices.pcl", "wb") as _f:
         pickle.dump(_sample_probl_indices, _f)
+    with open(f"{args.out_dir}/problems.pcl", "wb") as _f:
+        pickle.dump(_ds.problems, _f)
 
     #Create parallelization strategy for multi GPU mode
     #It also can be either MirroredStrategy or MultiWorkerMirroredStrategy
@@ -57,16 +124,71 @@ def main(args):
         # In general this is only model construction & `compile()`.
         print("Restoring from", latest_checkpoint)
         _dnn = tf.keras.models.load_model(latest_checkpoint)
-    _test_ds = _ds.testDataset(batch = args.batch)
+    _rows = rowRange(args, _ds)
+    _symmetry = args.symmetry
+    if _rows is not None and _symmetry != "off":
+        #Mirrored similarities fall outside the range of rows
+        print("Symmetry is not used for computing range of rows")
+        _symmetry = "off"
+    #Similarity matrix is written by blocks of rows into memmapped file
+    #Interrupted computation is resumed from the first incomplete block
+    _store = SimMatrixStore(args.out_dir, _ds.n_samples, args.block,
+                            rows = _rows,
+                            dtype = args.dtype,
+                            settings = {"dataset":    args.dataset,
+                                        "mode":       args.mode,
+                                        "symmetry":   _symmetry,
+                                        "checkpoint": latest_checkpoint})
+    _fn_map_r = f"{args.out_dir}/map_r.{_store.start}-{_store.end}.json"
+    if not _store.complete and os.path.exists(_fn_map_r):
+        #Partial sums of previously computed rows are stale
+        os.remove(_fn_map_r)
+    if not _store.complete:
+        if args.mode == "embed":
+            _evaluator = SiamesePairsEvaluator(_dnn)
+            _evaluator.prepare(_ds.samples, batch = args.batch,
+                               symmetry = _symmetry)
+        else:
+            _symmetric = _symmetry == "on" or \
+                (_symmetry == "auto" and 
+                 SiamesePairsEvaluator.probeDnn(_dnn, _ds.samples))
+            if _symmetry != "off":
+                print("Upper triangle of similarity matrix is evaluated" 
+                      if _symmetric else 
+                      "DNN is not symmetric, whole similarity matrix is evaluated")
+    for _start, _end in _store.blocks():
+        if args.mode == "embed":
+            _evaluator.fillRows(_store.sim, _start, _end, block = args.block,
+                                offset = _store.start)
+        else:
+            _test_ds = _ds.testDataset(batch = args.batch, upper = _symmetric,
+                                       rows = (_start, _end))
+            _prob = _dnn.predict(_test_ds, verbose = args.progress)
+            _ds.placeRows(_store.sim, _prob[:, 0], _start, _end,
+                          upper = _symmetric, offset = _store.start)
+        _store.done(_end)
+        print(f"Rows {_start} - {_end} of {_ds.n_samples} are computed")
     if args.evaluate:
-        _eval_loss, _eval_acc = _dnn.evaluate(_test_ds, verbose = args.progress)
+        _eval_acc = matrixAccuracy(_store.sim, _sample_probl_indices,
+                                   0.5 if _ds.labels01 else 0.0,
+                                   start = _store.start)
         print("\n")
         print("Evaluation accuracy is {:5.2f}%".format(_eval_acc * 100))
-        print("Evaluation loss is {:5.2f}".format(_eval_loss))
-    _prob = _dnn.predict(_test_ds, verbose = args.progress)
-    _prob = _prob[:,0]
-    with open(f"{args.out_dir}/similarity_probabilities.pcl", "wb") as _f:
-        pickle.dump(_prob, _f)
+    if args.map_r:
+        #Partial sums of rows of shards are added up by MergeSimShards.py
+        _ap_sum, _n_valid = map_at_r_sums(
+            ((_i, _store.sim[_i - _store.start : _i - _store.start + args.block])
+             for _i in range(_store.start, _store.end, args.block)),
+            _sample_probl_indices)
+        with open(_fn_map_r, 'w') as _f:
+            json.dump({"rows":    [_store.start, _store.end],
+                       "ap_sum":  _ap_sum,
+                       "n_valid": _n_valid,
+                       "store":   SimMatrixStore.signature(_store.manifest)},
+                      _f)
+        if _n_valid:
+            print(f"Map@R of rows {_store.start} - {_store.end} is " +
+                  f"{_ap_sum / _n_valid}")
     """
     _confusion = SimilConfusAnalysis(_prob, _labels, 
                                      _ds.solution_names,
@@ -102,6 +224,33 @@ if __name__ == '__main__':
     parser.add_argument('--evaluate', action='store_true', 
                         default=False,
                         help="run evaluation")
+    parser.add_argument("--mode", type=str, default="pairs",
+                        choices=["pairs", "embed"],
+                        help="evaluation of DNN: pairs - on every pair " +
+                        "of samples, embed - by tower embeddings and head")
+    parser.add_argument("--block", default=256, type=int,
+                        help="number of rows of similarity matrix " +
+                        "computed and written at once; " +
+                        "also number of columns of blocks in embed mode")
+    parser.add_argument("--dtype", type=str, default="float32",
+                        choices=["float16", "float32"],
+                        help="data type of stored similarities")
+    parser.add_argument("--symmetry", type=str, default="off",
+                        choices=["off", "auto", "on"],
+                        help="evaluation of upper triangle of pairs " +
+                        "mirrored to lower one: off - never, " +
+                        "auto - if DNN is found symmetric, " +
+                        "on - DNN is known to be symmetric")
+    parser.add_argument("--rows", type=str, default=None,
+                        help="range start:end of rows of similarity " +
+                        "matrix to compute; all rows if not defined")
+    parser.add_argument("--shard", type=str, default=None,
+                        help="shard k/n of rows of similarity matrix " +
+                        "to compute, k = 0, ..., n - 1")
+    parser.add_argument('--map_r', action='store_true', 
+                        default=False,
+                        help="compute partial sums of MAP at R " +
+                        "of computed rows")
     parser.add_argument('--progress', default=2, type=int,
                         choices=[0, 1, 2],
                         help="mode of keras training progress bar")
@@ -56,11 +56,16 @@ class SimilConfusAnalysis(ConfusionAnalysis):
             self.similarityToProb(labels, labels01), 
             solutions, problems, extreme)
         self.annotations = annotations
+        #Annotations as (N, 4) array and flags of wrong predictions
+        #used by vectorized computation of confusion statistics
+        self._ann = np.asarray(annotations, dtype = np.int64).reshape(-1, 4)
         self.simil_stat_fn = "similarity_stat.lst"
         self.dissimil_stat_fn = "dissimilarity_stat.lst"
         self.max_n_cases_report = 32
         self._n_cases_report = min(self.max_n_cases_report, self._n_extreme_cases)
         self.tn, self.fp, self.fn, self.tp = self.conf_mat.ravel()
+        self._wrong = np.asarray(self.predictions).reshape(-1) != \
+            np.asarray(self.labels).reshape(-1)
         self.precision_score = \
             metrics.precision_score(self.labels, self.predictions)
         self.recall_score = \
@@ -127,16 +132,14 @@ class SimilConfusAnalysis(ConfusionAnalysis):
         """
         #Matrix of numbers of cases when similarity or dissimilarity 
         #of two solutions is detected correctly
-        self.sim_num_correct = \
-            np.zeros((self._n_problems, self._n_problems), dtype=int)
+        _n = self._n_problems
+        _pairs = self._ann[:, 0] * _n + self._ann[:, 2]
+        self.sim_num_correct = np.bincount(
+            _pairs, weights = (~self._wrong).astype(np.float64),
+            minlength = _n * _n).astype(int).reshape(_n, _n)
         #Matrix of total numbers of similarity/dissimilarity tests 
-        self.sim_num_samples = \
-            np.zeros((self._n_problems, self._n_problems), dtype=int)
-        for _s, _p, _l in zip(self.annotations, self.predictions, 
-                              self.labels):
-            _problem1, _, _problem2, _ = _s
-            self.sim_num_samples[_problem1, _problem2] += 1
-            self.sim_num_correct[_problem1, _problem2] += int(_p == _l)
+        self.sim_num_samples = np.bincount(
+            _pairs, minlength = _n * _n).astype(int).reshape(_n, _n)
 
     def compSimTestAccuracy(self):
         """
@@ -245,16 +248,16 @@ class SimilConfusAnalysis(ConfusionAnalysis):
         Returns: list of lists of indices of samples for which
         it was incorrectly decided that they give dissimilar solutions
         """
-        #Number of mistakes to detect that two solutions 
-        #of same problem are similar
+        #Wrong predictions for solutions of the same problem
+        #are grouped by problem in order of samples
+        _wrong = np.flatnonzero(self._wrong &
+                                (self._ann[:, 0] == self._ann[:, 2]))
+        _groups = self.groupSamples(_wrong, self._ann[_wrong, 0])
+        #Mistakes of a problem listed twice are given to its first entry
         _mistakes = [[] for i in range(len(problems))]
-        for _i in range(self._n_samples):
-            _problem1, _solution1, _problem2, _solution2 = self.annotations[_i]
-            if _problem1 != _problem2: continue
-            if (self.predictions[_i] != self.labels[_i] and 
-                _problem1 in problems):
-                _bad_idx = problems.index(_problem1)
-                _mistakes[_bad_idx].append(_i)
+        for _p in set(problems):
+            _mistakes[problems.index(_p)] = \
+                _groups.get(_p, np.empty(0, dtype = np.int64)).tolist()
         return _mistakes
 
     def reportSimilarityMisclass(self, sim_accuracy, mistakes, f):
@@ -288,24 +291,23 @@ class SimilConfusAnalysis(ConfusionAnalysis):
                           classified samples
         - f            -- to write report to
         """
-        def _getConf(s):
-            """
-            Get confedence of predicting sample s
-            Convert sigmoid output to probability
-            """
-            _p = self.probabilities[s][0]
-            return _p if self.predictions[s] else 1 - _p
+        #Confidence of predictions converted from sigmoid output
+        _mistakes = np.asarray(mistakes, dtype = np.int64)
+        _p = np.asarray(self.probabilities)[_mistakes, 0]
+        _conf_all = np.where(np.asarray(self.predictions)[_mistakes],
+                             _p, 1 - _p)
         _n_errs_report = min(len(mistakes), self.max_n_cases_report)
         _line = ""
         _punct = ", "
-        for _i, _err_sample in enumerate(sorted(mistakes,
-                key =_getConf, reverse = True)[: _n_errs_report]):
+        _order = np.argsort(-_conf_all, kind = "stable")[: _n_errs_report]
+        for _i, _k in enumerate(_order):
+            _err_sample = _mistakes[_k]
             _p1, _solution1, _p2, _solution2 = \
                 self.annotations[_err_sample]
             #Convert sigmoid output to probability
             #_p = self.probabilities[_err_sample][0]
             #_conf = _p if self.predictions[_err_sample] else 1 - _p
-            _conf = "{:6.2f}".format(100.0 * _getConf(_err_sample))
+            _conf = "{:6.2f}".format(100.0 * _conf_all[_k])
             if len(_line) > 80:
                 f.write(_line + "\n")
                 _line = ""
@@ -397,22 +399,24 @@ class SimilConfusAnalysis(ConfusionAnalysis):
         Returns: list of lists of indices of samples for which
         it was incorrectly decided that they represent similar solutions
         """
-        #Number of mistakes to detect that two solutions 
-        #of same problem are similar
-        _test_ids_1 = [(_x[0], _x[1]) for _x in tests]
-        _test_ids_2 = [(_x[1], _x[0]) for _x in tests]
+        #Wrong predictions for solutions of different problems
+        #are grouped by pairs of problems in order of samples
+        _n = self._n_problems
+        _wrong = np.flatnonzero(self._wrong &
+                                (self._ann[:, 0] != self._ann[:, 2]))
+        _groups = self.groupSamples(
+            _wrong, self._ann[_wrong, 0] * _n + self._ann[_wrong, 2])
+        _empty = np.empty(0, dtype = np.int64)
+        #Test of pair of problems gets mistakes for both orders of 
+        #problems, a test listed twice gives them to its first entry
         _mistakes = [[] for i in range(len(tests))]
-        for _i in range(self._n_samples):
-            _problem1, _solution1, _problem2, _solution2 = self.annotations[_i]
-            if _problem1 == _problem2: continue
-            if self.predictions[_i] == self.labels[_i]: continue
-            _t = (_problem1, _problem2)
-            if _t in _test_ids_1:
-                _bad_idx = _test_ids_1.index(_t)
-                _mistakes[_bad_idx].append(_i)
-            if _t in _test_ids_2:
-                _bad_idx = _test_ids_2.index(_t)
-                _mistakes[_bad_idx].append(_i)
+        _first = {}
+        for _i, _t in enumerate(tests):
+            _first.setdefault((_t[0], _t[1]), _i)
+        for (_p1, _p2), _i in _first.items():
+            _mistakes[_i] = np.sort(np.concatenate(
+                [_groups.get(_p1 * _n + _p2, _empty),
+                 _groups.get(_p2 * _n + _p1, _empty)])).tolist()
         return _mistakes
 
     def reportDissimilarityMisclass(self, tests, mistakes, f):
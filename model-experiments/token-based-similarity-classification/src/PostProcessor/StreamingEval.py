@@ -0,0 +1,152 @@
+"""
+Module for single pass evaluation of classification
+and similarity DNNs
+
+Evaluation programs used to evaluate DNN on test dataset and then
+to predict it again for confusion analysis. Streaming evaluator
+predicts test dataset batch by batch once, accumulates loss and
+keeps only compact per-sample results needed by confusion analysis:
+- for classification: predicted class and confidence of prediction
+  instead of probabilities of all classes
+- for similarity: predicted similarity
+Accuracy is computed from these results.
+"""
+import numpy as np
+import tensorflow as tf
+
+from ClassConfusion import ClassConfusAnalysis
+from SimilConfusion import SimilConfusAnalysis
+
+class StreamingEvaluator():
+    """
+    Single pass evaluator of DNN on test dataset
+    """
+    def __init__(self, dnn, n_samples, task = "classification",
+                 labels01 = True):
+        """
+        Initialize evaluator
+        Parameters:
+        - dnn        -- compiled Keras model
+        - n_samples  -- maximum number of samples of test dataset
+        - task       -- either "classification" or "similarity"
+        - labels01   -- label types flag of similarity DNN:
+                        True:   0/1 labels
+                        False:  -1/+1 labels
+        """
+        self.dnn = dnn
+        self.task = task
+        self.labels01 = labels01
+        self.loss_fn = tf.keras.losses.get(dnn.loss) \
+            if dnn.loss is not None else None
+        self.n_done = 0
+        self.loss_sum = 0.0
+        if task == "classification":
+            self.predictions = np.empty(n_samples, dtype = np.int32)
+            self.confidence = np.empty(n_samples, dtype = np.float32)
+        else:
+            self.probabilities = np.empty((n_samples, 1), dtype = np.float32)
+
+    def update(self, probabilities, labels):
+        """
+        Accumulate results of batch
+        Parameters:
+        - probabilities  -- numpy array of DNN outputs of batch
+        - labels         -- numpy array of labels of batch
+        """
+        _n = probabilities.shape[0]
+        _end = self.n_done + _n
+        if self.loss_fn is not None:
+            self.loss_sum += _n * float(tf.reduce_mean(
+                self.loss_fn(labels, probabilities)))
+        if self.task == "classification":
+            self.predictions[self.n_done : _end] = \
+                np.argmax(probabilities, axis = 1)
+            self.confidence[self.n_done : _end] = \
+                np.max(probabilities, axis = 1)
+        else:
+            self.probabilities[self.n_done : _end] = \
+                probabilities.reshape(_n, -1)[:, : 1]
+        self.n_done = _end
+
+    def run(self, ds, progress = 1):
+        """
+        Predict test dataset batch by batch
+        Parameters:
+        - ds        -- TF dataset of batches <inputs, labels>,
+                       or function making it from input context
+                       Batches are distributed among replicas
+                       of distribution strategy of DNN
+        - progress  -- mode of keras progress bar
+        """
+        if callable(ds):
+            #Single input pipeline reads the whole dataset
+            ds = ds(tf.distribute.InputContext())
+        _bar = tf.keras.utils.Progbar(None, verbose = progress)
+        _step = 0
+        for _step, _batch in enumerate(ds, 1):
+            _x, _y = _batch[0], _batch[1]
+            _prob = np.asarray(self.dnn.predict_on_batch(_x))
+            self.update(_prob, np.asarray(_y))
+            _bar.update(_step)
+        _bar.update(_step, finalize = True)
+
+    def loss(self):
+        """
+        Get mean loss of evaluated samples
+        Returns: mean loss or None if DNN has no loss
+        """
+        if self.loss_fn is None or not self.n_done:
+            return None
+        return self.loss_sum / self.n_done
+
+    def accuracy(self, labels):
+        """
+        Compute accuracy of evaluated samples
+        Parameters:
+        - labels  -- labels of all samples of test dataset
+        Returns: accuracy
+        """
+        _labels = np.asarray(labels).reshape(-1)[: self.n_done]
+        if self.task == "classification":
+            _predictions = self.predictions[: self.n_done]
+        else:
+            _predictions = SimilConfusAnalysis.similarityToProb(
+                self.probabilities[: self.n_done, 0],
+                self.labels01).round()
+            _labels = SimilConfusAnalysis.similarityToProb(
+                _labels, self.labels01)
+        return float(np.mean(_predictions == _labels))
+
+    def classConfusion(self, labels, sample_names, label_names, **kwargs):
+        """
+        Make confusion analysis of classification
+        Parameters:
+        - labels        -- labels of all samples of test dataset
+        - sample_names  -- names of samples
+        - label_names   -- names of classes
+        - kwargs        -- other arguments of ClassConfusAnalysis
+        Returns: ClassConfusAnalysis object
+        """
+        return ClassConfusAnalysis(
+            None, np.asarray(labels)[: self.n_done],
+            sample_names[: self.n_done], label_names,
+            predictions = self.predictions[: self.n_done],
+            confidence = self.confidence[: self.n_done], **kwargs)
+
+    def similConfusion(self, labels, solutions, problems, annotations,
+                       **kwargs):
+        """
+        Make confusion analysis of similarity
+        Parameters:
+        - labels       -- labels of all samples of test dataset
+        - solutions    -- names of solutions of problems
+        - problems     -- names of problems
+        - annotations  -- annotations of samples
+        - kwargs       -- other arguments of SimilConfusAnalysis
+        Returns: SimilConfusAnalysis object
+        """
+        return SimilConfusAnalysis(
+            self.probabilities[: self.n_done],
+            np.asarray(labels)[: self.n_done], solutions, problems,
+            annotations[: self.n_done], labels01 = self.labels01, **kwargs)
+#---------------- End of class StreamingEvaluator -------------------------
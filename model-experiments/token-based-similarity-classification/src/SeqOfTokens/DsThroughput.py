@@ -0,0 +1,142 @@
+"""
+Program for measuring throughput of TF datasets of sequences of tokens
+used by programs SeqClassParallel.py and SimSeqTokParallel.py
+
+The program constructs training dataset with the same parameters
+as the training programs and iterates it without DNN.
+It reports sustained number of samples per second,
+i.e. the rate excluding the first batches warming up the pipeline
+
+Program arguments are defined below in definition of
+argparse Argmuments Parser object
+"""
+import sys
+import os
+import argparse
+import time
+import tensorflow as tf
+
+main_dir = os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+sys.path.extend([f"{main_dir}/Dataset",
+                 f"{main_dir}/CommonFunctions"])
+
+from ProgramArguments  import *
+from Utilities         import *
+from DsUtilities       import DataRand, distributeDataset
+from DataLoader        import SeqOfTokensLoader
+from SeqTokDataset     import SeqTokDataset
+from SeqTok2WaySimDsTF import SeqTok2WaySimDsTF
+
+def makeTrainDs(args):
+    """
+    Make training TF dataset as it is done by the training programs
+    Parameters:
+    - args  -- parsed main program arguments
+    Returns: training TF dataset, 
+             or function making it in "WORKER" shard mode
+    """
+    if args.task == "classification":
+        _ds = SeqTokDataset(args.dataset,
+                            min_n_solutions = max(args.min_solutions, 3),
+                            max_n_problems = args.problems,
+                            short_code_th = args.short_code,
+                            long_code_th = args.long_code,
+                            test_part = args.testpart,
+                            balanced_split = args.balanced_split)
+        _val_ds, _train_ds = _ds.trainValidDs(args.valpart, args.batch,
+                                                 buckets = args.buckets,
+                                                 shard = args.shard)
+    else:
+        _ds = SeqTok2WaySimDsTF(args.dataset,
+                                min_n_solutions = args.min_solutions,
+                                max_n_problems = args.problems,
+                                short_code_th = args.short_code,
+                                long_code_th = args.long_code,
+                                test = args.testpart,
+                                batch = args.batch,
+                                buckets = args.buckets,
+                                shard = args.shard)
+        _val_ds, _train_ds = \
+            _ds.trainValidDsDifferentProblems(
+                args.valpart, args.valsize, args.trainsize,
+                args.similpart)
+    return _train_ds[0]
+
+def measureThroughput(ds, batch_size, n_batches, warmup):
+    """
+    Iterate dataset and measure its throughput
+    Parameters:
+    - ds          -- TF dataset to iterate, 
+                     or function making it from input context
+    - batch_size  -- batch size of the dataset
+    - n_batches   -- number of batches to measure
+    - warmup      -- number of first batches excluded from measurement
+    Returns:
+    - number of samples per second
+    - number of tokens (including padding) per second
+    """
+    _n_batches = 0
+    _n_tokens = 0
+    _start = None
+    _ds = distributeDataset(tf.distribute.get_strategy(), ds,
+                            lambda _ds: _ds.repeat().take(warmup + n_batches))
+    for _batch in _ds:
+        if _n_batches == warmup:
+            _start = time.perf_counter()
+        if _n_batches >= warmup:
+            _inputs = _batch[0]
+            for _x in (_inputs if isinstance(_inputs, tuple)
+                       else (_inputs,)):
+                _n_tokens += int(tf.size(_x))
+        _n_batches += 1
+    _elapsed = time.perf_counter() - _start
+    return n_batches * batch_size / _elapsed, _n_tokens / _elapsed
+
+def main(args):
+    """
+    Main function of program for measuring dataset throughput
+
+    Parameters:
+    - args  -- Parsed command line arguments
+               as object returned by ArgumentParser
+    """
+    resetSeeds()
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                        n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
+    _start = time.perf_counter()
+    _train_ds = makeTrainDs(args)
+    print("Dataset is constructed in " +
+          f"{time.perf_counter() - _start:.1f} sec")
+    _samples_rate, _tokens_rate = \
+        measureThroughput(_train_ds, args.batch,
+                          args.n_batches, args.warmup)
+    print(f"Sustained throughput: {_samples_rate:.1f} samples/sec, " +
+          f"{_tokens_rate:.1f} tokens/sec")
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nTHROUGHPUT OF SEQUENCE OF TOKENS DATASETS")
+
+    #The task defines the rest of arguments
+    _task_parser = argparse.ArgumentParser(add_help = False)
+    _task_parser.add_argument("--task", type=str,
+                              default="classification",
+                              choices=["classification", "similarity"])
+    _task, _ = _task_parser.parse_known_args()
+    parser = makeArgParserCodeML(
+        "Throughput of sequence of tokens datasets",
+        task = _task.task)
+    parser.add_argument("--task", type=str, default="classification",
+                        choices=["classification", "similarity"],
+                        help="dataset of which training program to measure")
+    parser.add_argument("--n_batches", default=200, type=int,
+                        help="number of batches to measure")
+    parser.add_argument("--warmup", default=10, type=int,
+                        help="number of first batches not measured")
+    args = parseArguments(parser)
+
+    main(args)
@@ -31,6 +31,7 @@ from FuncModelMaker    import *
 from ProgramArguments import *
 from Utilities import *
 from DsUtilities import DataRand
+from DataLoader  import SeqOfTokensLoader
 
 def makeDNN(n_tokens, args):
     """
@@ -85,7 +86,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     early_stop = tf.keras.callbacks.EarlyStopping(monitor='val_loss', 
                                                   patience=100)
     #callbacks = [early_stop]
@@ -129,6 +133,7 @@ def main(args):
             max_seq_length = args.seq_len,
             test = args.testpart,
             batch = args.batch,
+            buckets = args.buckets,
             labels01 = not args.symmetric_labels)
 
     #Create parallelization strategy for multi GPU mode
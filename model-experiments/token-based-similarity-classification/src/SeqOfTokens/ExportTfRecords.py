@@ -0,0 +1,144 @@
+"""
+Program for exporting datasets of sequences of tokens
+into sharded TFRecord files
+
+The program splits the dataset into training, validation and test
+samples with the same parameters as programs SeqClassParallel.py and
+SimSeqTokParallel.py, and writes them into the given directory
+in the order of batches, without making TF datasets.
+The training programs read the exported datasets,
+if their option --records specifies that directory.
+
+Program arguments are defined below in definition of
+argparse Argmuments Parser object
+"""
+import sys
+import os
+import argparse
+
+main_dir = os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+sys.path.extend([f"{main_dir}/Dataset",
+                 f"{main_dir}/CommonFunctions"])
+
+from ProgramArguments  import *
+from Utilities         import *
+from DsUtilities       import DataRand
+from DataLoader        import SeqOfTokensLoader
+from TfRecordDS        import TfRecordDS
+from SeqTokDataset     import SeqTokDataset
+from SeqTok2WaySimDsTF import SeqTok2WaySimDsTF
+
+def exportClassification(args):
+    """
+    Make and export classification datasets
+    Parameters:
+    - args  -- parsed main program arguments
+    """
+    _ds = SeqTokDataset(args.dataset,
+                        min_n_solutions = max(args.min_solutions, 3),
+                        max_n_problems = args.problems,
+                        short_code_th = args.short_code,
+                        long_code_th = args.long_code,
+                        max_seq_length = args.seq_len,
+                        test_part = args.testpart,
+                        balanced_split = args.balanced_split)
+    _ds.trainValidSplits(args.valpart, args.batch)
+    TfRecordDS.writeInfo(_ds, args.out_dir, "classification")
+    TfRecordDS.exportClassif(_ds, _ds.train_ds, "training",
+                             args.out_dir, args.n_shards,
+                             args.batch, args.buckets)
+    TfRecordDS.exportClassif(_ds, _ds.val_ds, "validation",
+                             args.out_dir, args.n_shards,
+                             args.batch, args.buckets)
+    if _ds.test_ds:
+        TfRecordDS.exportClassif(_ds, _ds.test_ds, "test",
+                                 args.out_dir, args.n_shards,
+                                 args.batch, args.buckets)
+
+def exportSimilarity(args):
+    """
+    Make and export similarity datasets
+    Parameters:
+    - args  -- parsed main program arguments
+    """
+    _ds = SeqTok2WaySimDsTF(args.dataset,
+                            min_n_solutions = args.min_solutions,
+                            max_n_problems = args.problems,
+                            short_code_th = args.short_code,
+                            long_code_th = args.long_code,
+                            max_seq_length = args.seq_len,
+                            test = args.testpart,
+                            batch = args.batch,
+                            buckets = args.buckets,
+                            labels01 = not args.symmetric_labels,
+                            tf_datasets = False)
+    _bucketed = bool(args.buckets)
+    _val_ds, _train_ds = \
+        _ds.trainValidDsSameProblems(
+            args.valpart, args.valsize, args.trainsize,
+            args.similpart) \
+        if args.validation == "same" else \
+           _ds.trainValidDsDifferentProblems(
+               args.valpart, args.valsize, args.trainsize,
+               args.similpart)
+    TfRecordDS.writeInfo(_ds, args.out_dir, "similarity")
+    TfRecordDS.exportSimilarity(_ds, _train_ds, "training",
+                                args.out_dir, args.n_shards,
+                                args.batch, _bucketed)
+    TfRecordDS.exportSimilarity(_ds, _val_ds, "validation",
+                                args.out_dir, args.n_shards,
+                                args.batch, _bucketed)
+    if _ds.test_problem_solutions:
+        _test_ds = _ds.testDataset(args.valsize, args.similpart)
+        TfRecordDS.exportSimilarity(_ds, _test_ds, "test",
+                                    args.out_dir, args.n_shards,
+                                    args.batch, _bucketed)
+
+def main(args):
+    """
+    Main function of program for exporting datasets
+
+    Parameters:
+    - args  -- Parsed command line arguments
+               as object returned by ArgumentParser
+    """
+    resetSeeds()
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                        n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
+    if args.task == "classification":
+        exportClassification(args)
+    else:
+        exportSimilarity(args)
+#######################################################################
+# Command line arguments of are described below
+#######################################################################
+if __name__ == '__main__':
+    print("\nEXPORT OF SEQUENCE OF TOKENS DATASETS INTO TFRECORD FILES")
+
+    #The task defines the rest of arguments
+    _task_parser = argparse.ArgumentParser(add_help = False)
+    _task_parser.add_argument("--task", type=str,
+                              default="classification",
+                              choices=["classification", "similarity"])
+    _task, _ = _task_parser.parse_known_args()
+    parser = makeArgParserCodeML(
+        "Export of sequence of tokens datasets into TFRecord files",
+        task = _task.task)
+    parser.add_argument("--task", type=str, default="classification",
+                        choices=["classification", "similarity"],
+                        help="dataset of which training program to export")
+    parser.add_argument("--out_dir", type=str, required=True,
+                        help="directory to write TFRecord files to")
+    parser.add_argument('--seq_len', default=None, type=int,
+                        help='maximum lengths of token sequence')
+    parser.add_argument("--n_shards", default=8, type=int,
+                        help="number of TFRecord files of each dataset")
+    parser.add_argument('--symmetric_labels', action='store_true',
+                        default=False,
+                        help="use symmetric labels: -1 and +1")
+    args = parseArguments(parser)
+
+    main(args)
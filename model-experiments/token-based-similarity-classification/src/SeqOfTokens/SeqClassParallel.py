@@ -32,7 +32,9 @@ sys.path.extend([f"{main_dir}/Dataset",
 
 from ProgramArguments  import *
 from Utilities         import *
-from DsUtilities       import DataRand
+from DsUtilities       import DataRand, distributeDataset
+from DataLoader        import SeqOfTokensLoader
+from TfRecordDS        import TfRecordDS
 from SeqTokDataset     import SeqTokDataset
 from SeqModelMaker     import SeqModelFactory
 from ExperimentalModel import ExperimentModelFactory
@@ -86,7 +88,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     UniqueSeed.setSeed(args.seed_model)
 
     early_stop = tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', 
@@ -99,16 +104,23 @@ def main(args):
     else:
         latest_checkpoint = None
 
-    _ds = SeqTokDataset(args.dataset,
-                        min_n_solutions = max(args.min_solutions, 3),
-                        max_n_problems = args.problems,
-                        short_code_th = args.short_code,
-                        long_code_th = args.long_code,
-                        max_seq_length = args.seq_len,
-                        test_part = args.testpart,
-                        balanced_split = args.balanced_split)
-
-    print(f"Classification of source code among {_ds.n_labels} classes")
+    if args.records:
+        _info = TfRecordDS.readInfo(args.records)
+        _n_token_types = _info["n_token_types"]
+        _n_labels = len(_info["problems"])
+    else:
+        _ds = SeqTokDataset(args.dataset,
+                            min_n_solutions = max(args.min_solutions, 3),
+                            max_n_problems = args.problems,
+                            short_code_th = args.short_code,
+                            long_code_th = args.long_code,
+                            max_seq_length = args.seq_len,
+                            test_part = args.testpart,
+                            balanced_split = args.balanced_split)
+        _n_token_types = _ds.n_token_types
+        _n_labels = _ds.n_labels
+
+    print(f"Classification of source code among {_n_labels} classes")
     print("Technique of convolutional neural network on sequence of tokens\n")
     #Create parallelization strategy for multi GPU mode
     #It also can be either MirroredStrategy or MultiWorkerMirroredStrategy
@@ -125,15 +137,28 @@ def main(args):
             _dnn = tf.keras.models.load_model(latest_checkpoint)
         else:
             print("Constructing DNN")
-            _dnn = makeDNN(_ds.n_token_types, _ds.n_labels, args)
-    _val_ds, _train_ds = _ds.trainValidDs(args.valpart, args.batch)
-
-    _tds = _train_ds[0]
-    _tds = _tds.shuffle(50, reshuffle_each_iteration=True,
-                        seed = UniqueSeed.getSeed()).prefetch(2)
+            _dnn = makeDNN(_n_token_types, _n_labels, args)
+    if args.records:
+        _val_ds = (TfRecordDS.readDataset(args.records, "validation",
+                                          args.batch, shard = args.shard),)
+        _train_ds = (TfRecordDS.readDataset(args.records, "training",
+                                            args.batch, training = True,
+                                            shard = args.shard),)
+    else:
+        _val_ds, _train_ds = _ds.trainValidDs(args.valpart, args.batch,
+                                              buckets = args.buckets,
+                                              shard = args.shard)
+
+    _shuffle_seed = UniqueSeed.getSeed()
+    _tds = distributeDataset(
+        strategy, _train_ds[0],
+        lambda _ds: _ds.shuffle(50, reshuffle_each_iteration=True,
+                                seed = _shuffle_seed).prefetch(2))
+    _vds = distributeDataset(strategy, _val_ds[0],
+                             lambda _ds: _ds.prefetch(2))
 
     history = _dnn.fit(_tds,
-                       validation_data = _val_ds[0].prefetch(2),
+                       validation_data = _vds,
                        epochs = args.epochs, verbose = args.progress,
                        callbacks = callbacks)
 #######################################################################
@@ -38,6 +38,7 @@ from ProgramArguments import (makeArgParserCodeML, parseArguments,
                               checkConvolution)
 from SeqTokDataset    import SeqTokDataset
 from DsUtilities      import DataRand
+from DataLoader       import SeqOfTokensLoader
 from SeqModelMaker    import SeqModelFactory
 from ClassConfusion   import ClassConfusAnalysis
 
@@ -86,7 +87,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     
     _ds = SeqTokDataset(args.dataset,
                         min_n_solutions = max(args.min_solutions, 3),
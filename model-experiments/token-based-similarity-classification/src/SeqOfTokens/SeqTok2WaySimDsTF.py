@@ -9,9 +9,13 @@ Each sample is a pair of problem solutions.
 import sys
 import os
 import math
+from itertools import chain
+
+import numpy as np
 
 from TokensSimilDS import SimilarityDSMaker
 from DoubleSeqTfDS import DoubleSeqTfDataset
+from DsUtilities   import DataRand, bucketOrder, reportPadding
 
 class SeqTok2WaySimDsTF(SimilarityDSMaker):
     """
@@ -25,7 +29,8 @@ class SeqTok2WaySimDsTF(SimilarityDSMaker):
                  problem_list = None, max_n_problems = None,
                  short_code_th = 4, long_code_th = None,
                  max_seq_length = None, test = 0,
-                 labels01 = True, batch = 512):
+                 labels01 = True, batch = 512, buckets = None,
+                 shard = "OFF", tf_datasets = True):
         """
         Initialize object SeqTok2WaySimDS
         
@@ -55,6 +60,19 @@ class SeqTok2WaySimDsTF(SimilarityDSMaker):
                              True:   0/1 labels
                              Flase:  -1/+1 labels
         - batch           -- batch size for TF dataset
+        - buckets         -- boundaries of sequence length buckets
+                             If they are defined, batches are made of 
+                             samples with similar lengths of the longest
+                             of their two solutions
+        - shard           -- option to shard TF datasets:
+                             * "OFF"    -- AutoShardPolicy.OFF
+                             * "DATA"   -- AutoShardPolicy.DATA
+                             * "WORKER" -- each worker makes its part 
+                                           of batches
+        - tf_datasets     -- flag of making TF datasets
+                             If it is False, only samples and labels
+                             are made in the order of batches, e.g.
+                             for exporting them into TFRecord files
         """
         super(SeqTok2WaySimDsTF, self).__init__(
             dir_name, min_n_solutions = min_n_solutions,
@@ -65,6 +83,15 @@ class SeqTok2WaySimDsTF(SimilarityDSMaker):
             self.code_max_length if max_seq_length is None \
             else max_seq_length
         self.batch_size = batch
+        self.buckets = buckets
+        self.shard = shard
+        self.tf_datasets = tf_datasets
+        #List of all solutions, it is made on demand
+        self._solutions = None
+        self._probl_offsets = None
+        self._sol_lengths = None
+        #Number of bucketed datasets to make their batch orders different
+        self._n_bucketed = 0
 
     def makeSample(self, tokens):
         """
@@ -78,10 +105,44 @@ class SeqTok2WaySimDsTF(SimilarityDSMaker):
         """
         return list(map(lambda _tok: _tok + 1, tokens))
 
+    def solutionIndex(self):
+        """
+        Index all loaded problem solutions in the order of problems
+        It is made once and reused for all datasets 
+        Returns:
+        - numpy array of indices of first solution of each problem 
+        Computes: numpy array of lengths of all solutions
+        """
+        if self._probl_offsets is None:
+            self._probl_offsets = np.zeros(len(self.problems_solutions),
+                                           dtype = np.int64)
+            np.cumsum(list(map(len, self.problems_solutions[: -1])),
+                      out = self._probl_offsets[1 :])
+            self._sol_lengths = np.fromiter(
+                map(len, chain.from_iterable(self.problems_solutions)),
+                dtype = np.int64,
+                count = sum(map(len, self.problems_solutions)))
+        return self._probl_offsets
+
+    def allSolutions(self):
+        """
+        Make list of all loaded problem solutions in the order of 
+        problems, indexed by function solutionIndex
+        It is made once and reused for all datasets 
+        Returns:
+        - list of sequences of tokens of all solutions
+        """
+        if self._solutions is None:
+            self._solutions = \
+                list(chain.from_iterable(self.problems_solutions))
+        return self._solutions
+
     def makeSimDataset(self, samples, labels):
         """
         Make similarity dataset in the form of 
-        TensorFlow  Datasets of from_generator type
+        TensorFlow Dataset gathering batches from 
+        ragged tensor of solutions of its samples, or of samples
+        of input pipeline in "WORKER" shard mode
         Parameters:
         - samples             -- list of dataset samples
                                  Each sample is represented as 4-tuple
@@ -89,15 +150,37 @@ class SeqTok2WaySimDsTF(SimilarityDSMaker):
                                  where problems and solutions are their indices
         - labels              -- labels as numpy array
                                  If labels is None, the dataset is test dataset
+        If length buckets are defined, samples and labels are 
+        reordered in place in the order of the dataset batches
         Returns:
-        - Tensorflow dataset combined from 
-          * two tensorflow datasets representing each sequence of tokens; and
-          * tensorflow dataset rezenting labels 
+        - Tensorflow dataset of batches of
+          * pairs of padded sequences of tokens; and
+          * labels 
+          or function making it in "WORKER" shard mode
+          or None if TF datasets are not made
         """
-        _seq1 = [self.problems_solutions[_s[0]][_s[1]] for _s in samples]
-        _seq2 = [self.problems_solutions[_s[2]][_s[3]] for _s in samples]
-        _ds =  DoubleSeqTfDataset.makeDoubleSeqDataset(
-            _seq1, _seq2, labels, self.batch_size)
+        _offsets = self.solutionIndex()
+        _annot = np.asarray(samples, dtype = np.int64).reshape(-1, 4)
+        _idx1 = _offsets[_annot[:, 0]] + _annot[:, 1]
+        _idx2 = _offsets[_annot[:, 2]] + _annot[:, 3]
+        if self.buckets:
+            _lengths1 = self._sol_lengths[_idx1]
+            _lengths2 = self._sol_lengths[_idx2]
+            _order = bucketOrder(
+                np.maximum(_lengths1, _lengths2), self.batch_size,
+                self.buckets,
+                DataRand.generator("BUCKET_SHUFFLE_SEED", self._n_bucketed))
+            self._n_bucketed += 1
+            reportPadding(_order, self.batch_size, _lengths1, _lengths2)
+            _idx1 = _idx1[_order]
+            _idx2 = _idx2[_order]
+            samples[:] = [samples[_i] for _i in _order]
+            if labels is not None:
+                labels[:] = labels[_order]
+        if not self.tf_datasets:
+            return None
+        _ds =  DoubleSeqTfDataset.makeIndexedDataset(
+            self.allSolutions(), _idx1, _idx2, labels, self.batch_size,
+            shard = self.shard)
         return _ds
 #---------------- End of class SeqTok2WaySimDsTF -------------------------
-
@@ -28,7 +28,9 @@ from ExpSiamModel      import ExpSiameseModelFactory
 from FuncModelMaker    import *
 from ProgramArguments  import *
 from Utilities         import *
-from DsUtilities       import DataRand
+from DsUtilities       import DataRand, distributeDataset
+from DataLoader        import SeqOfTokensLoader
+from TfRecordDS        import TfRecordDS
 from ModelUtils        import UniqueSeed
 
 def makeDNN(n_tokens, args):
@@ -83,7 +85,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     UniqueSeed.setSeed(args.seed_model)
 
     early_stop = tf.keras.callbacks.EarlyStopping(monitor='val_loss', 
@@ -120,15 +125,21 @@ def main(args):
     else:
         latest_checkpoint = None
 
-    _ds = SeqTok2WaySimDsTF(args.dataset,
-            min_n_solutions = args.min_solutions,
-            max_n_problems = args.problems,
-            short_code_th = args.short_code,
-            long_code_th = args.long_code,
-            max_seq_length = args.seq_len,
-            test = args.testpart,
-            batch = args.batch,
-            labels01 = not args.symmetric_labels)
+    if args.records:
+        _n_token_types = TfRecordDS.readInfo(args.records)["n_token_types"]
+    else:
+        _ds = SeqTok2WaySimDsTF(args.dataset,
+                min_n_solutions = args.min_solutions,
+                max_n_problems = args.problems,
+                short_code_th = args.short_code,
+                long_code_th = args.long_code,
+                max_seq_length = args.seq_len,
+                test = args.testpart,
+                batch = args.batch,
+                buckets = args.buckets,
+                shard = args.shard,
+                labels01 = not args.symmetric_labels)
+        _n_token_types = _ds.n_token_types
 
     #Create parallelization strategy for multi GPU mode
     #It also can be either MirroredStrategy or MultiWorkerMirroredStrategy
@@ -145,30 +156,56 @@ def main(args):
             _dnn = tf.keras.models.load_model(latest_checkpoint)
         else:
             print("Constructing DNN")
-            _dnn = makeDNN(_ds.n_token_types, args)
-
-    _val_ds, _train_ds = \
-        _ds.trainValidDsSameProblems(
-            args.valpart, args.valsize, args.trainsize,
-            args.similpart) \
-        if args.validation == "same" else \
-           _ds.trainValidDsDifferentProblems(
-               args.valpart, args.valsize, args.trainsize,
-               args.similpart)
-
-    if args.sim_weight:
+            _dnn = makeDNN(_n_token_types, args)
+
+    if args.records:
+        _val_ds = (TfRecordDS.readDataset(args.records, "validation",
+                                          args.batch, shard = args.shard),)
+        _train_ds = (TfRecordDS.readDataset(args.records, "training",
+                                            args.batch, training = True,
+                                            shard = args.shard),)
+    else:
+        _val_ds, _train_ds = \
+            _ds.trainValidDsSameProblems(
+                args.valpart, args.valsize, args.trainsize,
+                args.similpart) \
+            if args.validation == "same" else \
+               _ds.trainValidDsDifferentProblems(
+                   args.valpart, args.valsize, args.trainsize,
+                   args.similpart)
+
+    _vds = distributeDataset(strategy, _val_ds[0])
+    if args.sim_weight and args.shard == "WORKER":
+        #Class weights cannot be applied to distributed datasets,
+        #so they are replaced with the same sample weights
+        _w_sim = args.sim_weight / (1.0 + args.sim_weight)
+        _w_dissim = 1 - _w_sim
+        _tds = distributeDataset(
+            strategy, _train_ds[0],
+            lambda _ds: _ds.map(lambda _x, _y: 
+                                (_x, _y, tf.where(tf.equal(_y, 1),
+                                                  _w_sim, _w_dissim))))
+        history = _dnn.fit(_tds,
+                           validation_data = _vds,
+                           epochs = args.epochs,
+                           steps_per_epoch = args.steps_per_epoch,
+                           verbose = args.progress,
+                           callbacks = callbacks)    
+    elif args.sim_weight:
         _w_sim = args.sim_weight / (1.0 + args.sim_weight)
         _w_dissim = 1 - _w_sim
         history = _dnn.fit(_train_ds[0],
-                           validation_data = _val_ds[0],
+                           validation_data = _vds,
                            class_weight = {0: _w_dissim, 1: _w_sim},
                            epochs = args.epochs,
                            steps_per_epoch = args.steps_per_epoch,
                            verbose = args.progress,
                            callbacks = callbacks)    
     else:
-        history = _dnn.fit(_train_ds[0].repeat(),
-                           validation_data = _val_ds[0],
+        _tds = distributeDataset(strategy, _train_ds[0],
+                                 lambda _ds: _ds.repeat())
+        history = _dnn.fit(_tds,
+                           validation_data = _vds,
                            epochs = args.epochs,
                            steps_per_epoch = args.steps_per_epoch,
                            verbose = args.progress,
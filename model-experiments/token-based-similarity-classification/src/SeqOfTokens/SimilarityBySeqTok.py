@@ -24,6 +24,7 @@ sys.path.extend([f"{main_dir}/Dataset",
 
 from Utilities        import resetSeeds
 from DsUtilities      import DataRand
+from DataLoader       import SeqOfTokensLoader
 from ProgramArguments import *
 from SimilConfusion   import SimilConfusAnalysis
 
@@ -72,7 +73,10 @@ def main(args):
                as object returned by ArgumentParser
     """
     resetSeeds()
-    DataRand.setDsSeeds(args.seed_ds)
+    DataRand.setDsSeeds(args.seed_ds, mode = args.seed_mode,
+                         n_jobs = args.ds_jobs)
+    SeqOfTokensLoader.setDuplicates(args.duplicates, args.dup_mode)
+    SeqOfTokensLoader.setManifestCheck(args.manifest)
     
     _convolutions = list(zip(args.filters, args.kernels, args.strides) 
                          if args.strides
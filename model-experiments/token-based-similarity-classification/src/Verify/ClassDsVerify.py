@@ -6,6 +6,7 @@ import os
 from os import path
 import argparse
 import csv
+from DirIndex import indexDataset
 
 def readDataset(cvs_file):
     """
@@ -21,19 +22,17 @@ def readDataset(cvs_file):
     if not os.path.exists(cvs_file):
         sys.exit(f"File {cvs_file} with datset is not found")
     _problem_dict = {}
-    _n_samples = 0
     with open(cvs_file, newline='') as _:
         _reader = csv.reader(_)
         next(_reader)
-        for _p, _s in _reader:
-            _n_samples += 1
-            try:
-                if _s in _problem_dict[_p]:
-                    print(f"Error: multiple occrrences of solution {_s} of problem {_p} occurred file {cvs_file}")
-                    _n_errors +=1
-                _problem_dict[_p].add(_s)
-            except KeyError:
-                _problem_dict[_p] = {_s}
+        _rows = list(_reader)
+    _n_samples = len(_rows)
+    for _p, _s in _rows:
+        _sols = _problem_dict.setdefault(_p, set())
+        if _s in _sols:
+            print(f"Error: multiple occrrences of solution {_s} of problem {_p} occurred file {cvs_file}")
+            _n_errors +=1
+        _sols.add(_s)
     return _problem_dict, _n_samples, _n_errors
 
 def compareDatasets(test, train):
@@ -69,51 +68,53 @@ def compareDatasets(test, train):
             _n_errors +=1
     return _min_test, _max_test, _n_errors
 
-def checkDsVsDir(ds, ds_dir):
+def checkDsVsDir(ds, ds_dir, index):
     """
     Check loaded dataset with respect to source datset directory
     Parameters:
     - ds      -- dictionary defining dataset to be checked
     - ds_dir  -- directory with source dataset
+    - index   -- index of source dataset directory made by indexDataset
     Returns:
     - number of errors found
     """
     _n_errors = 0
     for _p, _sols in ds.items():
-        if not os.path.exists(f"{ds_dir}/{_p}"):
+        if _p not in index:
             print(f"Problem {_p} is not in dataset directory {ds_dir}")
             _n_errors +=1
+            _files = index.get(_p, frozenset())
             for _s in _sols:
-                if not os.path.exists(f"{ds_dir}/{_p}/{_s}"):
+                if _s not in _files:
                     print(f"Solution {_s} is not in problem directory {ds_dir}/{_p}")
                     _n_errors +=1
     return _n_errors
 
-def checkDirVsDatasets(source, test, train):
+def checkDirVsDatasets(source, test, train, index):
     """
     Check source dataset directory with respect to loaded test and training datasets
     Parameters:
     - source  -- directory with source dataset
     - test    -- dictionary defining test dataset to be checked
     - train   -- dictionary defining training dataset to be checked
+    - index   -- index of source dataset directory made by indexDataset
     Returns:
     - number of problems in source dataset directory
     - total number of solutions (samples) in source dataset directory
     - number of errors found
     """
-    _problems = os.listdir(source)
+    _problems = index
     _n_solutions = 0
     _n_errors = 0
     if not _problems:
         sys.exit(f"Directory {source} of source code dataset is empty")
-    for _p in _problems:
+    for _p, _solutions in _problems.items():
         if _p not in test:
             print(f"Error: problem {_p} is not in test dataset")
             _n_errors +=1
         if _p not in train:
             print(f"Error: problem {_p} is not in train dataset")
             _n_errors +=1
-        _solutions = os.listdir(f"{source}/{_p}")
         _n_solutions += len(_solutions)
         if not _solutions:
             sys.exit(f"Directory {source}/{_p} of source code dataset is empty")
@@ -136,17 +137,18 @@ def main(args):
     if not os.path.exists(args.ds):
         sys.exit(f"Directory {args.ds} of source code dataset is not found")
     n_total_errors = 0
+    index = indexDataset(args.ds, n_jobs = args.jobs)
     test_ds, test_size, n_errors = readDataset(args.test)
     n_total_errors += n_errors
     train_ds, train_size, n_errors = readDataset(args.train)
     n_total_errors += n_errors
     min_test, max_test, n_errors = compareDatasets(test_ds, train_ds)
-    n_errors = checkDsVsDir(test_ds, args.ds)
+    n_errors = checkDsVsDir(test_ds, args.ds, index)
     n_total_errors += n_errors
-    n_errors = checkDsVsDir(train_ds, args.ds)
+    n_errors = checkDsVsDir(train_ds, args.ds, index)
     n_total_errors += n_errors
     n_source_problems, n_source_solutions, n_errors = \
-            checkDirVsDatasets(args.ds, test_ds, train_ds)
+            checkDirVsDatasets(args.ds, test_ds, train_ds, index)
     n_total_errors += n_errors
     print(f"Source dataset directory has {n_source_problems} problems with {n_source_solutions} total solutions")
     print(f"Test dataset has {test_size} samples, which are solutions of {len(test_ds)} problems")
@@ -172,6 +174,8 @@ if __name__ == '__main__':
                         help="file with test dataset")
     parser.add_argument("train", type=str, 
                         help="file with training and validation datset")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="number of threads listing source directories")
 
     args = parser.parse_args()
 
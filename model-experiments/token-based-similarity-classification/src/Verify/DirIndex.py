@@ -0,0 +1,38 @@
+"""
+Module for indexing directory of source code dataset
+
+Source code dataset directory has subdirectory for each problem
+with files of its solutions. The index is built once with
+os.scandir and directories of problems are listed in parallel
+by a pool of threads, so verification programs check files
+by set operations instead of calling os.path.exists for each file
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+def listDirectory(dir_name):
+    """
+    List names of entries of directory
+    Parameters:
+    - dir_name  -- directory to list
+    Returns: frozenset of names of entries
+    """
+    with os.scandir(dir_name) as _entries:
+        return frozenset(_e.name for _e in _entries)
+
+def indexDataset(source, n_jobs = 8):
+    """
+    Make index of source code dataset directory
+    Parameters:
+    - source  -- directory with source dataset
+    - n_jobs  -- number of threads listing directories of problems
+    Returns: dictionary of problems in the order of directory listing
+             * key   - problem name
+             * value - frozenset of names of files of problem solutions
+    """
+    with os.scandir(source) as _entries:
+        _problems = [_e.name for _e in _entries if _e.is_dir()]
+    with ThreadPoolExecutor(max_workers = n_jobs) as _pool:
+        _solutions = list(_pool.map(
+            listDirectory, [f"{source}/{_p}" for _p in _problems]))
+    return dict(zip(_problems, _solutions))
@@ -0,0 +1,90 @@
+"""
+Program for making and verifying checksummed manifests of datasets
+
+Manifest records size, modification time and content hash
+of every file of dataset directory, e.g. tokenized dataset or
+CodeNet benchmark. After moving dataset to another machine
+it is verified against manifest instead of running full
+verification of the dataset.
+"""
+import sys
+import os
+import argparse
+import time
+
+main_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.extend([f"{main_dir}/Dataset"])
+from Manifest import makeManifest, writeManifest, readManifest, \
+    verifyManifest
+
+def main(args):
+    """
+    Main function of program for making and verifying manifests
+
+    Parameters:
+    - args  -- Parsed command line arguments
+               as object returned by ArgumentParser
+    """
+    if not os.path.isdir(args.ds):
+        sys.exit(f"Directory {args.ds} of dataset is not found")
+    _start = time.perf_counter()
+    if args.action == "make":
+        _manifest = makeManifest(args.ds, n_jobs = args.jobs)
+        writeManifest(args.ds, _manifest, args.manifest)
+        print(f"Manifest of {len(_manifest['files'])} files is written " +
+              f"in {time.perf_counter() - _start:.2f} sec")
+        return
+    _manifest = readManifest(args.ds, args.manifest)
+    if _manifest is None:
+        sys.exit(f"Manifest of dataset {args.ds} is not found")
+    _errors, _warnings, _refreshed = verifyManifest(
+        args.ds, _manifest, full_hash = args.hash, n_jobs = args.jobs)
+    for _w in _warnings:
+        print(f"Warning: {_w}")
+    for _e in _errors:
+        print(f"Error: {_e}")
+    print(f"{len(_manifest['files'])} files are verified " +
+          f"in {time.perf_counter() - _start:.2f} sec")
+    if _refreshed:
+        print(f"{len(_refreshed)} files have correct contents " +
+              "and changed modification time")
+        if args.refresh:
+            _manifest["files"].update(_refreshed)
+            writeManifest(args.ds, _manifest, args.manifest)
+            print("Modification times in manifest are updated")
+    if _errors:
+        sys.exit(f"There were found {len(_errors)} errors in dataset")
+    print("No errors were found in dataset")
+#------------- End of function main -----------------------------
+
+################################################################################
+# Command line arguments are described below
+################################################################################
+if __name__ == '__main__':
+    print("\nMAKING AND VERIFYING CHECKSUMMED MANIFEST OF DATASET")
+    #Command-line arguments
+    parser = argparse.ArgumentParser(
+        description = "Making and verifying checksummed manifest of dataset")
+    parser.add_argument("action", type=str, choices=["make", "verify"],
+                        help="action to perform")
+    parser.add_argument("ds", type=str,
+                        help="Directory with dataset")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="manifest file; manifest.json in " +
+                        "dataset directory by default")
+    parser.add_argument("--hash", action="store_true", default=False,
+                        help="verify hashes of all files instead of " +
+                        "sizes and modification times")
+    parser.add_argument("--refresh", action="store_true", default=False,
+                        help="update modification times in manifest " +
+                        "of files with verified contents")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="number of threads hashing files")
+
+    args = parser.parse_args()
+
+    print("Parameter settings used:")
+    for k,v in sorted(vars(args).items()):
+        print("{}: {}".format(k,v))
+
+    main(args)
@@ -6,6 +6,7 @@ import os
 from os import path
 import argparse
 import csv
+from DirIndex import indexDataset
 
 class DsProblemStat:
     """
@@ -32,6 +33,31 @@ class DsProblemStat:
         self.n_similar_right += 1
         self.n_similar_left += 1
  
+    def update_similar_list(self, s1, s2):
+        """
+        Update statistics for list of similarity samples
+        Parameters:
+        s1, s2 -- lists of solutions used in similarity samples
+        """
+        self.similar_left.update(s1)
+        self.similar_right.update(s2)
+        self.n_similar_right += len(s2)
+        self.n_similar_left += len(s1)
+
+    def update_left_list(self, s):
+        """
+        Update statistics for list of dissimilarity samples
+        """
+        self.left.update(s)
+        self.n_left += len(s)
+
+    def update_right_list(self, s):
+        """
+        Update statistics for list of dissimilarity samples
+        """
+        self.right.update(s)
+        self.n_right += len(s)
+
     def update_left(self, s):
         """
         Update statistics for dissimilarity sample
@@ -230,29 +256,44 @@ def readDsSamples(cvs_file, problems):
     _n_errors = 0
     if not os.path.exists(cvs_file):
         sys.exit(f"File {cvs_file} with datset is not found")
-    _n_samples = 0
-    _n_similar = 0
-    _n_disssimilar = 0
     with open(cvs_file, newline='') as _:
         _reader = csv.reader(_)
         next(_reader)
-        for _p1, _s1, _p2, _s2 in _reader:
-            _n_samples += 1
-            if _p1 not in problems:
-                print(f"Error: problem {_p1} occurred in file {cvs_file} " +
-                      "is not among problems of that dataset")
-                _n_errors +=1
-            if _p2 != _p1 and _p2 not in problems:
-                print(f"Error: problem {_p2} occurred in file {cvs_file} " +
-                      "is not among problems of that dataset")
-                _n_errors +=1
-            if _p1 == _p2:
-                _n_similar += 1
-                problems[_p1].update_similar(_s1, _s2)
-            else:
-                _n_disssimilar += 1
-                problems[_p1].update_left(_s1)
-                problems[_p2].update_right(_s2)             
+        _rows = list(_reader)
+    _n_samples = len(_rows)
+    #Solutions of samples grouped by problems
+    _similar = {}
+    _left = {}
+    _right = {}
+    for _p1, _s1, _p2, _s2 in _rows:
+        if _p1 not in problems:
+            print(f"Error: problem {_p1} occurred in file {cvs_file} " +
+                  "is not among problems of that dataset")
+            _n_errors +=1
+        if _p2 != _p1 and _p2 not in problems:
+            print(f"Error: problem {_p2} occurred in file {cvs_file} " +
+                  "is not among problems of that dataset")
+            _n_errors +=1
+        if _p1 not in problems or _p2 not in problems:
+            #Sample of unknown problem cannot be registered
+            sys.exit(f"Sample {_p1}/{_s1} - {_p2}/{_s2} of file " +
+                     f"{cvs_file} refers to unknown problem " +
+                     f"{_p1 if _p1 not in problems else _p2}")
+        if _p1 == _p2:
+            _similar.setdefault(_p1, ([], []))
+            _similar[_p1][0].append(_s1)
+            _similar[_p1][1].append(_s2)
+        else:
+            _left.setdefault(_p1, []).append(_s1)
+            _right.setdefault(_p2, []).append(_s2)
+    for _p, (_s1, _s2) in _similar.items():
+        problems[_p].update_similar_list(_s1, _s2)
+    for _p, _s in _left.items():
+        problems[_p].update_left_list(_s)
+    for _p, _s in _right.items():
+        problems[_p].update_right_list(_s)
+    _n_similar = sum(len(_s1) for _s1, _ in _similar.values())
+    _n_disssimilar = _n_samples - _n_similar
     return _n_samples, _n_similar, _n_disssimilar, _n_errors
 
 def checkNoCommonProblems(ds1, ds2, fname1, fname2):
@@ -278,7 +319,8 @@ def checkNoCommonProblems(ds1, ds2, fname1, fname2):
         print(_common_problems)
     return _n_errors
 
-def checkDsSolVsDir(problem, solutions, ds_fn, ds_dir, fn_extension):
+def checkDsSolVsDir(problem, solutions, ds_fn, ds_dir, fn_extension,
+                    index):
     """
     Check that all solutiosn of a given problem are in dataset
     Parameters:
@@ -288,17 +330,19 @@ def checkDsSolVsDir(problem, solutions, ds_fn, ds_dir, fn_extension):
                    and solutions are checked 
     - ds_dir    -- directory with source dataset
     - fn_extension -- extensions of source code files of problem solutions
+    - index     -- index of source dataset directory made by indexDataset
     Returns number of errors
     """
     _n_errors = 0
+    _files = index.get(problem, frozenset())
     for _s in solutions:
-        if not os.path.exists(f"{ds_dir}/{problem}/{_s}.{fn_extension}"):
+        if f"{_s}.{fn_extension}" not in _files:
             print(f"Solution {_s}.{fn_extension} occurring in file {ds_fn} " +
                   f"is not in problem directory {ds_dir}/{problem}")
             _n_errors +=1
     return _n_errors
 
-def checkDsVsDir(ds, ds_dir, ds_fn, fn_extension):
+def checkDsVsDir(ds, ds_dir, ds_fn, fn_extension, index):
     """
     Check loaded dataset with respect to source dataset directory
     Parameters:
@@ -309,25 +353,26 @@ def checkDsVsDir(ds, ds_dir, ds_fn, fn_extension):
     - ds_fn     -- file name of dataset whose problem 
                    and solutions are checked
     - fn_extension -- extensions of source code files of problem solutions
+    - index     -- index of source dataset directory made by indexDataset
     Returns:
     - number of errors found
     """
     _n_errors = 0
     for _p, _samples in ds.items():
-        if not os.path.exists(f"{ds_dir}/{_p}"):
+        if _p not in index:
             print(f"Problem {_p} is not in dataset directory {ds_dir}")
             _n_errors +=1
         _n_errors += checkDsSolVsDir(
-            _p, _samples.similar_right, ds_fn, ds_dir, fn_extension)
+            _p, _samples.similar_right, ds_fn, ds_dir, fn_extension, index)
         _n_errors += checkDsSolVsDir(
-            _p, _samples.similar_left, ds_fn, ds_dir, fn_extension)
+            _p, _samples.similar_left, ds_fn, ds_dir, fn_extension, index)
         _n_errors += checkDsSolVsDir(
-            _p, _samples.right, ds_fn, ds_dir, fn_extension)
+            _p, _samples.right, ds_fn, ds_dir, fn_extension, index)
         _n_errors += checkDsSolVsDir(
-            _p, _samples.left, ds_fn, ds_dir, fn_extension)
+            _p, _samples.left, ds_fn, ds_dir, fn_extension, index)
     return _n_errors
 
-def checkDirVsDatasets(source, train, val, test):
+def checkDirVsDatasets(source, train, val, test, index):
     """
     Check that all problems from source dataset directory are in one 
     of datasets
@@ -340,6 +385,7 @@ def checkDirVsDatasets(source, train, val, test):
                  similar to train
     - test    -- dictionary defining test dataset to be checked
                  similar to train
+    - index   -- index of source dataset directory made by indexDataset
     Returns:
     - number of problems in source dataset directory
     - number of solutions in source dataset directory
@@ -349,13 +395,12 @@ def checkDirVsDatasets(source, train, val, test):
     _val_stat   = DsStat()
     _train_stat = DsStat()
     
-    _problems = os.listdir(source)
+    _problems = index
     _n_total_solutions = 0
     _n_errors = 0
     if not _problems:
         sys.exit(f"Directory {source} of source code dataset is empty")
-    for _p in _problems:
-        _solutions = os.listdir(f"{source}/{_p}")
+    for _p, _solutions in _problems.items():
         _n_solutions = len(_solutions)
         if not _solutions:
             print(f"Error: Directory {source}/{_p} of source code dataset is empty")
@@ -389,6 +434,7 @@ def main(args):
     if not os.path.exists(args.ds):
         sys.exit(f"Directory {args.source} of source code dataset is not found")
     n_total_errors = 0
+    index = indexDataset(args.ds, n_jobs = args.jobs)
     train_problems, _n_errors = readDsProblems(args.train_problems)
     n_total_errors += _n_errors
     val_problems, _n_errors = readDsProblems(args.val_problems)
@@ -417,11 +463,11 @@ def main(args):
                                             args.val_problems)
 
     n_total_errors += checkDsVsDir(train_problems, args.ds, 
-                                   args.train_samples, args.sol_ext)
+                                   args.train_samples, args.sol_ext, index)
     n_total_errors += checkDsVsDir(val_problems, args.ds, 
-                                   args.val_samples, args.sol_ext)
+                                   args.val_samples, args.sol_ext, index)
     n_total_errors += checkDsVsDir(test_problems, args.ds, 
-                                   args.test_samples, args.sol_ext)
+                                   args.test_samples, args.sol_ext, index)
 
     print(f"Training dataset has {n_trains} samples: " +
           f"{n_train_similars} similar and {n_train_dissimilars} " +
@@ -434,7 +480,7 @@ def main(args):
           f"dissimilar ones built on {len(test_problems)} problems")
 
     n_source_problems, n_source_solutions, _n_errors = checkDirVsDatasets(
-        args.ds, train_problems, val_problems, test_problems)
+        args.ds, train_problems, val_problems, test_problems, index)
     print(f"Source dataset directory has {n_source_problems} problems " +
           f"with {n_source_solutions} total solutions")
     
@@ -469,6 +515,8 @@ if __name__ == '__main__':
                         help="file with problems of training datset")
     parser.add_argument("--sol_ext", type=str, default="cpp",
                         help="extentions of files with solutions")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="number of threads listing source directories")
 
     args = parser.parse_args()
 
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# Copyright IBM Corporation 2021, 2022
+
+# Finds sets of identical submission files in the dataset and collects
+# the same statistics as post_fdupes.sh, without running fdupes/jdupes.
+# Files are grouped by size, then by hash of their first block, and
+# finally by hash of their whole contents; hashing is done by a pool
+# of threads. Language of a file is taken from its path
+# .../data/problem_id/language/submission and its status from the
+# metadata CSV file of the problem.
+# Optionally writes the duplicate sets in fdupes format (one file per
+# line, sets separated by a blank line), or post-processes an existing
+# fdupes output file instead of scanning the dataset.
+
+import sys
+import os
+import argparse
+import csv
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of bytes hashed in the partial hash pass:
+PARTIAL = 4096
+
+def warn(msg):
+    print('(W) %s' % msg, file=sys.stderr)
+
+def info(msg):
+    if not QUIET:
+        print('(I) %s' % msg, file=sys.stderr)
+
+def list_problem(problem_dir):
+    """Lists (path, size) of all submission files of a problem directory."""
+    files = []
+    with os.scandir(problem_dir) as languages:
+        for language in languages:
+            if not language.is_dir():
+                continue
+            with os.scandir(language.path) as submissions:
+                for s in submissions:
+                    if s.is_file():
+                        files.append((s.path, s.stat().st_size))
+    return files
+
+def file_hash(path, size=None):
+    """Hashes the first size bytes of a file, or all of it when None."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if size is not None:
+            h.update(f.read(size))
+        else:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.digest()
+
+def refine(groups, key, pool):
+    """Splits every group of paths by the key computed in parallel.
+    Returns the new groups with at least 2 files."""
+    paths = [p for g in groups for p in g]
+    keys = pool.map(key, paths)
+    buckets = {}
+    for g_id, g in enumerate(groups):
+        for p in g:
+            buckets.setdefault((g_id, next(keys)), []).append(p)
+    return [g for g in buckets.values() if len(g) > 1]
+
+def find_sets(data, jobs, zero):
+    """Finds sets of identical files under data/problem_id/language/.
+    Returns list of sets as sorted lists of absolute paths."""
+    problems = sorted(os.path.join(data, p) for p in os.listdir(data))
+    by_size = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        n_files = 0
+        for files in pool.map(list_problem, problems):
+            n_files += len(files)
+            for path, size in files:
+                if size or zero:
+                    by_size.setdefault(size, []).append(path)
+        info('Scanned %u files of %u problems' % (n_files, len(problems)))
+        small = [g for s, g in by_size.items() if len(g) > 1 and s <= PARTIAL]
+        large = [g for s, g in by_size.items() if len(g) > 1 and s > PARTIAL]
+        info('%u files have the same size as another file'
+             % sum(len(g) for g in small + large))
+        # Partial hash of a small file is the hash of its contents:
+        sets = refine(small, lambda p: file_hash(p, PARTIAL), pool)
+        large = refine(large, lambda p: file_hash(p, PARTIAL), pool)
+        sets += refine(large, file_hash, pool)
+    sets = [sorted(os.path.abspath(p) for p in s) for s in sets]
+    sets.sort()
+    return sets
+
+def read_sets(fn):
+    """Reads sets of duplicate files from fdupes (or jdupes) output."""
+    sets = []
+    current = []
+    with open(fn) if fn != '-' else sys.stdin as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line:
+                current.append(line)
+            elif current:
+                sets.append(current)
+                current = []
+    if current:
+        sets.append(current)
+    return sets
+
+def split_path(path):
+    """Extracts items from path .../data/problem_id/language/submission.
+    Returns metadata directory, problem_id, language and submission_id."""
+    dirpath, submission = os.path.split(path)
+    dirpath, language = os.path.split(dirpath)
+    dirpath, problem_id = os.path.split(dirpath)
+    dirpath = os.path.dirname(dirpath)
+    return (os.path.join(dirpath, 'metadata'), problem_id, language,
+            os.path.splitext(submission)[0])
+
+def read_statuses(csv_fn):
+    """Maps submission_id to status of a problem metadata CSV file.
+    Returns None when the file does not exist."""
+    if not os.path.isfile(csv_fn):
+        return None
+    with open(csv_fn, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return {row[0]: row[7] for row in reader if len(row) > 7}
+
+def statistics(sets, jobs):
+    """Computes the statistics of post_fdupes.sh of duplicate sets."""
+    items = [[split_path(p) for p in s] for s in sets]
+    csv_fns = sorted({os.path.join(m, '%s.csv' % p)
+                      for s in items for m, p, _, _ in s})
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        metadata = dict(zip(csv_fns, pool.map(read_statuses, csv_fns)))
+    n_sets = n_inconsist = n_accepted = n_accept_dups = n_files = 0
+    for s in items:
+        language = None
+        accept_in_set = 0
+        for meta, problem_id, lang, submission_id in s:
+            n_files += 1
+            csv_fn = os.path.join(meta, '%s.csv' % problem_id)
+            statuses = metadata[csv_fn]
+            if statuses is None:
+                warn('no such metadata file %s' % csv_fn)
+                continue
+            if submission_id not in statuses:
+                warn('missing submission %s in %s.csv metadata'
+                     % (submission_id, problem_id))
+                continue
+            if statuses[submission_id] == 'Accepted':
+                n_accepted += 1
+                accept_in_set += 1
+            # Like post_fdupes.sh counts files of other language than
+            # the first file of the set:
+            if language is None:
+                n_sets += 1
+                language = lang
+            elif lang != language:
+                n_inconsist += 1
+        if accept_in_set >= 2:
+            n_accept_dups += 1
+    return n_sets, n_inconsist, n_accept_dups, n_files, n_accepted
+
+def write_sets(sets, fn):
+    """Writes sets of duplicate files in fdupes format."""
+    with open(fn, 'w') as f:
+        for s in sets:
+            f.write('\n'.join(s))
+            f.write('\n\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Finds sets of identical submissions in the dataset '
+        'and collects duplicate statistics per language and status.')
+    parser.add_argument('-d', '--data', default='/Volume1/AI4CODE/CodeNet_AIZU',
+                        help='path to the dataset directory')
+    parser.add_argument('-i', '--input', default=None,
+                        help='post-process this fdupes output file '
+                        '(- for stdin) instead of scanning the dataset')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the duplicate sets in fdupes format '
+                        'to this file')
+    parser.add_argument('-j', '--jobs', type=int, default=16,
+                        help='number of threads scanning and hashing files')
+    parser.add_argument('-z', '--zero', action='store_true',
+                        help='consider zero-length files to be duplicates')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='suppress informational messages')
+    args = parser.parse_args()
+    QUIET = args.quiet
+
+    if args.input:
+        sets = read_sets(args.input)
+    else:
+        data = os.path.join(args.data, 'data')
+        if not os.path.isdir(data):
+            print('(E) Expect directory %s' % data, file=sys.stderr)
+            sys.exit(1)
+        sets = find_sets(data, args.jobs, args.zero)
+    if args.output:
+        write_sets(sets, args.output)
+        info('Duplicate sets are written to %s' % args.output)
+
+    stats = statistics(sets, args.jobs)
+    print()
+    print('Number of duplicate sets  : %7u' % stats[0])
+    print('Number of mixed lang. sets: %7u' % stats[1])
+    print('Sets with >=2 Accepted    : %7u' % stats[2])
+    print('Number of files in sets   : %7u' % stats[3])
+    print('Number of Accepted files  : %7u' % stats[4])